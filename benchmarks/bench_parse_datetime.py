@@ -0,0 +1,58 @@
+"""
+Micro-benchmark of parsing Paddle datetimes in webhook payloads.
+
+Reports parsed values per second on a single core:
+
+    python benchmarks/bench_parse_datetime.py [--time-zone Europe/Berlin]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from djpaddle.utils import PADDLE_DATE_FORMAT, PADDLE_DATETIME_FORMAT  # NOQA: E402
+
+
+def strptime_parse(value):
+    """
+    The parsing of Paddle datetimes before parse_datetime.
+    """
+    try:
+        value = datetime.strptime(value, PADDLE_DATETIME_FORMAT)
+    except ValueError:
+        value = datetime.strptime(value, PADDLE_DATE_FORMAT)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
+def report(name, function, number):
+    seconds = min(timeit.repeat(function, number=number, repeat=5))
+    print("{0:<28} {1:>10.0f} /s  {2:>8.2f} us".format(name, number / seconds, seconds / number * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--time-zone", default="UTC")
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    settings.configure(USE_TZ=True, TIME_ZONE=args.time_zone)
+
+    from djpaddle.payloads import parse_datetime  # requires configured settings
+
+    print("TIME_ZONE={0}".format(args.time_zone))
+    for name, value in (("datetime", "2020-01-13 19:19:18"), ("date", "2020-01-30")):
+        assert parse_datetime(value) == strptime_parse(value)
+        report("strptime ({0})".format(name), lambda: strptime_parse(value), args.number)
+        report("parse_datetime ({0})".format(name), lambda: parse_datetime(value), args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Micro-benchmark of webhook signature verification.
+
+Reports verifications per second on a single core:
+
+    python benchmarks/bench_webhook_verifier.py [--key-size 4096] [--fields 30]
+"""
+import argparse
+import base64
+import collections
+import os
+import sys
+import timeit
+
+import phpserialize
+from Crypto.PublicKey import RSA
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from djpaddle.utils import PKCS1_v1_5, SHA1, WebhookVerifier  # NOQA: E402
+
+
+def signed_payload(key, fields):
+    payload = {"alert_name": "payment_succeeded", "alert_id": "1234567890"}
+    for index in range(fields - len(payload)):
+        payload["field_{0:02d}".format(index)] = "value {0} with some text".format(index)
+    digest = SHA1.new(WebhookVerifier.serialize(payload))
+    payload["p_signature"] = base64.b64encode(PKCS1_v1_5.new(key).sign(digest)).decode("utf-8")
+    return payload
+
+
+def phpserialize_payload(payload):
+    data = dict(payload)
+    data.pop("p_signature", None)
+    for field in data:
+        data[field] = str(data[field])
+    return phpserialize.dumps(collections.OrderedDict(sorted(data.items())))
+
+
+def report(name, function, number):
+    seconds = min(timeit.repeat(function, number=number, repeat=5))
+    print("{0:<28} {1:>10.0f} /s  {2:>8.1f} us".format(name, number / seconds, seconds / number * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--key-size", type=int, default=4096)
+    parser.add_argument("--fields", type=int, default=30)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    key = RSA.generate(args.key_size)
+    verifier = WebhookVerifier(key.publickey())
+    payload = signed_payload(key, args.fields)
+    invalid = dict(payload, p_signature="invalid-signature")
+    assert verifier.verify(payload)
+
+    print("RSA {0} bits, {1} fields".format(args.key_size, args.fields))
+    report("serialize", lambda: WebhookVerifier.serialize(payload), args.number)
+    report("serialize (phpserialize)", lambda: phpserialize_payload(payload), args.number)
+    report("verify (valid)", lambda: verifier.verify(payload), args.number)
+    report("verify (malformed signature)", lambda: verifier.verify(invalid), args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -30,3 +30,35 @@ class SubscriptionAdmin(admin.ModelAdmin):
         "status",
         "plan",
     )
+
+
+class WebhookReceiverResultInline(admin.TabularInline):
+    model = models.WebhookReceiverResult
+    extra = 0
+
+
+@admin.register(models.WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    inlines = (WebhookReceiverResultInline,)
+    list_display = (
+        "alert_id",
+        "alert_name",
+        "status",
+        "created_at",
+    )
+    list_filter = (
+        "status",
+        "alert_name",
+    )
+
+
+@admin.register(models.WebhookDeadLetter)
+class WebhookDeadLetterAdmin(admin.ModelAdmin):
+    list_display = (
+        "event",
+        "receiver",
+        "attempts",
+        "replayed_at",
+        "created_at",
+    )
+    list_filter = ("receiver",)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class DjpaddleConfig(AppConfig):
@@ -7,3 +8,10 @@ class DjpaddleConfig(AppConfig):
     """
 
     name = "djpaddle"
+
+    def ready(self):
+        from .checks import check_receiver_names
+        from .payloads import compile_mappers
+
+        compile_mappers(self.get_models())
+        checks.register(check_receiver_names)
@@ -0,0 +1,14 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import path
+
+from . import views
+
+if not views.ASYNC_VIEWS_SUPPORTED:  # pragma: no cover
+    raise ImproperlyConfigured("djpaddle.async_urls needs Django 3.1 or later, include djpaddle.urls instead.")
+
+app_name = "djpaddle"
+
+urlpatterns = [
+    path("webhook/", views.async_paddle_webhook_view, name="webhook"),
+    path("post-checkout/", views.async_post_checkout_api_view, name="post_checkout_api"),
+]
@@ -0,0 +1,66 @@
+"""
+Helpers for the async views, running blocking work off the event loop.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.db import close_old_connections
+
+from . import settings
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:  # pragma: no cover
+    # django < 3.0 doesn't install asgiref
+    sync_to_async = None
+
+# django runs async views since 3.1
+ASYNC_VIEWS_SUPPORTED = django.VERSION >= (3, 1)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _db_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.DJPADDLE_ASYNC_DB_THREADS,
+                    thread_name_prefix="djpaddle-db",
+                )
+    return _executor
+
+
+def _call_with_connection(func, *args, **kwargs):
+    # threads of the pool outlive requests, so they have to drop stale
+    # connections themselves like django does at the end of a request
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_db_thread(func, *args, **kwargs):
+    """
+    Run a function querying the database without blocking the event loop.
+    """
+    if not settings.DJPADDLE_ASYNC_DB_THREADS:
+        return await sync_to_async(func)(*args, **kwargs)
+
+    loop = asyncio.get_event_loop()
+    call = functools.partial(_call_with_connection, func, *args, **kwargs)
+    return await loop.run_in_executor(_db_executor(), call)
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """
+    Run a cpu bound function (e.g. verifying a signature) in the default executor.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,220 @@
+"""
+Two level caches for data needed while processing webhooks.
+
+A process local LRU sits in front of a Django cache backend. Every cache
+has a version stored in the Django cache, invalidating a cache bumps that
+version which makes all processes drop their local and shared entries.
+Processes may keep the version for a few seconds, so local hits don't need
+a round trip to the Django cache.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+def _new_version():
+    # a random initial version does not match the version of evicted entries
+    return random.getrandbits(48)
+
+
+class LRUCache:
+    """
+    A thread-safe, size bounded, least recently used mapping.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def discard_if(self, predicate):
+        """
+        Drop the entries whose value matches `predicate`.
+        """
+        with self._lock:
+            for key in [key for key, value in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class VersionedCache:
+    """
+    A process local LRU in front of the Django cache `alias`. Without an
+    alias the cache is process local and can only be invalidated from within
+    the process.
+
+    The shared version is read at most every `version_ttl` seconds, i.e.
+    other processes notice an invalidation within `version_ttl` seconds.
+
+    Entries may be cached with a `tag`, invalidating a tag only drops the
+    entries cached with it. The version of a tag is read along with the
+    version of the cache on every lookup of a tagged entry.
+    """
+
+    def __init__(self, namespace, alias=None, maxsize=128, timeout=None, version_ttl=0):
+        self.namespace = namespace
+        self.alias = alias
+        self.timeout = timeout
+        self.version_ttl = version_ttl
+        self._local = LRUCache(maxsize)
+        self._local_version = 1
+        # (version, expiry) of the shared version last read
+        self._shared_version = None
+
+    @property
+    def shared(self):
+        if self.alias is None:
+            return None
+        return caches[self.alias]
+
+    @property
+    def version_key(self):
+        return "djpaddle:{0}:version".format(self.namespace)
+
+    def _key(self, version, key):
+        return "djpaddle:{0}:{1}:{2}".format(self.namespace, version, key)
+
+    def _tag_key(self, tag):
+        return "djpaddle:{0}:tag:{1}".format(self.namespace, tag)
+
+    def version(self, tag=None):
+        """
+        Return the version of the cache, combined with the version of `tag`
+        if given.
+        """
+        shared = self.shared
+        if shared is None:
+            # local entries of a tag are dropped by invalidate_tag
+            return self._local_version
+        version = self._kept_version()
+        if tag is None:
+            return version if version is not None else self._read_version(shared)
+
+        tag_key = self._tag_key(tag)
+        if version is None:
+            versions = shared.get_many([self.version_key, tag_key])
+            version = self._read_version(shared, versions.get(self.version_key))
+            tag_version = versions.get(tag_key)
+        else:
+            tag_version = shared.get(tag_key)
+        if tag_version is None:
+            tag_version = _new_version()
+            if not shared.add(tag_key, tag_version, self.timeout):
+                tag_version = shared.get(tag_key)
+        return "{0}.{1}".format(version, tag_version)
+
+    def _kept_version(self):
+        kept = self._shared_version
+        if kept is not None and kept[1] > time.monotonic():
+            return kept[0]
+        return None
+
+    def _read_version(self, shared, version=None):
+        if version is None:
+            version = shared.get(self.version_key)
+        if version is None:
+            shared.add(self.version_key, _new_version(), None)
+            version = shared.get(self.version_key)
+        if self.version_ttl:
+            self._shared_version = (version, time.monotonic() + self.version_ttl)
+        return version
+
+    def get(self, key, tag=None):
+        version = self.version(tag)
+        entry = self._local.get(key)
+        if entry is not None and entry[0] == version and (entry[2] is None or entry[2] > time.monotonic()):
+            return entry[1]
+
+        shared = self.shared
+        if shared is None:
+            return None
+        value = shared.get(self._key(version, key))
+        if value is not None:
+            # the remaining lifetime of the shared entry is unknown
+            self._local.set(key, (version, value, self._expires(self.timeout), tag))
+        return value
+
+    def set(self, key, value, timeout=None, tag=None):
+        """
+        Cache `value` for `timeout` seconds, the cache's timeout by default.
+        Entries set with a `tag` have to be looked up with the same tag.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        version = self.version(tag)
+        self._local.set(key, (version, value, self._expires(timeout), tag))
+        shared = self.shared
+        if shared is not None:
+            shared.set(self._key(version, key), value, timeout)
+
+    @staticmethod
+    def _expires(timeout):
+        return None if timeout is None else time.monotonic() + timeout
+
+    def delete(self, key, tag=None):
+        """
+        Drop `key` from the local and the shared cache. Local entries of other
+        processes are kept until they expire, only `invalidate` drops them.
+        """
+        self._local.pop(key)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(self._key(self.version(tag), key))
+
+    def invalidate_tag(self, tag):
+        """
+        Drop the entries cached with `tag` in all processes.
+        """
+        self._local.discard_if(lambda entry: entry[3] == tag)
+        shared = self.shared
+        if shared is None:
+            return
+        try:
+            shared.incr(self._tag_key(tag))
+        except ValueError:
+            shared.add(self._tag_key(tag), _new_version(), self.timeout)
+
+    def invalidate(self):
+        self._local.clear()
+        self._local_version += 1
+        self._shared_version = None
+        shared = self.shared
+        if shared is None:
+            return
+        try:
+            shared.incr(self.version_key)
+        except ValueError:
+            shared.add(self.version_key, _new_version(), None)
+
+    def clear(self):
+        """
+        Drop the process local entries only.
+        """
+        self._local.clear()
@@ -0,0 +1,30 @@
+"""
+System checks of the djpaddle configuration.
+"""
+from django.core import checks
+from django.dispatch import Signal
+
+from . import signals
+from .receivers import colliding_receiver_names
+
+
+def check_receiver_names(app_configs=None, **kwargs):
+    """
+    Report receivers of the webhook signals sharing a name, their outcomes
+    couldn't be told apart when the webhook is processed.
+    """
+    from .views import PaddleWebhookView
+
+    errors = []
+    for alert_name, signal in sorted(vars(signals).items()):
+        if not isinstance(signal, Signal):
+            continue
+        for name in colliding_receiver_names(signal, PaddleWebhookView):
+            errors.append(
+                checks.Error(
+                    "Several receivers of djpaddle.signals.{0} are named '{1}'.".format(alert_name, name),
+                    hint="Connect them with a unique dispatch_uid.",
+                    id="djpaddle.E001",
+                )
+            )
+    return errors
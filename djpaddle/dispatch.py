@@ -0,0 +1,80 @@
+"""
+Dispatching of webhook events onto ordered worker lanes.
+
+Events are partitioned by the Paddle object they refer to, so all events of
+a single subscription (or checkout/order) are processed one after another in
+the same lane, while events of different subscriptions run concurrently.
+The order only holds within the batch of a single worker.
+"""
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+# the first key found in a payload decides the partition of an event
+PARTITION_KEYS = ("subscription_id", "checkout_id", "order_id", "alert_id")
+
+
+def partition_key(payload):
+    """
+    Return the key identifying the Paddle object a webhook payload refers to.
+    """
+    for key in PARTITION_KEYS:
+        value = payload.get(key)
+        if value not in (None, ""):
+            return "{0}:{1}".format(key, value)
+    return ""
+
+
+def lane_for(payload, lanes):
+    """
+    Map a webhook payload onto one of `lanes` lanes. The mapping is stable
+    across processes and restarts.
+    """
+    return zlib.crc32(partition_key(payload).encode("utf-8")) % lanes
+
+
+class PartitionedDispatcher:
+    """
+    Process webhook events on `lanes` threads. Events sharing a partition key
+    are always processed in order on the same lane.
+    """
+
+    def __init__(self, lanes=1):
+        self.lanes = max(1, lanes)
+        self._executor = None
+
+    def partition(self, events):
+        partitions = {}
+        for event in events:
+            partitions.setdefault(lane_for(event.payload, self.lanes), []).append(event)
+        return list(partitions.values())
+
+    def dispatch(self, events):
+        partitions = self.partition(events)
+        if len(partitions) <= 1:
+            for partition in partitions:
+                self._run(partition)
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.lanes, thread_name_prefix="djpaddle-lane")
+        futures = [self._executor.submit(self._run_in_thread, partition) for partition in partitions]
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _run(self, events):
+        for event in events:
+            event.process()
+
+    def _run_in_thread(self, events):
+        try:
+            self._run(events)
+        finally:
+            # every lane thread holds its own database connection
+            connection.close()
@@ -0,0 +1,86 @@
+"""
+Entitlements, the plans a subscriber has an active subscription to.
+
+`for_subscriber` returns an immutable snapshot which is memoised on the
+subscriber instance, i.e. once per request for `request.user`, and cached per
+subscriber across requests. Changes to subscriptions invalidate the cache, so
+most page views don't query subscriptions at all.
+"""
+from collections import namedtuple
+
+from . import settings
+from .cache import VersionedCache
+
+entitlement_cache = VersionedCache(
+    "entitlements",
+    alias=settings.DJPADDLE_ENTITLEMENTS_CACHE,
+    maxsize=settings.DJPADDLE_ENTITLEMENTS_CACHE_SIZE,
+    timeout=settings.DJPADDLE_ENTITLEMENTS_CACHE_TIMEOUT,
+)
+
+# attribute memoising the entitlements on a subscriber instance
+_MEMO_ATTRIBUTE = "_djpaddle_entitlements"
+
+
+class Entitlements(namedtuple("Entitlements", ["plans"])):
+    """
+    The ids of the plans a subscriber is entitled to, as a frozenset. Plans
+    (or their ids) can be tested with `in`, the snapshot is false if there
+    are none.
+    """
+
+    __slots__ = ()
+
+    def has_plan(self, plan):
+        return int(getattr(plan, "pk", plan)) in self.plans
+
+    def __contains__(self, plan):
+        return self.has_plan(plan)
+
+    def __bool__(self):
+        return bool(self.plans)
+
+
+NO_ENTITLEMENTS = Entitlements(frozenset())
+
+
+def _load(subscriber_pk):
+    from .models import Subscription
+
+    queryset = Subscription.objects.filter(
+        subscriber=subscriber_pk, status__in=settings.DJPADDLE_ENTITLED_STATUSES
+    ).order_by()
+    return Entitlements(frozenset(queryset.values_list("plan_id", flat=True)))
+
+
+def for_subscriber(subscriber):
+    """
+    Return the Entitlements of `subscriber`, no entitlements for None and
+    anonymous users.
+    """
+    if subscriber is None or subscriber.pk is None:
+        return NO_ENTITLEMENTS
+    entitlements = getattr(subscriber, _MEMO_ATTRIBUTE, None)
+    if entitlements is not None:
+        return entitlements
+
+    key = str(subscriber.pk)
+    entitlements = entitlement_cache.get(key)
+    if entitlements is None:
+        entitlements = _load(subscriber.pk)
+        entitlement_cache.set(key, entitlements)
+    setattr(subscriber, _MEMO_ATTRIBUTE, entitlements)
+    return entitlements
+
+
+def invalidate(*subscribers):
+    """
+    Drop the cached entitlements of `subscribers`, given as instances or pks.
+    """
+    for subscriber in subscribers:
+        pk = getattr(subscriber, "pk", subscriber)
+        if pk is None:
+            continue
+        if hasattr(subscriber, _MEMO_ATTRIBUTE):
+            delattr(subscriber, _MEMO_ATTRIBUTE)
+        entitlement_cache.delete(str(pk))
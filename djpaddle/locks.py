@@ -0,0 +1,117 @@
+"""
+Single-flight locks making sure only one caller performs an expensive
+operation (e.g. fetching a plan from Paddle) while the others wait.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from uuid import uuid4
+
+from django.core.cache import caches
+
+from . import settings
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+class LockTimeout(Exception):
+    """
+    The lock could not be acquired within the given timeout.
+    """
+
+
+@contextmanager
+def _process_lock(key, timeout):
+    with _locks_lock:
+        lock, users = _locks.get(key, (None, 0))
+        if lock is None:
+            lock = threading.Lock()
+        _locks[key] = (lock, users + 1)
+
+    try:
+        if not lock.acquire(timeout=timeout):
+            raise LockTimeout("timed out waiting for lock '{0}'".format(key))
+        try:
+            yield
+        finally:
+            lock.release()
+    finally:
+        with _locks_lock:
+            lock, users = _locks[key]
+            if users == 1:
+                del _locks[key]
+            else:
+                _locks[key] = (lock, users - 1)
+
+
+# seconds before its ttl a lock is left to expire instead of being deleted,
+# as it might expire (and be taken by another caller) while it is deleted
+RELEASE_MARGIN = 1
+
+# deletes the lock only if it still holds the caller's token
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def _release(cache, cache_key, token, expires):
+    client = getattr(cache, "client", None)
+    if hasattr(client, "get_client") and hasattr(client, "encode"):
+        # django-redis compares and deletes atomically
+        redis = client.get_client(write=True)
+        redis.eval(_RELEASE_SCRIPT, 1, cache.make_key(cache_key), client.encode(token))
+        return
+
+    # other backends can't, so the token is only compared while the lock
+    # can't have expired, i.e. can't have been taken by another caller
+    if time.monotonic() < expires - RELEASE_MARGIN and cache.get(cache_key) == token:
+        cache.delete(cache_key)
+
+
+@contextmanager
+def _cache_lock(key, timeout, ttl, poll_interval=0.05):
+    cache = caches[settings.DJPADDLE_LOCK_CACHE]
+    cache_key = "djpaddle:lock:{0}".format(key)
+    token = uuid4().hex
+    deadline = time.monotonic() + timeout
+    # the lock expires after `ttl` in case its holder dies, independent of
+    # how long we waited for it
+    while True:
+        expires = time.monotonic() + ttl
+        if cache.add(cache_key, token, ttl):
+            break
+        if time.monotonic() >= deadline:
+            raise LockTimeout("timed out waiting for lock '{0}'".format(key))
+        time.sleep(poll_interval)
+
+    try:
+        yield
+    finally:
+        _release(cache, cache_key, token, expires)
+
+
+@contextmanager
+def single_flight(key, timeout=None):
+    """
+    Hold the lock `key` within this process and, through the cache
+    'DJPADDLE_LOCK_CACHE', across processes. Callers must check whether the
+    work has been done by a previous lock holder after acquiring the lock.
+
+    Raises LockTimeout if the lock is not acquired within `timeout` seconds
+    (defaults to 'DJPADDLE_LOCK_TIMEOUT'). The lock in the cache expires
+    after 'DJPADDLE_LOCK_TTL' seconds.
+    """
+    if timeout is None:
+        timeout = settings.DJPADDLE_LOCK_TIMEOUT
+    deadline = time.monotonic() + timeout
+
+    with _process_lock(key, timeout):
+        if settings.DJPADDLE_LOCK_CACHE is None:
+            yield
+            return
+        with _cache_lock(key, max(deadline - time.monotonic(), 0), settings.DJPADDLE_LOCK_TTL):
+            yield
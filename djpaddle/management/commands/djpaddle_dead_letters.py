@@ -0,0 +1,70 @@
+"""
+dead_letters command.
+"""
+from django.core.management.base import BaseCommand
+
+from ...models import WebhookDeadLetter
+
+
+class Command(BaseCommand):
+    """List and replay webhook receivers that ran out of attempts."""
+
+    help = "List and replay webhook receivers that ran out of attempts."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "ids",
+            nargs="*",
+            type=int,
+            help="Only handle the dead letters with these ids.",
+        )
+        parser.add_argument(
+            "--receiver",
+            help="Only handle dead letters of this receiver (dotted path).",
+        )
+        parser.add_argument(
+            "--alert-name",
+            help="Only handle dead letters of this webhook alert.",
+        )
+        parser.add_argument(
+            "--replay",
+            action="store_true",
+            help="Run the receivers of the dead letters again.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Include dead letters that have been replayed successfully.",
+        )
+
+    def handle(self, *args, **options):
+        """List or replay the selected dead letters."""
+        queryset = WebhookDeadLetter.objects.select_related("event")
+        if not options["all"]:
+            queryset = queryset.filter(replayed_at=None)
+        if options["ids"]:
+            queryset = queryset.filter(pk__in=options["ids"])
+        if options["receiver"]:
+            queryset = queryset.filter(receiver=options["receiver"])
+        if options["alert_name"]:
+            queryset = queryset.filter(event__alert_name=options["alert_name"])
+
+        replayed = total = 0
+        for letter in queryset:
+            total += 1
+            if options["replay"]:
+                succeeded = letter.replay()
+                replayed += succeeded
+                outcome = "replayed" if succeeded else "failed again"
+            else:
+                outcome = "replayed" if letter.replayed_at else "dead"
+            self.stdout.write(
+                "{0} {1} {2} attempts={3} {4}: {5}".format(
+                    letter.pk, letter.event, letter.receiver, letter.attempts, outcome, letter.error
+                ).rstrip()
+            )
+
+        if options["replay"]:
+            self.stdout.write("Replayed {0} of {1} dead letters".format(replayed, total))
+        else:
+            self.stdout.write("{0} dead letters".format(total))
@@ -0,0 +1,25 @@
+"""
+link_stale_subscriptions command.
+"""
+from django.core.management.base import BaseCommand
+
+from ...models import Subscription
+
+
+class Command(BaseCommand):
+    """Link subscriptions without subscriber to their subscriber."""
+
+    help = "Link subscriptions without subscriber to their subscriber, e.g. after importing subscribers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of subscriptions linked by a single update.",
+        )
+
+    def handle(self, *args, **options):
+        """Link all stale subscriptions."""
+        count = Subscription.link_stale_subscriptions(chunk_size=options["chunk_size"])
+        self.stdout.write("Linked {0} stale subscriptions".format(count))
@@ -0,0 +1,78 @@
+"""
+process_webhooks command.
+"""
+import socket
+import time
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...dispatch import PartitionedDispatcher
+from ...models import WebhookEvent
+
+
+class Command(BaseCommand):
+    """Process webhook events stored in the inbox."""
+
+    help = "Process webhook events stored in the inbox and retry failed receivers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of events claimed at once.",
+        )
+        parser.add_argument(
+            "--lanes",
+            type=int,
+            default=1,
+            help="Number of threads processing a batch. Events of a subscription always share a lane.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the inbox is empty.",
+        )
+        parser.add_argument(
+            "--coalesce",
+            action="store_true",
+            help="Write the subscriptions of a batch at once, keeping the latest state of each subscription.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the inbox and exit instead of waiting for new events.",
+        )
+
+    def handle(self, *args, **options):
+        """Claim and process pending and retried events until interrupted."""
+        worker_id = "{0}:{1}".format(socket.gethostname(), uuid4().hex)[-64:]
+        dispatcher = PartitionedDispatcher(lanes=options["lanes"])
+        try:
+            while True:
+                count = WebhookEvent.process_pending(
+                    batch_size=options["batch_size"],
+                    worker_id=worker_id,
+                    dispatcher=dispatcher,
+                    coalesce=options["coalesce"],
+                )
+                if count:
+                    self.stdout.write("Processed {0} webhook events".format(count))
+                retried = WebhookEvent.retry_failed(
+                    limit=options["batch_size"],
+                    worker_id=worker_id,
+                    dispatcher=dispatcher,
+                )
+                if retried:
+                    self.stdout.write("Retried {0} webhook events".format(retried))
+                    count += retried
+                if options["once"]:
+                    break
+                close_old_connections()
+                if not count:
+                    time.sleep(options["sleep"])
+        finally:
+            dispatcher.shutdown()
@@ -0,0 +1,34 @@
+"""
+prune_webhooks command.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from ... import settings
+from ...models import WebhookEvent
+
+
+class Command(BaseCommand):
+    """Delete processed webhook events."""
+
+    help = "Delete webhook events processed more than DJPADDLE_WEBHOOK_RETENTION_DAYS days ago."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.DJPADDLE_WEBHOOK_RETENTION_DAYS,
+            help="Keep the events processed within the given number of days.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of events deleted by a single query.",
+        )
+
+    def handle(self, *args, **options):
+        """Delete the processed webhook events."""
+        count = WebhookEvent.prune(timedelta(days=options["days"]), chunk_size=options["chunk_size"])
+        self.stdout.write("Deleted {0} webhook events".format(count))
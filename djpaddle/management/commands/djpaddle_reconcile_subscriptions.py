@@ -0,0 +1,57 @@
+"""
+reconcile_subscriptions command.
+"""
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from ...reconcile import DRIFT_CHANGED, DRIFT_MISSING_LOCAL, DRIFT_MISSING_REMOTE, reconcile_subscriptions
+
+
+class Command(BaseCommand):
+    """Compare local subscriptions with paddle."""
+
+    help = "Compare local subscriptions with paddle and optionally repair the drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Apply paddle's view to the local subscriptions.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of pages fetched concurrently.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of subscriptions read and repaired at once.",
+        )
+
+    def handle(self, *args, **options):
+        """Report every drifted subscription and a summary."""
+        counts = Counter()
+        drifts = reconcile_subscriptions(
+            repair=options["repair"],
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+        )
+        for drift in drifts:
+            counts[drift.kind] += 1
+            fields = ", ".join(
+                "{0}: {1} -> {2}".format(name, local, remote) for name, (local, remote) in drift.fields.items()
+            )
+            self.stdout.write("{0} {1} {2}".format(drift.kind, drift.subscription_id, fields).rstrip())
+
+        self.stdout.write(
+            "{0}{1} changed, {2} missing locally, {3} missing on paddle".format(
+                "Repaired: " if options["repair"] else "Drift: ",
+                counts[DRIFT_CHANGED],
+                counts[DRIFT_MISSING_LOCAL],
+                counts[DRIFT_MISSING_REMOTE],
+            )
+        )
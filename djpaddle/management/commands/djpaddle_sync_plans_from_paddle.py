@@ -1,6 +1,8 @@
 """
 sync_plans_from_paddle command.
 """
+import time
+
 from django.core.management.base import BaseCommand
 
 from ...models import Plan
@@ -11,8 +13,47 @@ class Command(BaseCommand):
 
     help = "Sync plans from paddle."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--plan",
+            action="append",
+            dest="plans",
+            type=int,
+            help="Only sync the plan with this id. Can be given multiple times.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the changes without writing them.",
+        )
+
     def handle(self, *args, **options):
-        """Call sync_from_paddle_data for each plan returned by api_list."""
-        for plan_data in Plan.api_list():
-            plan = Plan.sync_from_paddle_data(plan_data)
-            print("Synchronized {0}".format(str(plan)))
+        """Sync all plans returned by api_list in a single transaction."""
+        started = time.monotonic()
+        plans_data = Plan.api_list()
+        if options["plans"]:
+            plans_data = [data for data in plans_data if int(data["id"]) in options["plans"]]
+
+        result = Plan.sync_many(plans_data, dry_run=options["dry_run"])
+
+        for plan in result.created:
+            self.stdout.write("Created {0}".format(plan))
+        for plan, fields in result.updated.items():
+            self.stdout.write("Updated {0}: {1}".format(plan, ", ".join(fields)))
+
+        summary = (
+            "{prefix}Synchronized {plans} plans in {seconds:.3f}s: "
+            "{created} created, {updated} updated, {unchanged} unchanged; "
+            "prices: {prices_created} created, {prices_updated} updated, {prices_deleted} deleted"
+        ).format(
+            prefix="[dry run] " if options["dry_run"] else "",
+            plans=len(result.plans),
+            seconds=time.monotonic() - started,
+            created=len(result.created),
+            updated=len(result.updated),
+            unchanged=result.unchanged,
+            prices_created=len(result.prices_created),
+            prices_updated=len(result.prices_updated),
+            prices_deleted=len(result.prices_deleted),
+        )
+        self.stdout.write(summary)
@@ -0,0 +1,62 @@
+"""
+sync_subscriptions command.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...sync import MAX_RESULTS_PER_PAGE, import_subscriptions
+
+
+class Command(BaseCommand):
+    """Sync subscriptions from paddle."""
+
+    help = "Sync subscriptions from paddle."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--plan",
+            type=int,
+            dest="plan_id",
+            help="Only sync subscriptions of the plan with this id.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of pages fetched concurrently.",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=MAX_RESULTS_PER_PAGE,
+            help="Number of subscriptions fetched per page.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of subscriptions written at once.",
+        )
+
+    def handle(self, *args, **options):
+        """Page through the subscription users listing and write it in chunks."""
+        started = time.monotonic()
+        filters = {}
+        if options["plan_id"]:
+            filters["plan_id"] = options["plan_id"]
+
+        result = import_subscriptions(
+            results_per_page=options["page_size"],
+            workers=options["workers"],
+            chunk_size=options["chunk_size"],
+            **filters
+        )
+        self.stdout.write(
+            "Synchronized {0} subscriptions in {1:.3f}s: {2} created, {3} updated".format(
+                result.created + result.updated,
+                time.monotonic() - started,
+                result.created,
+                result.updated,
+            )
+        )
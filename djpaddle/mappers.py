@@ -1,11 +1,27 @@
+import hashlib
 import importlib
+import json
 import threading
 
+from django.db.models import Value
+from django.db.models.functions import Lower
+
 from . import settings
+from .cache import VersionedCache
 
 _cache = threading.local()
 _cache.modules = {}
 
+# cached for payloads the subscriber mapping failed for
+SUBSCRIBER_NOT_FOUND = "djpaddle:subscriber-not-found"
+
+subscriber_cache = VersionedCache(
+    "subscribers",
+    alias=settings.DJPADDLE_SUBSCRIBER_CACHE,
+    maxsize=settings.DJPADDLE_SUBSCRIBER_CACHE_SIZE,
+    timeout=settings.DJPADDLE_SUBSCRIBER_CACHE_TIMEOUT,
+)
+
 
 def _get_fn(fn, *args, **kwargs):
     mod_name, func_name = fn.rsplit(".", 1)
@@ -37,8 +53,52 @@ def subscriptions_by_subscriber(subscriber, queryset):
     Filter subscriptions by subscriber. This function is used in order to
     find and link stale subscriptions. You can overwrite this function
     via settings.DJPADDLE_SUBSCRIPTIONS_BY_SUBSCRIBER.
+
+    Matches on LOWER(email), so the lookup hits the email indexes of
+    Subscription (``email__iexact`` can't use them on all databases).
+    """
+    return queryset.alias(email_lower=Lower("email")).filter(email_lower=Lower(Value(subscriber.email)))
+
+
+def _subscriber_cache_key(Subscriber, payload):
+    key = json.dumps(
+        [
+            settings.DJPADDLE_SUBSCRIBER_BY_PAYLOAD,
+            Subscriber._meta.label,
+            payload.get("email"),
+            payload.get("passthrough"),
+            payload.get("user_id"),
+        ],
+        default=str,
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def subscribers_cached_by_email():
+    """
+    Whether cached subscribers can be invalidated by email, i.e. whether the
+    mapping only depends on the email like the default one does.
+    """
+    return settings.DJPADDLE_SUBSCRIBER_BY_PAYLOAD == "djpaddle.mappers.subscriber_by_payload"
+
+
+def _subscriber_cache_tag(email):
+    if not subscribers_cached_by_email():
+        return None
+    return hashlib.sha1(json.dumps(email).encode("utf-8")).hexdigest()
+
+
+def invalidate_subscriber_cache(*emails):
     """
-    return queryset.filter(email__iexact=subscriber.email)
+    Drop the cached subscribers of payloads with one of the given emails. The
+    whole cache is dropped if DJPADDLE_SUBSCRIBER_BY_PAYLOAD is customized.
+    """
+    tags = {_subscriber_cache_tag(email) for email in emails}
+    if None in tags:
+        subscriber_cache.invalidate()
+        return
+    for tag in tags:
+        subscriber_cache.invalidate_tag(tag)
 
 
 def get_subscriber_by_payload(Subscriber, payload):
@@ -48,6 +108,37 @@ def get_subscriber_by_payload(Subscriber, payload):
     return _get_fn(settings.DJPADDLE_SUBSCRIBER_BY_PAYLOAD)(Subscriber=Subscriber, payload=payload)
 
 
+def get_subscriber_id_by_payload(Subscriber, payload):
+    """
+    Return the pk of the subscriber mapped to the payload by
+    get_subscriber_by_payload, raises Subscriber.DoesNotExist if there is none.
+
+    The pk is cached by the payload's email, passthrough and user_id,
+    including payloads without subscriber, unless
+    DJPADDLE_SUBSCRIBER_CACHE_TIMEOUT is 0.
+    """
+    if not settings.DJPADDLE_SUBSCRIBER_CACHE_TIMEOUT:
+        return get_subscriber_by_payload(Subscriber, payload).pk
+
+    key = _subscriber_cache_key(Subscriber, payload)
+    tag = _subscriber_cache_tag(payload.get("email"))
+    pk = subscriber_cache.get(key, tag=tag)
+    if pk == SUBSCRIBER_NOT_FOUND:
+        raise Subscriber.DoesNotExist("no subscriber found for payload (cached)")
+    if pk is not None:
+        return pk
+
+    try:
+        pk = get_subscriber_by_payload(Subscriber, payload).pk
+    except Subscriber.DoesNotExist:
+        subscriber_cache.set(
+            key, SUBSCRIBER_NOT_FOUND, timeout=settings.DJPADDLE_SUBSCRIBER_CACHE_MISS_TIMEOUT, tag=tag
+        )
+        raise
+    subscriber_cache.set(key, pk, tag=tag)
+    return pk
+
+
 def get_subscriptions_by_subscriber(subscriber, queryset):
     """
     wrapper to retrieve and call the function referenced in settings.DJPADDLE_SUBSCRIPTIONS_BY_SUBSCRIBER
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djpaddle', '0006_webhookevent_claims'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='alert_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
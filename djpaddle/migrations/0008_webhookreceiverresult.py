@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djpaddle', '0007_webhookevent_unique_alert_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookReceiverResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('receiver', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('succeeded', 'succeeded'), ('failed', 'failed')], max_length=16)),
+                ('error', models.TextField(blank=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receiver_results', to='djpaddle.webhookevent')),
+            ],
+            options={
+                'unique_together': {('event', 'receiver')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djpaddle', '0008_webhookreceiverresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookreceiverresult',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='webhookreceiverresult',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='webhookreceiverresult',
+            name='status',
+            field=models.CharField(choices=[('succeeded', 'succeeded'), ('failed', 'failed'), ('dead', 'dead')], max_length=16),
+        ),
+        migrations.CreateModel(
+            name='WebhookDeadLetter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('receiver', models.CharField(max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('replayed_at', models.DateTimeField(blank=True, null=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dead_letters', to='djpaddle.webhookevent')),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'unique_together': {('event', 'receiver')},
+            },
+        ),
+    ]
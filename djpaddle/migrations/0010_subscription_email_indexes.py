@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:08
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djpaddle', '0009_receiver_retries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='djpaddle_sub_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(django.db.models.functions.text.Lower('email'), condition=models.Q(('subscriber', None)), name='djpaddle_sub_stale_email_idx'),
+        ),
+    ]
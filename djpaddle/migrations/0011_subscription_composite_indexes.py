@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djpaddle', '0010_subscription_email_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['subscriber', 'status'], name='djpaddle_sub_subscr_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['status', 'next_bill_date'], name='djpaddle_sub_status_bill_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['plan', 'status'], name='djpaddle_sub_plan_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['checkout_id'], name='djpaddle_sub_checkout_idx'),
+        ),
+    ]
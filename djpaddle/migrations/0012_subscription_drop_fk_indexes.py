@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('djpaddle', '0011_subscription_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subscription',
+            name='plan',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='djpaddle.plan'),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='subscriber',
+            field=models.ForeignKey(db_index=False, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
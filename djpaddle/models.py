@@ -1,26 +1,54 @@
+import json
 import logging
-from datetime import datetime
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import timedelta
+from uuid import uuid4
 
-from django.db import models
-from django.conf import settings as djsettings
-from django.db.models.signals import post_save
+from django.core.cache import caches
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.db.models.functions import Lower
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from paddle import PaddleClient
 
-from . import settings, signals, mappers
+from . import entitlements, settings, signals, mappers
+from .async_utils import run_in_db_thread
+from .cache import VersionedCache
 from .fields import PaddleCurrencyCodeField
-from .utils import PADDLE_DATETIME_FORMAT, PADDLE_DATE_FORMAT
+from .locks import single_flight
+from .payloads import get_mapper
+from .receivers import get_receiver_pool, receiver_name, retry_delay
 
 log = logging.getLogger("djpaddle")
 
+# alerts creating or updating a subscription through `subscription_event`
+SUBSCRIPTION_ALERTS = (
+    "subscription_created",
+    "subscription_updated",
+    "subscription_cancelled",
+    "subscription_payment_succeeded",
+)
+
 paddle_client = PaddleClient(
     vendor_id=settings.DJPADDLE_VENDOR_ID,
     api_key=settings.DJPADDLE_API_KEY,
     sandbox=settings.DJPADDLE_SANDBOX,
 )
 
+plan_cache = VersionedCache(
+    "plans",
+    alias=settings.DJPADDLE_PLAN_CACHE,
+    maxsize=settings.DJPADDLE_PLAN_CACHE_SIZE,
+    timeout=settings.DJPADDLE_PLAN_CACHE_TIMEOUT,
+    version_ttl=settings.DJPADDLE_PLAN_CACHE_VERSION_TTL,
+)
+
 
 class PaddleBaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -63,48 +91,183 @@ class Plan(PaddleBaseModel):
         plan_data = paddle_client.list_plans(plan=int(plan_id))[0]
         return plan_data
 
+    @classmethod
+    def get_cached(cls, plan_id):
+        """
+        Return the plan with the given id from the plan cache, falling back
+        to the database. Raises Plan.DoesNotExist for unknown plans.
+        """
+        key = str(plan_id)
+        plan = plan_cache.get(key)
+        if plan is None:
+            plan = cls.objects.get(pk=plan_id)
+            plan_cache.set(key, plan)
+        return plan
+
+    @classmethod
+    def get_or_sync(cls, plan_id):
+        """
+        Return the plan with the given id, fetching and syncing it from Paddle
+        if it is unknown. Only a single caller fetches a missing plan while
+        concurrent callers wait for its result.
+        """
+        try:
+            return cls.get_cached(plan_id)
+        except cls.DoesNotExist:
+            pass
+
+        with single_flight("plan:{0}".format(plan_id)):
+            try:
+                # synced by the previous lock holder
+                return cls.get_cached(plan_id)
+            except cls.DoesNotExist:
+                plan_data = cls.api_get(plan_id=plan_id)
+                return cls.sync_from_paddle_data(plan_data)
+
     @classmethod
     def sync_from_paddle_data(cls, data):
-        pk = data.pop("id")
-        initial_price = data.pop("initial_price", {})
-        recurring_price = data.pop("recurring_price", {})
+        """
+        Create or update a plan and its prices from Paddle's plan data.
+        Only changed plan attributes and prices are written, so syncing an
+        unchanged plan does not write anything.
+        """
+        return cls.sync_many([data]).plans[0]
 
-        plan, __ = cls.objects.get_or_create(pk=pk, defaults=data)
+    @classmethod
+    def sync_many(cls, plans_data, dry_run=False):
+        """
+        Create or update plans and their prices from Paddle's plan data in a
+        single transaction using a constant number of bulk queries.
 
-        # drop all existing prices and recreate them
-        plan.prices.all().delete()
-        prices = []
-        for currency, quantity in initial_price.items():
-            price = Price(
-                plan=plan,
-                currency=currency,
-                quantity=float(quantity),
-                recurring=False,
-            )
-            prices.append(price)
-        for currency, quantity in recurring_price.items():
-            price = Price(
-                plan=plan,
-                currency=currency,
-                quantity=float(quantity),
-                recurring=True,
-            )
-            prices.append(price)
+        Existing plans are locked for the duration of the sync. With `dry_run`
+        the changes are computed but not written. Returns a `PlanSyncResult`.
+        """
+        plans_data = [dict(data) for data in plans_data]
+        with transaction.atomic():
+            pks = [data["id"] for data in plans_data]
+            existing = cls.objects.select_for_update().in_bulk(pks)
+            existing_prices = {}
+            for price in Price.objects.filter(plan__in=list(existing)).order_by():
+                existing_prices.setdefault(price.plan_id, []).append(price)
 
-        Price.objects.bulk_create(prices)
+            plans, created, updated = [], [], {}
+            prices_create, prices_update, prices_delete = [], [], []
+            for data in plans_data:
+                pk = data.pop("id")
+                initial_price = data.pop("initial_price", {})
+                recurring_price = data.pop("recurring_price", {})
 
-        return plan
+                plan = existing.get(pk)
+                if plan is None:
+                    plan = cls(pk=pk, **data)
+                    created.append(plan)
+                else:
+                    changed = plan._apply_paddle_data(data)
+                    if changed:
+                        updated[plan] = changed
+                plans.append(plan)
+
+                diff = Price.diff_paddle_prices(plan, existing_prices.get(plan.pk, []), initial_price, recurring_price)
+                prices_create.extend(diff[0])
+                prices_update.extend(diff[1])
+                prices_delete.extend(diff[2])
+
+            result = PlanSyncResult(plans, created, updated, prices_create, prices_update, prices_delete)
+            if dry_run or not result.changed:
+                return result
+
+            now = timezone.now()
+            for plan in updated:
+                plan.updated_at = now
+            update_fields = {name for changed in updated.values() for name in changed}
+
+            cls.objects.bulk_create(created)
+            if updated:
+                cls.objects.bulk_update(list(updated), sorted(update_fields) + ["updated_at"])
+            Price.objects.bulk_create(prices_create)
+            Price.objects.bulk_update(prices_update, ["quantity", "updated_at"])
+            if prices_delete:
+                Price.objects.filter(pk__in=[price.pk for price in prices_delete]).delete()
+
+        plan_cache.invalidate()
+        return result
+
+    def _apply_paddle_data(self, data):
+        """
+        Set the attributes given in Paddle's plan data and return the names of
+        the fields that changed.
+        """
+        changed = []
+        for name, value in data.items():
+            field = self._meta.get_field(name)
+            value = field.to_python(value)
+            if getattr(self, field.attname) != value:
+                setattr(self, field.attname, value)
+                changed.append(field.name)
+        return changed
 
     def __str__(self):
         return "{}:{}".format(self.name, self.id)
 
 
+class PlanSyncResult(
+    namedtuple(
+        "PlanSyncResult",
+        ["plans", "created", "updated", "prices_created", "prices_updated", "prices_deleted"],
+    )
+):
+    """
+    The outcome of `Plan.sync_many`. 'updated' maps updated plans to the
+    names of their changed fields.
+    """
+
+    @property
+    def unchanged(self):
+        return len(self.plans) - len(self.created) - len(self.updated)
+
+    @property
+    def changed(self):
+        return any(self[1:])
+
+
 class Price(PaddleBaseModel):
     plan = models.ForeignKey("djpaddle.Plan", on_delete=models.CASCADE, related_name="prices")
     currency = PaddleCurrencyCodeField()
     quantity = models.FloatField()
     recurring = models.BooleanField()
 
+    @classmethod
+    def diff_paddle_prices(cls, plan, existing, initial_price, recurring_price):
+        """
+        Compare Paddle's initial and recurring prices of a plan to its
+        `existing` prices. Returns the prices to create, to update and to
+        delete.
+        """
+        wanted = {}
+        for currency, quantity in initial_price.items():
+            wanted[(currency, False)] = float(quantity)
+        for currency, quantity in recurring_price.items():
+            wanted[(currency, True)] = float(quantity)
+
+        now = timezone.now()
+        update, delete = [], []
+        for price in existing:
+            key = (price.currency, price.recurring)
+            if key not in wanted:
+                delete.append(price)
+                continue
+            quantity = wanted.pop(key)
+            if price.quantity != quantity:
+                price.quantity = quantity
+                price.updated_at = now
+                update.append(price)
+
+        create = [
+            cls(plan=plan, currency=currency, quantity=quantity, recurring=recurring)
+            for (currency, recurring), quantity in wanted.items()
+        ]
+        return create, update, delete
+
     def __str__(self):
         return "{} {}".format(self.quantity, self.currency)
 
@@ -139,12 +302,15 @@ class Subscription(PaddleBaseModel):
     )
 
     id = models.CharField(max_length=64, primary_key=True)
+    # the (subscriber, status) and (plan, status) indexes cover lookups by
+    # subscriber or plan alone, an index on the foreign key would duplicate them
     subscriber = models.ForeignKey(
         settings.DJPADDLE_SUBSCRIBER_MODEL,
         related_name="subscriptions",
         null=True,
         default=None,
         on_delete=models.CASCADE,
+        db_index=False,
     )
 
     cancel_url = models.URLField()
@@ -158,12 +324,25 @@ class Subscription(PaddleBaseModel):
     quantity = models.IntegerField()
     source = models.URLField()
     status = models.CharField(choices=STATUS_CHOICES, max_length=16)
-    plan = models.ForeignKey(Plan, on_delete=models.CASCADE)
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, db_index=False)
     unit_price = models.FloatField()
     update_url = models.URLField()
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # case-insensitive email lookups of the default mappers
+            models.Index(Lower("email"), name="djpaddle_sub_email_lower_idx"),
+            # stale subscriptions waiting to be linked to a subscriber
+            models.Index(Lower("email"), condition=Q(subscriber=None), name="djpaddle_sub_stale_email_idx"),
+            # a subscriber's (e.g. active) subscriptions
+            models.Index(fields=["subscriber", "status"], name="djpaddle_sub_subscr_status_idx"),
+            # subscriptions (of a status) due before a date
+            models.Index(fields=["status", "next_bill_date"], name="djpaddle_sub_status_bill_idx"),
+            # subscriptions by plan and status, also filtered by the admin
+            models.Index(fields=["plan", "status"], name="djpaddle_sub_plan_status_idx"),
+            models.Index(fields=["checkout_id"], name="djpaddle_sub_checkout_idx"),
+        ]
 
     @classmethod
     def _sanitize_webhook_payload(cls, payload):
@@ -172,45 +351,285 @@ class Subscription(PaddleBaseModel):
 
         Subscriber = settings.get_subscriber_model()
         try:
-            data["subscriber"] = mappers.get_subscriber_by_payload(Subscriber, payload)
+            data["subscriber_id"] = mappers.get_subscriber_id_by_payload(Subscriber, payload)
         except Subscriber.DoesNotExist:
-            warning = "Subscriber could not be found for subscription {0} with payload {1}. Subscriber left empty."
-            log.warning(warning.format(data["id"], payload))
-            data["subscriber"] = None
+            log.warning("Subscriber could not be found for subscription {0}. Subscriber left empty.".format(data["id"]))
+            log.debug("Payload of subscription {0} without subscriber: {1}".format(data["id"], payload))
+            data["subscriber_id"] = None
 
         # transform `subscription_plan_id` to plan ref
         plan_id = payload.pop("subscription_plan_id")
-        try:
-            data["plan"] = Plan.objects.get(pk=plan_id)
-        except Plan.DoesNotExist:
-            plan_data = Plan.api_get(plan_id=plan_id)
-            data["plan"] = Plan.sync_from_paddle_data(plan_data)
+        data["plan"] = Plan.get_or_sync(plan_id)
+
+        # sanitize fields, e.g. 'new_status' --> 'status'
+        return get_mapper(cls).sanitize(payload, data)
+
+    @classmethod
+    def create_or_update_by_payload(cls, payload):
+        """
+        Create or update the subscription of a webhook payload. Returns the
+        created subscription, None if an existing one has been updated or the
+        payload belongs to an older event.
+        """
+        data = cls._sanitize_webhook_payload(payload)
+        created = cls._bulk_upsert([data], return_created=True)[1]
+        return created[0] if created else None
+
+    @classmethod
+    def bulk_upsert(cls, rows, insert_only=()):
+        """
+        Create or update subscriptions from sanitized webhook data.
 
-        # sanitize fields
-        valid_field_names = [field.name for field in cls._meta.get_fields()]
-        for key, value in payload.items():
-            # e.g. 'new_status' --> 'status'
-            if key.startswith("new_"):
-                key = key[4:]
+        Existing subscriptions are only updated if the data belongs to a newer
+        event ('event_time'). On PostgreSQL and SQLite the write and the stale
+        event check happen atomically in a single INSERT ... ON CONFLICT
+        statement. Other databases, and payloads that lack fields required to
+        create a subscription (e.g. 'subscription_cancelled'), use a
+        conditional UPDATE and only create the subscription if it is missing.
+        Fields named in `insert_only` are only written when a subscription is
+        created. Several rows of a subscription are merged in 'event_time'
+        order, later values win, and written as of the latest event.
 
-            if key in valid_field_names:
-                data[key] = value
+        Returns the number of subscriptions that have been written.
+        """
+        return cls._bulk_upsert(rows, insert_only=insert_only)[0]
 
-        data = convert_datetime_strings_to_datetimes(data, cls)
+    @classmethod
+    def _bulk_upsert(cls, rows, return_created=False, insert_only=()):
+        """
+        Implements `bulk_upsert`. Returns the number of written subscriptions
+        and, with `return_created`, a list of the created ones.
+        """
+        # rows of the same subscription are merged in 'event_time' order, so a
+        # partial row (e.g. 'subscription_cancelled') keeps the fields of older ones
+        latest = {}
+        for data in sorted(rows, key=lambda data: data["event_time"]):
+            latest.setdefault(str(data["id"]), {}).update(data)
 
-        return data
+        # rows are grouped by their keys as only the given fields are updated
+        groups = {}
+        for data in latest.values():
+            groups.setdefault(frozenset(data), []).append(data)
+
+        # subscribers whose entitlements change; the current subscriber is only
+        # looked up for rows that unlink a subscription, don't name or don't update it
+        subscribers = {_subscriber_pk(data) for data in latest.values()}
+        keeps_subscriber = bool({"subscriber", "subscriber_id"} & set(insert_only))
+        unknown = [pk for pk, data in latest.items() if keeps_subscriber or _subscriber_pk(data) is None]
+        if unknown:
+            subscribers.update(cls.objects.filter(pk__in=unknown).values_list("subscriber", flat=True))
+
+        count, created = 0, []
+        for keys, group in groups.items():
+            if _supports_conditional_upsert() and cls._required_field_names() <= keys:
+                written, inserted = cls._upsert_many(group, return_created, insert_only)
+            else:
+                written, inserted = cls._update_or_create_many(group, insert_only)
+            count += written
+            created.extend(inserted)
+        if count:
+            _invalidate_entitlements_on_commit(subscribers)
+        return count, created
 
     @classmethod
-    def create_or_update_by_payload(cls, payload):
-        data = cls._sanitize_webhook_payload(payload)
-        pk = data.get("id")
+    def _required_field_names(cls):
+        """
+        Names of the fields without a usable default that must be given in
+        order to insert a subscription.
+        """
+        return get_mapper(cls).required_field_names
+
+    @classmethod
+    def _upsert_many(cls, rows, return_created=False, insert_only=()):
+        fields = cls._meta.concrete_fields
+        update_fields = [
+            field
+            for field in fields
+            if (field.name in rows[0] or field.attname in rows[0] or field.name == "updated_at")
+            and not field.primary_key
+            and field.name not in insert_only
+            and field.attname not in insert_only
+        ]
+
+        # stay within the database's limit of query parameters (e.g. SQLite's 999)
+        batch_size = max(connection.ops.bulk_batch_size(fields, rows), 1)
+        count, created = 0, []
+        for start in range(0, len(rows), batch_size):
+            written, inserted = cls._upsert_batch(rows[start : start + batch_size], update_fields, return_created)
+            count += written
+            created.extend(inserted)
+        return count, created
+
+    @classmethod
+    def _upsert_batch(cls, rows, update_fields, return_created):
+        opts = cls._meta
+        quote_name = connection.ops.quote_name
+        table = quote_name(opts.db_table)
+        fields = opts.concrete_fields
+
+        # inserted rows are told from updated ones by created_at = updated_at
+        now = timezone.now()
+        instances, params = [], []
+        for data in rows:
+            instance = cls(**data)
+            instance.pk = opts.pk.to_python(instance.pk)
+            instance.created_at = instance.updated_at = now
+            instances.append(instance)
+            for field in fields:
+                value = now if field.name in ("created_at", "updated_at") else field.pre_save(instance, True)
+                params.append(field.get_db_prep_save(value, connection))
+
+        returning = return_created and _supports_returning()
+        existing = None
+        if return_created and not returning:
+            pks = [instance.pk for instance in instances]
+            existing = set(cls.objects.filter(pk__in=pks).values_list("pk", flat=True))
+
+        placeholders = "({0})".format(", ".join(["%s"] * len(fields)))
+        sql = (
+            "INSERT INTO {table} ({columns}) VALUES {values} "
+            "ON CONFLICT ({pk}) DO UPDATE SET {updates} "
+            "WHERE {table}.{event_time} < EXCLUDED.{event_time}"
+        ).format(
+            table=table,
+            columns=", ".join(quote_name(field.column) for field in fields),
+            values=", ".join([placeholders] * len(rows)),
+            pk=quote_name(opts.pk.column),
+            updates=", ".join("{0} = EXCLUDED.{0}".format(quote_name(field.column)) for field in update_fields),
+            event_time=quote_name(opts.get_field("event_time").column),
+        )
+        if returning:
+            sql += " RETURNING {pk}, {created_at} = {updated_at}".format(
+                pk=quote_name(opts.pk.column),
+                created_at=quote_name(opts.get_field("created_at").column),
+                updated_at=quote_name(opts.get_field("updated_at").column),
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if not returning:
+                if existing is None:
+                    return cursor.rowcount, []
+                return cursor.rowcount, [instance for instance in instances if instance.pk not in existing]
+            written = cursor.fetchall()
+        inserted = {pk for pk, was_inserted in written if was_inserted}
+        return len(written), [instance for instance in instances if instance.pk in inserted]
+
+    @classmethod
+    def _update_or_create_many(cls, rows, insert_only=()):
+        count, created = 0, []
+        for data in rows:
+            written, subscription = cls._update_or_create_one(data, insert_only)
+            count += written
+            if subscription is not None:
+                created.append(subscription)
+        return count, created
+
+    @classmethod
+    def _update_or_create_one(cls, data, insert_only=()):
+        """
+        Returns the number of written subscriptions and the created one.
+        """
+        data = dict(data)
+        pk = data.pop("id")
+        changes = {name: value for name, value in data.items() if name not in insert_only}
+        # entitlements are invalidated by _bulk_upsert for the whole batch
+        queryset = cls.objects.filter(pk=pk, event_time__lt=data["event_time"])
+        updated = queryset.update(updated_at=timezone.now(), **changes)
+        if updated or cls.objects.filter(pk=pk).exists():
+            return updated, None
+
         try:
-            subscription = cls.objects.get(pk=pk)
-        except cls.DoesNotExist:
-            return cls.objects.create(pk=pk, **data)
+            with transaction.atomic():
+                subscription = cls.objects.create(pk=pk, **data)
+        except IntegrityError:
+            if not cls.objects.filter(pk=pk).exists():
+                raise
+            # created concurrently, apply the data if it is still newer
+            return queryset.update(updated_at=timezone.now(), **changes), None
+        return 1, subscription
+
+    @classmethod
+    def link_stale_subscriptions(cls, chunk_size=1000):
+        """
+        Link all subscriptions without subscriber to their subscriber, e.g.
+        after subscribers have been imported with bulk_create or while
+        linking was suspended by `suspend_stale_linking`.
+
+        With the default DJPADDLE_SUBSCRIPTIONS_BY_SUBSCRIBER every chunk of
+        subscriptions is linked by a single set-based UPDATE matching the
+        emails case-insensitively. Custom mappings are applied subscriber by
+        subscriber.
 
-        if subscription.event_time < data["event_time"]:
-            cls.objects.filter(pk=pk).update(**data)
+        Returns the number of linked subscriptions.
+        """
+        if settings.DJPADDLE_SUBSCRIPTIONS_BY_SUBSCRIBER != "djpaddle.mappers.subscriptions_by_subscriber":
+            return cls._link_stale_by_subscriber(chunk_size)
+
+        count = 0
+        last_pk = None
+        while True:
+            queryset = cls.objects.filter(subscriber=None).order_by("pk")
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+            pks = list(queryset.values_list("pk", flat=True)[:chunk_size])
+            if not pks:
+                return count
+            last_pk = pks[-1]
+            with transaction.atomic():
+                if _supports_update_from():
+                    linked = cls._link_stale_chunk_update_from(pks)
+                else:
+                    linked = cls._link_stale_chunk_subquery(pks)
+            count += linked
+
+    @classmethod
+    def _link_stale_chunk_update_from(cls, pks):
+        Subscriber = settings.get_subscriber_model()
+        quote_name = connection.ops.quote_name
+        subscriber_field = cls._meta.get_field("subscriber")
+        sql = (
+            "UPDATE {table} SET {subscriber} = {subscribers}.{subscriber_pk} FROM {subscribers} "
+            "WHERE {table}.{pk} IN ({pks}) AND {table}.{subscriber} IS NULL "
+            "AND LOWER({table}.{email}) = LOWER({subscribers}.{subscriber_email})"
+        ).format(
+            table=quote_name(cls._meta.db_table),
+            subscriber=quote_name(subscriber_field.column),
+            subscribers=quote_name(Subscriber._meta.db_table),
+            subscriber_pk=quote_name(Subscriber._meta.pk.column),
+            pk=quote_name(cls._meta.pk.column),
+            pks=", ".join(["%s"] * len(pks)),
+            email=quote_name(cls._meta.get_field("email").column),
+            subscriber_email=quote_name(Subscriber._meta.get_field("email").column),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, pks)
+            linked = cursor.rowcount
+        if linked:
+            # the linked subscribers are not known, drop all entitlements
+            _invalidate_entitlements_on_commit(None)
+        return linked
+
+    @classmethod
+    def _link_stale_chunk_subquery(cls, pks):
+        Subscriber = settings.get_subscriber_model()
+        subscribers = (
+            Subscriber.objects.alias(email_lower=Lower("email"))
+            .filter(email_lower=Lower(OuterRef("email")))
+            .order_by("pk")
+        )
+        queryset = cls.objects.filter(Exists(subscribers), pk__in=pks, subscriber=None)
+        # the linked subscribers are not known, drop all entitlements
+        return _update_subscriptions(queryset, None, subscriber=Subquery(subscribers.values("pk")[:1]))
+
+    @classmethod
+    def _link_stale_by_subscriber(cls, chunk_size):
+        Subscriber = settings.get_subscriber_model()
+        count = 0
+        for subscriber in Subscriber.objects.order_by("pk").iterator(chunk_size=chunk_size):
+            queryset = mappers.get_subscriptions_by_subscriber(subscriber, cls.objects.filter(subscriber=None))
+            count += _update_subscriptions(queryset, [subscriber], subscriber=subscriber)
+        return count
 
     def __str__(self):
         return "{}:{}".format(self.subscriber, self.id)
@@ -229,39 +648,634 @@ class Checkout(models.Model):
     created_at = models.DateTimeField(null=True, blank=True)
 
 
-@receiver(signals.subscription_created)
-@receiver(signals.subscription_updated)
-@receiver(signals.subscription_cancelled)
-@receiver(signals.subscription_payment_succeeded)
+class WebhookEventInProgress(Exception):
+    """
+    The webhook is being processed by another request or worker.
+    """
+
+
+class WebhookEvent(PaddleBaseModel):
+    """
+    'WebhookEvent' is a verified Paddle webhook waiting in the inbox.
+
+    When 'DJPADDLE_WEBHOOK_QUEUE' is enabled the webhook view only stores the
+    event and acknowledges it straight away. The signals are sent later on
+    when the inbox is drained by `WebhookEvent.process_pending`.
+
+    Events are unique by 'alert_id', so webhooks redelivered by Paddle are
+    detected and not processed a second time.
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSING = "processing"
+    STATUS_PROCESSED = "processed"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _("pending")),
+        (STATUS_PROCESSING, _("processing")),
+        (STATUS_PROCESSED, _("processed")),
+        (STATUS_FAILED, _("failed")),
+    )
+
+    alert_id = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    alert_name = models.CharField(max_length=64)
+    raw_payload = models.TextField()
+    status = models.CharField(choices=STATUS_CHOICES, max_length=16, default=STATUS_PENDING, db_index=True)
+    error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+
+    @cached_property
+    def payload(self):
+        return json.loads(self.raw_payload)
+
+    @classmethod
+    def create_from_payload(cls, payload, status=STATUS_PENDING):
+        return cls.objects.create(
+            alert_id=payload.get("alert_id"),
+            alert_name=payload["alert_name"],
+            raw_payload=json.dumps(payload),
+            status=status,
+            locked_at=timezone.now() if status == cls.STATUS_PROCESSING else None,
+        )
+
+    @classmethod
+    def receive(cls, payload, status=STATUS_PENDING):
+        """
+        Store an incoming webhook with the given status.
+
+        Returns None if the alert has already been received and must not be
+        processed again. Redeliveries of failed events, and of events whose
+        processing was left unfinished for 'DJPADDLE_WEBHOOK_LOCK_TIMEOUT'
+        seconds (e.g. by a crashed request), are accepted again.
+
+        Raises WebhookEventInProgress if the webhook is to be processed right
+        away (`status` 'processing') while its earlier delivery is still being
+        processed.
+        """
+        alert_id = payload.get("alert_id")
+        if alert_id is not None and _is_known_alert(alert_id):
+            return None
+
+        try:
+            with transaction.atomic():
+                event = cls.create_from_payload(payload, status=status)
+        except IntegrityError:
+            now = timezone.now()
+            stale = now - timedelta(seconds=settings.DJPADDLE_WEBHOOK_LOCK_TIMEOUT)
+            retryable = Q(status=cls.STATUS_FAILED) | Q(status=cls.STATUS_PROCESSING, locked_at__lt=stale)
+            retried = cls.objects.filter(retryable, alert_id=alert_id).update(
+                status=status,
+                locked_by="",
+                locked_at=now if status == cls.STATUS_PROCESSING else None,
+                updated_at=now,
+            )
+            if retried:
+                return cls.objects.get(alert_id=alert_id)
+            if status == cls.STATUS_PROCESSING and cls.objects.filter(alert_id=alert_id, status=status).exists():
+                raise WebhookEventInProgress("webhook {0} is being processed".format(alert_id))
+            return None
+
+        if status == cls.STATUS_PENDING:
+            _remember_alert(alert_id)
+        return event
+
+    @classmethod
+    def prune(cls, older_than, chunk_size=1000):
+        """
+        Delete the events (with their receiver results and replayed dead
+        letters) processed more than `older_than` (a timedelta) ago, in
+        chunks of `chunk_size` events. Unfinished events are kept.
+        Returns the number of deleted events.
+        """
+        cutoff = timezone.now() - older_than
+        queryset = cls.objects.filter(status=cls.STATUS_PROCESSED, processed_at__lt=cutoff)
+        count = 0
+        while True:
+            pks = list(queryset.order_by("pk").values_list("pk", flat=True)[:chunk_size])
+            if not pks:
+                return count
+            cls.objects.filter(pk__in=pks).delete()
+            count += len(pks)
+
+    @classmethod
+    def claim_pending(cls, batch_size, worker_id=None):
+        """
+        Claim up to `batch_size` pending events for a single worker.
+
+        Candidates are locked with SELECT ... FOR UPDATE SKIP LOCKED where the
+        database supports it, so concurrent workers never wait on each other.
+        The conditional update only moves events that are still claimable,
+        which keeps claims exclusive on backends without SKIP LOCKED (SQLite).
+        Events whose claim is older than 'DJPADDLE_WEBHOOK_LOCK_TIMEOUT' are
+        considered abandoned and can be claimed again.
+        """
+        worker_id = worker_id or uuid4().hex
+        now = timezone.now()
+        stale = now - timedelta(seconds=settings.DJPADDLE_WEBHOOK_LOCK_TIMEOUT)
+        claimable = Q(status=cls.STATUS_PENDING) | Q(status=cls.STATUS_PROCESSING, locked_at__lt=stale)
+
+        with transaction.atomic():
+            queryset = cls.objects.filter(claimable).order_by("created_at", "pk")
+            if connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+            cls.objects.filter(claimable, pk__in=pks).update(
+                status=cls.STATUS_PROCESSING,
+                locked_by=worker_id,
+                locked_at=now,
+            )
+
+        queryset = cls.objects.filter(pk__in=pks, status=cls.STATUS_PROCESSING, locked_by=worker_id)
+        return list(queryset.order_by("created_at", "pk"))
+
+    @classmethod
+    def process_pending(cls, limit=None, batch_size=100, worker_id=None, dispatcher=None, coalesce=False):
+        """
+        Claim and process pending events in the order they were received and
+        return the number of events that have been handled.
+
+        A `djpaddle.dispatch.PartitionedDispatcher` can be passed to process
+        each claimed batch concurrently while keeping events of a single
+        subscription in order. With `coalesce` the subscription events of a
+        batch are written at once by `apply_subscription_events`.
+        """
+        count = 0
+        while limit is None or count < limit:
+            size = batch_size if limit is None else min(batch_size, limit - count)
+            events = cls.claim_pending(size, worker_id=worker_id)
+            if not events:
+                break
+            cls._process_batch(events, dispatcher, coalesce=coalesce)
+            count += len(events)
+        return count
+
+    @classmethod
+    def retry_failed(cls, limit=100, worker_id=None, dispatcher=None):
+        """
+        Claim up to `limit` failed events with a receiver due for a retry,
+        run their failed receivers again and return the number of events.
+        """
+        worker_id = worker_id or uuid4().hex
+        now = timezone.now()
+        due = WebhookReceiverResult.objects.filter(
+            status=WebhookReceiverResult.STATUS_FAILED, next_attempt_at__lte=now
+        ).values("event")
+        claimable = Q(status=cls.STATUS_FAILED, pk__in=due)
+
+        with transaction.atomic():
+            queryset = cls.objects.filter(claimable).order_by("created_at", "pk")
+            if connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            pks = list(queryset.values_list("pk", flat=True)[:limit])
+            cls.objects.filter(claimable, pk__in=pks).update(
+                status=cls.STATUS_PROCESSING,
+                locked_by=worker_id,
+                locked_at=now,
+            )
+
+        queryset = cls.objects.filter(pk__in=pks, status=cls.STATUS_PROCESSING, locked_by=worker_id)
+        events = list(queryset.order_by("created_at", "pk"))
+        cls._process_batch(events, dispatcher)
+        return len(events)
+
+    @classmethod
+    def apply_subscription_events(cls, events):
+        """
+        Write the subscriptions of a batch of events with a single bulk upsert.
+
+        Events are grouped by subscription and their payloads are merged in
+        'event_time' order, so each subscription is written once with its
+        latest state. For the applied events the built-in
+        'subscription_event' receiver is recorded as succeeded, so processing
+        them only runs the other receivers.
+        Returns the number of subscriptions written.
+        """
+        groups = {}
+        for event in events:
+            subscription_id = event.payload.get("subscription_id")
+            if event.alert_name in SUBSCRIPTION_ALERTS and subscription_id not in (None, ""):
+                groups.setdefault(str(subscription_id), []).append(event)
+
+        rows, applied = [], []
+        for subscription_id, group in groups.items():
+            try:
+                rows.append(Subscription._sanitize_webhook_payload(_merge_payloads(group)))
+            except Exception:
+                log.exception("Coalescing events of subscription {0} failed.".format(subscription_id))
+                continue
+            applied.extend(group)
+
+        if not rows:
+            return 0
+
+        name = receiver_name(subscription_event)
+        try:
+            with transaction.atomic():
+                count = Subscription.bulk_upsert(rows)
+                WebhookReceiverResult.objects.bulk_create(
+                    [
+                        WebhookReceiverResult(
+                            event=event, receiver=name, status=WebhookReceiverResult.STATUS_SUCCEEDED, attempts=1
+                        )
+                        for event in applied
+                    ],
+                    ignore_conflicts=True,
+                )
+        except Exception:
+            # the events are applied one by one when they are processed
+            log.exception("Applying coalesced subscription events failed.")
+            return 0
+        return count
+
+    @classmethod
+    def _process_batch(cls, events, dispatcher=None, coalesce=False):
+        if coalesce:
+            cls.apply_subscription_events(events)
+        if dispatcher is None:
+            for event in events:
+                event.process()
+        else:
+            dispatcher.dispatch(events)
+
+    def process(self, sender=None, only=None):
+        """
+        Send the django signal for this event and record the outcome of each
+        receiver. Receivers that succeeded before are not run again, dead
+        receivers only if `only` names them (i.e. when replayed). `only`
+        restricts the receivers to run further.
+        The signal is sent by `sender`, PaddleWebhookView by default like
+        for webhooks processed by the view.
+        Returns whether all receivers succeeded.
+        """
+        from .views import PaddleWebhookView
+
+        results = self._receiver_results()
+        outcomes = get_receiver_pool().send(
+            getattr(signals, self.alert_name),
+            sender=sender or PaddleWebhookView,
+            skip=self._skipped_receivers(results, only),
+            only=only,
+            payload=self.payload,
+        )
+        return self._record_outcomes(results, outcomes)
+
+    async def aprocess(self, sender=None):
+        """
+        Async variant of process(). Coroutine receivers are awaited on the
+        event loop, queries and other receivers run in the async database
+        threads.
+        """
+        from .views import PaddleWebhookView
+
+        results = await run_in_db_thread(self._receiver_results)
+        outcomes = await get_receiver_pool().asend(
+            getattr(signals, self.alert_name),
+            sender=sender or PaddleWebhookView,
+            skip=self._skipped_receivers(results),
+            payload=self.payload,
+        )
+        return await run_in_db_thread(self._record_outcomes, results, outcomes)
+
+    def _receiver_results(self):
+        return {result.receiver: result for result in self.receiver_results.order_by("pk")}
+
+    def _skipped_receivers(self, results, only=None):
+        skip = set()
+        for name, result in results.items():
+            if result.status == WebhookReceiverResult.STATUS_SUCCEEDED or (
+                result.status == WebhookReceiverResult.STATUS_DEAD and (only is None or name not in only)
+            ):
+                skip.add(name)
+        return skip
+
+    def _record_outcomes(self, results, outcomes):
+        WebhookReceiverResult.record(self, outcomes, results)
+
+        for outcome in outcomes:
+            if outcome.error is not None:
+                log.error(
+                    "Receiver {0} of webhook event {1} ({2}) failed.".format(
+                        outcome.receiver, self.pk, self.alert_name
+                    ),
+                    exc_info=outcome.error,
+                )
+
+        errors = [
+            "{0}: {1}".format(result.receiver, result.error)
+            for result in results.values()
+            if result.status != WebhookReceiverResult.STATUS_SUCCEEDED
+        ]
+        if errors:
+            self._mark_failed("\n".join(errors))
+            return False
+
+        self._mark_processed()
+        return True
+
+    def _mark_failed(self, error):
+        self.status = self.STATUS_FAILED
+        self.error = error
+        self.locked_at = None
+        self.save(update_fields=["status", "error", "locked_at", "updated_at"])
+
+    def _mark_processed(self):
+        self.status = self.STATUS_PROCESSED
+        self.error = ""
+        self.locked_at = None
+        self.processed_at = timezone.now()
+        self.save(update_fields=["status", "error", "locked_at", "processed_at", "updated_at"])
+        _remember_alert(self.alert_id)
+
+    def __str__(self):
+        return "{}:{}".format(self.alert_name, self.alert_id)
+
+
+class WebhookReceiverResult(PaddleBaseModel):
+    """
+    'WebhookReceiverResult' is the outcome of a single signal receiver for a
+    webhook event, so processing the event again only re-runs the receivers
+    that failed.
+    """
+
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+    STATUS_DEAD = "dead"
+    STATUS_CHOICES = (
+        (STATUS_SUCCEEDED, _("succeeded")),
+        (STATUS_FAILED, _("failed")),
+        (STATUS_DEAD, _("dead")),
+    )
+
+    event = models.ForeignKey(WebhookEvent, on_delete=models.CASCADE, related_name="receiver_results")
+    receiver = models.CharField(max_length=255)
+    status = models.CharField(choices=STATUS_CHOICES, max_length=16)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        unique_together = ("event", "receiver")
+
+    @classmethod
+    def record(cls, event, outcomes, results=None):
+        """
+        Record an attempt of each receiver. Failed receivers are scheduled for
+        a retry, or moved to the dead letters once they run out of attempts.
+        `results` are the results of the event by receiver name, fetched
+        unless given, and are updated in place. The results are written in
+        bulk, dead letters are only touched when a receiver dies or recovers.
+        """
+        if results is None:
+            results = event._receiver_results()
+        now = timezone.now()
+        created, updated, dead, recovered = [], [], [], []
+        for outcome in outcomes:
+            result = results.get(outcome.receiver)
+            if result is None:
+                result = results[outcome.receiver] = cls(event=event, receiver=outcome.receiver)
+                created.append(result)
+            else:
+                updated.append(result)
+            previous = result.status
+            result._record_attempt(outcome.error, now)
+            if previous == cls.STATUS_DEAD and result.status == cls.STATUS_SUCCEEDED:
+                recovered.append(result.receiver)
+            elif previous != cls.STATUS_DEAD and result.status == cls.STATUS_DEAD:
+                dead.append(result)
+
+        if created:
+            cls.objects.bulk_create(created)
+        if updated:
+            cls.objects.bulk_update(updated, ["status", "error", "attempts", "next_attempt_at", "updated_at"])
+        if recovered:
+            WebhookDeadLetter.objects.filter(event=event, receiver__in=recovered, replayed_at=None).update(
+                replayed_at=now, updated_at=now
+            )
+        for result in dead:
+            WebhookDeadLetter.objects.update_or_create(
+                event=event,
+                receiver=result.receiver,
+                defaults={"error": result.error, "attempts": result.attempts, "replayed_at": None},
+            )
+
+    def _record_attempt(self, error, now):
+        self.attempts += 1
+        self.updated_at = now
+        if error is None:
+            self.status = self.STATUS_SUCCEEDED
+            self.error = ""
+            self.next_attempt_at = None
+        elif self.attempts >= settings.DJPADDLE_RECEIVER_MAX_ATTEMPTS:
+            self.status = self.STATUS_DEAD
+            self.error = str(error)
+            self.next_attempt_at = None
+        else:
+            self.status = self.STATUS_FAILED
+            self.error = str(error)
+            self.next_attempt_at = now + timedelta(seconds=retry_delay(self.attempts))
+
+    def __str__(self):
+        return "{}:{}".format(self.event, self.receiver)
+
+
+class WebhookDeadLetter(PaddleBaseModel):
+    """
+    'WebhookDeadLetter' is a receiver that kept failing for a webhook event
+    until it ran out of attempts. It is only run again when replayed.
+    """
+
+    event = models.ForeignKey(WebhookEvent, on_delete=models.CASCADE, related_name="dead_letters")
+    receiver = models.CharField(max_length=255)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    replayed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        unique_together = ("event", "receiver")
+
+    def replay(self):
+        """
+        Run the receiver for the event again and return whether it succeeded.
+        """
+        self.event.process(only={self.receiver})
+        self.refresh_from_db()
+        return self.replayed_at is not None
+
+    def __str__(self):
+        return "{}:{}".format(self.event, self.receiver)
+
+
+def _merge_payloads(events):
+    """
+    Merge the payloads of events in 'event_time' order, later values win.
+    """
+    payload = {}
+    # the sort is stable, so events of the same second keep the order they were received in
+    for event in sorted(events, key=lambda event: event.payload.get("event_time") or ""):
+        for key, value in event.payload.items():
+            # e.g. 'new_status' of a later event overrides 'status' of an earlier one
+            payload[key[4:] if key.startswith("new_") else key] = value
+    return payload
+
+
+def _supports_conditional_upsert():
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        # UPSERT is available since SQLite 3.24
+        return connection.Database.sqlite_version_info >= (3, 24, 0)
+    return False
+
+
+def _supports_returning():
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        # RETURNING is available since SQLite 3.35
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def _supports_update_from():
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        # UPDATE ... FROM is available since SQLite 3.33
+        return connection.Database.sqlite_version_info >= (3, 33, 0)
+    return False
+
+
+def _alert_cache_key(alert_id):
+    return "djpaddle:alert:{0}".format(alert_id)
+
+
+def _is_known_alert(alert_id):
+    if settings.DJPADDLE_WEBHOOK_DEDUP_CACHE is None:
+        return False
+    return caches[settings.DJPADDLE_WEBHOOK_DEDUP_CACHE].get(_alert_cache_key(alert_id)) is not None
+
+
+def _remember_alert(alert_id):
+    if settings.DJPADDLE_WEBHOOK_DEDUP_CACHE is None or alert_id is None:
+        return
+    cache = caches[settings.DJPADDLE_WEBHOOK_DEDUP_CACHE]
+    cache.set(_alert_cache_key(alert_id), 1, settings.DJPADDLE_WEBHOOK_DEDUP_TIMEOUT)
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+def invalidate_plan_cache(sender, *args, **kwargs):
+    plan_cache.invalidate()
+
+
+@receiver(pre_save, sender=settings.DJPADDLE_SUBSCRIBER_MODEL)
+def remember_subscriber_email(sender, instance, *args, update_fields=None, **kwargs):
+    # the cached subscribers of the previous email are invalidated as well
+    if instance.pk is None or (update_fields is not None and "email" not in update_fields):
+        return
+    if not settings.DJPADDLE_SUBSCRIBER_CACHE_TIMEOUT or not mappers.subscribers_cached_by_email():
+        return
+    instance._djpaddle_previous_email = (
+        sender._default_manager.filter(pk=instance.pk).values_list("email", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=settings.DJPADDLE_SUBSCRIBER_MODEL)
+@receiver(post_delete, sender=settings.DJPADDLE_SUBSCRIBER_MODEL)
+def invalidate_subscriber_cache(sender, instance, *args, update_fields=None, **kwargs):
+    # logins only touch 'last_login', which doesn't change the mapping
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    emails = [getattr(instance, "email", None)]
+    if "_djpaddle_previous_email" in instance.__dict__:
+        emails.append(instance.__dict__.pop("_djpaddle_previous_email"))
+    mappers.invalidate_subscriber_cache(*emails)
+
+
+def _subscriber_pk(data):
+    # sanitized webhook data holds 'subscriber_id', other rows may hold 'subscriber'
+    if data.get("subscriber_id") is not None:
+        return data["subscriber_id"]
+    return getattr(data.get("subscriber"), "pk", None)
+
+
+def _invalidate_entitlements_on_commit(subscribers):
+    """
+    Drop the cached entitlements of `subscribers` (instances or pks, None
+    for unlinked subscriptions) once the transaction is committed, those of
+    all subscribers if `subscribers` is None.
+    """
+    # invalidating earlier would let concurrent readers cache the old state
+    if subscribers is None:
+        transaction.on_commit(entitlements.entitlement_cache.invalidate)
+        return
+    subscribers = [subscriber for subscriber in subscribers if subscriber is not None]
+    if subscribers:
+        transaction.on_commit(lambda: entitlements.invalidate(*subscribers))
+
+
+def _update_subscriptions(queryset, subscribers, **changes):
+    """
+    Update the subscriptions of `queryset` and drop the cached entitlements
+    of `subscribers` (see _invalidate_entitlements_on_commit) if any of them
+    changed. Queryset updates don't send post_save, so every update of
+    subscriptions outside of `bulk_upsert` has to go through here.
+    Returns the number of updated subscriptions.
+    """
+    updated = queryset.update(**changes)
+    if updated:
+        _invalidate_entitlements_on_commit(subscribers)
+    return updated
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscription_entitlements(sender, instance, *args, **kwargs):
+    _invalidate_entitlements_on_commit([instance.subscriber_id])
+
+
+@receiver([getattr(signals, alert_name) for alert_name in SUBSCRIPTION_ALERTS])
 def subscription_event(sender, payload, *args, **kwargs):
-    Subscription.create_or_update_by_payload(payload)
+    # a single upsert, the created subscription isn't needed
+    Subscription.bulk_upsert([Subscription._sanitize_webhook_payload(payload)])
+
+
+_stale_linking = threading.local()
+
+
+@contextmanager
+def suspend_stale_linking(link=True):
+    """
+    Don't link stale subscriptions to each subscriber created within the
+    block, e.g. while importing subscribers. Unless `link` is False (or
+    'DJPADDLE_LINK_STALE_SUBSCRIPTIONS' is disabled), all stale subscriptions
+    are linked at once when the block is left.
+    """
+    previous = getattr(_stale_linking, "suspended", False)
+    _stale_linking.suspended = True
+    try:
+        yield
+    finally:
+        _stale_linking.suspended = previous
+    if link and not previous and settings.DJPADDLE_LINK_STALE_SUBSCRIPTIONS:
+        Subscription.link_stale_subscriptions()
 
 
 if settings.DJPADDLE_LINK_STALE_SUBSCRIPTIONS:
 
     @receiver(post_save, sender=settings.DJPADDLE_SUBSCRIBER_MODEL)
     def link_stale_subscriptions_to_subscriber(sender, instance, created, *args, **kwargs):
-        if created:
+        if created and not getattr(_stale_linking, "suspended", False):
             queryset = Subscription.objects.filter(subscriber=None)
             queryset = mappers.get_subscriptions_by_subscriber(instance, queryset)
-            queryset.update(subscriber=instance)
+            _update_subscriptions(queryset, [instance], subscriber=instance)
 
 
 def convert_datetime_strings_to_datetimes(data, model):
-    datetime_fields = [field.name for field in model._meta.get_fields() if isinstance(field, models.DateTimeField)]
-    for field in datetime_fields:
-        if field not in data:
-            continue
-
-        try:
-            data[field] = datetime.strptime(data[field], PADDLE_DATETIME_FORMAT)
-        except ValueError:
-            # Some fields such as next_bill_date should perhaps be
-            # a DateField not DatetimeField
-            data[field] = datetime.strptime(data[field], PADDLE_DATE_FORMAT)
-
-        if djsettings.USE_TZ:
-            local_time_zone = timezone.get_default_timezone()
-            data[field] = timezone.make_aware(data[field], local_time_zone)
-
-    return data
+    return get_mapper(model).convert_datetimes(data)
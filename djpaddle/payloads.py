@@ -0,0 +1,149 @@
+"""
+Mapping of Paddle payloads onto model fields.
+
+The field metadata of a model is compiled once (at app ready) into a
+`PayloadMapper`, so sanitising a payload is a single pass over its keys
+without walking `Model._meta` again.
+"""
+import functools
+import re
+from datetime import datetime
+
+from django.conf import settings as djsettings
+from django.core.signals import setting_changed
+from django.db import models
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .utils import PADDLE_DATE_FORMAT, PADDLE_DATETIME_FORMAT
+
+_mappers = {}
+
+
+# both Paddle formats, PADDLE_DATETIME_FORMAT and PADDLE_DATE_FORMAT
+_PADDLE_DATETIME = re.compile(r"(\d{4})-(\d{2})-(\d{2})(?: (\d{2}):(\d{2}):(\d{2}))?\Z", re.ASCII)
+_fromisoformat = getattr(datetime, "fromisoformat", None)
+
+
+@functools.lru_cache(maxsize=None)
+def _default_timezone():
+    """
+    Return the default timezone (None without USE_TZ) and whether datetimes
+    can be made aware by simply setting it, like make_aware does for UTC and
+    non-pytz timezones.
+    """
+    if not djsettings.USE_TZ:
+        return None, False
+    tz = timezone.get_default_timezone()
+    return tz, not hasattr(tz, "localize") or getattr(tz, "zone", None) == "UTC"
+
+
+@receiver(setting_changed)
+def _reset_default_timezone(setting, **kwargs):
+    if setting in ("TIME_ZONE", "USE_TZ"):
+        _default_timezone.cache_clear()
+
+
+def _strptime(value):
+    try:
+        return datetime.strptime(value, PADDLE_DATETIME_FORMAT)
+    except ValueError:
+        # Some fields such as next_bill_date should perhaps be
+        # a DateField not DatetimeField
+        return datetime.strptime(value, PADDLE_DATE_FORMAT)
+
+
+def parse_datetime(value):
+    """
+    Parse a Paddle datetime (or date) string, made aware in the default
+    timezone if USE_TZ is enabled. Raises ValueError for other values.
+    """
+    match = _PADDLE_DATETIME.match(value)
+    if match is None:
+        # e.g. unpadded values, which strptime accepts as well
+        value = _strptime(value)
+    elif _fromisoformat is not None:
+        # the match guarantees one of the two formats fromisoformat understands
+        value = _fromisoformat(value)
+    else:  # pragma: no cover (python < 3.7)
+        value = datetime(*[int(part) for part in match.groups() if part is not None])
+
+    tz, replace = _default_timezone()
+    if tz is None:
+        return value
+    if replace:
+        return value.replace(tzinfo=tz)
+    return timezone.make_aware(value, tz)
+
+
+class PayloadMapper:
+    """
+    Compiled field metadata of a model:
+
+    - `field_names`, the names of all fields of the model
+    - `required_field_names`, the fields without a usable default that must
+      be given in order to insert a row
+    - `datetime_fields`, (name, parser) of the fields holding datetimes
+    - `keys`, the translation of payload keys (including their 'new_'
+      variant, e.g. 'new_status') to (field name, parser)
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.field_names = frozenset(field.name for field in model._meta.get_fields())
+        self.datetime_fields = tuple(
+            (field.name, parse_datetime)
+            for field in model._meta.get_fields()
+            if isinstance(field, models.DateTimeField)
+        )
+        self.required_field_names = frozenset(
+            field.name
+            for field in model._meta.concrete_fields
+            if not field.null
+            and field.get_default() is None
+            and not field.primary_key
+            and not getattr(field, "auto_now", False)
+            and not getattr(field, "auto_now_add", False)
+        )
+        parsers = dict(self.datetime_fields)
+        self.keys = {}
+        for name in self.field_names:
+            self.keys[name] = self.keys["new_" + name] = (name, parsers.get(name))
+
+    def sanitize(self, payload, data=None):
+        """
+        Add the values of all payload keys matching a field to `data`,
+        parsing datetimes on the way.
+        """
+        data = {} if data is None else data
+        keys = self.keys
+        for key, value in payload.items():
+            target = keys.get(key)
+            if target is not None:
+                name, parser = target
+                data[name] = value if parser is None else parser(value)
+        return data
+
+    def convert_datetimes(self, data):
+        """
+        Parse the datetime fields of already sanitised `data` in place.
+        """
+        for name, parser in self.datetime_fields:
+            if name in data:
+                data[name] = parser(data[name])
+        return data
+
+
+def compile_mappers(models):
+    """
+    Compile the mappers of `models` up front, called by the app config.
+    """
+    for model in models:
+        _mappers[model] = PayloadMapper(model)
+
+
+def get_mapper(model):
+    mapper = _mappers.get(model)
+    if mapper is None:
+        mapper = _mappers[model] = PayloadMapper(model)
+    return mapper
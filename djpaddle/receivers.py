@@ -0,0 +1,271 @@
+"""
+Isolated execution of the receivers of a djpaddle signal.
+
+Every receiver runs on its own, optionally concurrently on a bounded thread
+pool with a timeout. Like `Signal.send_robust` a failing receiver doesn't
+prevent the others from running, its exception is returned instead.
+"""
+import asyncio
+import copy
+import inspect
+import random
+import threading
+import weakref
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+
+from . import settings
+from .async_utils import run_in_db_thread
+
+try:
+    from asgiref.sync import async_to_sync
+except ImportError:  # pragma: no cover
+    # django < 3.0 doesn't install asgiref, nor does it run coroutine receivers
+    async_to_sync = None
+
+# 'error' is None for receivers that succeeded
+ReceiverOutcome = namedtuple("ReceiverOutcome", ["receiver", "error"])
+
+
+class ReceiverTimeout(Exception):
+    """
+    The receiver didn't finish within 'DJPADDLE_RECEIVER_TIMEOUT' seconds.
+    """
+
+
+def receiver_name(receiver, dispatch_uid=None):
+    """
+    Return the name identifying a receiver across processes: its string
+    `dispatch_uid` if it was connected with one, its dotted path otherwise.
+    """
+    if dispatch_uid is not None:
+        return dispatch_uid
+    name = getattr(receiver, "__qualname__", None) or type(receiver).__qualname__
+    return "{0}.{1}".format(receiver.__module__, name)
+
+
+def live_receivers(signal, sender):
+    receivers = signal._live_receivers(sender)
+    if isinstance(receivers, tuple):
+        # django >= 5.0 returns sync and async receivers separately
+        receivers = list(receivers[0]) + list(receivers[1])
+    return receivers
+
+
+def _dispatch_uids(signal):
+    # (receiver, dispatch_uid) of the receivers connected with a string
+    # dispatch_uid, other lookup keys are ids which differ between processes
+    uids = []
+    for entry in signal.receivers:
+        lookup_key, receiver = entry[0], entry[1]
+        if not isinstance(lookup_key[0], str):
+            continue
+        if isinstance(receiver, weakref.ReferenceType):
+            receiver = receiver()
+        if receiver is not None:
+            uids.append((receiver, lookup_key[0]))
+    return uids
+
+
+def _named_receivers(signal, sender):
+    uids = _dispatch_uids(signal)
+    receivers = []
+    for receiver in live_receivers(signal, sender):
+        dispatch_uid = next((uid for r, uid in uids if r == receiver), None)
+        receivers.append((receiver_name(receiver, dispatch_uid), receiver))
+    return receivers
+
+
+def colliding_receiver_names(signal, sender):
+    """
+    Return the names shared by several live receivers of `signal`.
+    """
+    names = [name for name, _receiver in _named_receivers(signal, sender)]
+    return sorted({name for name in names if names.count(name) > 1})
+
+
+def named_receivers(signal, sender):
+    """
+    Return (name, receiver) of the live receivers of `signal`. Raises
+    ImproperlyConfigured if two receivers share a name, e.g. bound methods
+    of two instances of a class, as their outcomes couldn't be told apart.
+    Receivers connected by then are checked on startup already (see checks).
+    """
+    receivers = _named_receivers(signal, sender)
+    names = set()
+    for name, _receiver in receivers:
+        if name in names:
+            raise ImproperlyConfigured(
+                "Several receivers of {0} are named '{1}', connect them with a "
+                "unique dispatch_uid.".format(signal, name)
+            )
+        names.add(name)
+    return receivers
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+def _call(receiver, signal, sender, named):
+    response = receiver(signal=signal, sender=sender, **named)
+    if inspect.isawaitable(response):
+        response = async_to_sync(_await)(response)
+    return response
+
+
+def _call_in_thread(receiver, signal, sender, named):
+    # pool threads outlive requests, so they drop stale connections themselves
+    close_old_connections()
+    try:
+        return _call(receiver, signal, sender, named)
+    finally:
+        close_old_connections()
+
+
+def retry_delay(attempts):
+    """
+    Return the seconds to wait before running a receiver again that failed
+    `attempts` times: exponential backoff with jitter, so receivers failing
+    together (e.g. during an outage) don't retry in lockstep.
+    """
+    delay = min(
+        settings.DJPADDLE_RECEIVER_RETRY_MAX_DELAY,
+        settings.DJPADDLE_RECEIVER_RETRY_DELAY * 2 ** (attempts - 1),
+    )
+    return random.uniform(delay / 2, delay)
+
+
+class ReceiverPool:
+    """
+    Run the receivers of a signal on up to `max_workers` threads, waiting at
+    most `timeout` seconds for all of them. With `max_workers=0` receivers
+    run one after another in the calling thread and are not timed out.
+    A receiver that timed out keeps running in its thread and may still
+    complete, e.g. while it is already retried.
+    """
+
+    def __init__(self, max_workers=4, timeout=None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def send(self, signal, sender, skip=(), only=None, **named):
+        """
+        Send `signal` to all receivers whose name is not in `skip` (and in
+        `only` if given) and return a ReceiverOutcome for each of them.
+        Every receiver gets its own copy of the `named` arguments, so one
+        receiver changing the payload doesn't affect the others.
+        """
+        return self._send(self._receivers(signal, sender, skip, only), signal, sender, named)
+
+    async def asend(self, signal, sender, skip=(), only=None, **named):
+        """
+        Async variant of send(). Coroutine receivers are awaited on the
+        running event loop, the others run in the async database threads.
+        """
+        receivers = self._receivers(signal, sender, skip, only)
+        if not self.max_workers:
+            outcomes = []
+            for name, receiver in receivers:
+                if asyncio.iscoroutinefunction(receiver):
+                    outcomes.append(await self._arun(name, receiver, signal, sender, named))
+                else:
+                    outcomes.append(await run_in_db_thread(self._run, name, receiver, signal, sender, named))
+            return outcomes
+
+        sync_receivers = [(name, r) for name, r in receivers if not asyncio.iscoroutinefunction(r)]
+        async_receivers = [(name, r) for name, r in receivers if asyncio.iscoroutinefunction(r)]
+        results = await asyncio.gather(
+            run_in_db_thread(self._send, sync_receivers, signal, sender, named),
+            *[self._arun(name, receiver, signal, sender, named) for name, receiver in async_receivers]
+        )
+        by_name = {outcome.receiver: outcome for outcome in results[0] + list(results[1:])}
+        return [by_name[name] for name, _receiver in receivers]
+
+    def _receivers(self, signal, sender, skip, only):
+        return [
+            (name, r)
+            for name, r in named_receivers(signal, sender)
+            if name not in skip and (only is None or name in only)
+        ]
+
+    def _send(self, receivers, signal, sender, named):
+        if not self.max_workers or len(receivers) <= 1:
+            return [self._run(name, r, signal, sender, named) for name, r in receivers]
+
+        executor = self._get_executor()
+        futures = [
+            (name, executor.submit(_call_in_thread, receiver, signal, sender, copy.deepcopy(named)))
+            for name, receiver in receivers
+        ]
+        # a single deadline for the whole batch, rather than one per receiver
+        wait([future for _name, future in futures], timeout=self.timeout)
+        return [self._result(name, future) for name, future in futures]
+
+    def _run(self, name, receiver, signal, sender, named):
+        try:
+            _call(receiver, signal, sender, copy.deepcopy(named))
+        except Exception as e:
+            return ReceiverOutcome(name, e)
+        return ReceiverOutcome(name, None)
+
+    async def _arun(self, name, receiver, signal, sender, named):
+        try:
+            response = receiver(signal=signal, sender=sender, **copy.deepcopy(named))
+            if self.max_workers and self.timeout is not None:
+                # unlike threads, coroutines are cancelled when they time out
+                await asyncio.wait_for(response, self.timeout)
+            else:
+                await response
+        except asyncio.TimeoutError:
+            return ReceiverOutcome(name, ReceiverTimeout("timed out after {0} seconds".format(self.timeout)))
+        except Exception as e:
+            return ReceiverOutcome(name, e)
+        return ReceiverOutcome(name, None)
+
+    def _result(self, name, future):
+        if not future.done():
+            # the receiver keeps running in its thread, its result is ignored
+            return ReceiverOutcome(name, ReceiverTimeout("timed out after {0} seconds".format(self.timeout)))
+        try:
+            future.result()
+        except Exception as e:
+            return ReceiverOutcome(name, e)
+        return ReceiverOutcome(name, None)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="djpaddle-receiver"
+                )
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+_pool = None
+
+
+def get_receiver_pool():
+    """
+    Return the receiver pool shared by the process, rebuilt if its settings
+    have been changed.
+    """
+    global _pool
+    max_workers, timeout = settings.DJPADDLE_RECEIVER_THREADS, settings.DJPADDLE_RECEIVER_TIMEOUT
+    pool = _pool
+    if pool is None or (pool.max_workers, pool.timeout) != (max_workers, timeout):
+        if pool is not None:
+            pool.shutdown()
+        pool = _pool = ReceiverPool(max_workers=max_workers, timeout=timeout)
+    return pool
@@ -0,0 +1,189 @@
+"""
+Reconciliation of local subscriptions with Paddle's view of them.
+
+Both sides are streamed in subscription id order and merge-joined, so memory
+use is bounded by the page and chunk sizes rather than the number of
+subscriptions.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from django.conf import settings as djsettings
+from django.db import transaction
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import Subscription, _update_subscriptions
+from .sync import MAX_RESULTS_PER_PAGE, iter_subscription_pages, subscription_payload_from_api, write_subscriptions
+from .utils import PADDLE_DATE_FORMAT
+
+DRIFT_CHANGED = "changed"
+DRIFT_MISSING_LOCAL = "missing_local"
+DRIFT_MISSING_REMOTE = "missing_remote"
+
+RECONCILED_FIELDS = ("status", "next_bill_date", "quantity", "unit_price", "plan")
+
+Drift = namedtuple("Drift", ["kind", "subscription_id", "fields", "local", "remote"])
+Drift.__doc__ = """
+A difference between a local subscription and Paddle. 'fields' maps the
+names of drifted fields to their (local, remote) values.
+"""
+
+
+def subscription_order_key(subscription_id):
+    """
+    Order subscription ids numerically, matching the order of
+    `local_subscriptions`.
+    """
+    subscription_id = str(subscription_id)
+    return len(subscription_id), subscription_id
+
+
+def local_subscriptions(queryset=None, chunk_size=2000):
+    """
+    Stream the subscriptions Paddle lists (i.e. all but deleted ones) in
+    subscription id order.
+    """
+    if queryset is None:
+        queryset = Subscription.objects.all()
+    queryset = queryset.exclude(status=Subscription.STATUS_DELETED)
+    return queryset.order_by(Length("id"), "id").iterator(chunk_size=chunk_size)
+
+
+def remote_subscriptions(pages):
+    """
+    Flatten pages of the Paddle subscription users listing, making sure they
+    arrive in subscription id order.
+    """
+    last_key = None
+    for page in pages:
+        for row in sorted(page, key=lambda row: subscription_order_key(row["subscription_id"])):
+            key = subscription_order_key(row["subscription_id"])
+            if last_key is not None and key <= last_key:
+                raise ValueError("Paddle subscriptions are not listed in subscription id order")
+            last_key = key
+            yield row
+
+
+def _remote_values(row):
+    payload = subscription_payload_from_api(row)
+    next_bill_date = datetime.strptime(payload["next_bill_date"], PADDLE_DATE_FORMAT).date()
+    return {
+        "status": payload["status"],
+        "next_bill_date": next_bill_date,
+        "quantity": payload["quantity"],
+        "unit_price": round(payload["unit_price"], 2),
+        "plan": str(payload["subscription_plan_id"]),
+    }
+
+
+def _local_values(subscription):
+    next_bill_date = subscription.next_bill_date
+    if djsettings.USE_TZ:
+        next_bill_date = timezone.localtime(next_bill_date, timezone.get_default_timezone())
+    return {
+        "status": subscription.status,
+        "next_bill_date": next_bill_date.date(),
+        "quantity": subscription.quantity,
+        "unit_price": round(subscription.unit_price, 2),
+        "plan": str(subscription.plan_id),
+    }
+
+
+def compare(subscription, row):
+    """
+    Return the drifted fields of a local subscription and a row of the Paddle
+    subscription users listing.
+    """
+    local, remote = _local_values(subscription), _remote_values(row)
+    return {name: (local[name], remote[name]) for name in RECONCILED_FIELDS if local[name] != remote[name]}
+
+
+def find_drift(remote_rows, local):
+    """
+    Merge-join Paddle's subscriptions with local ones, both ordered by
+    `subscription_order_key`, and yield a `Drift` for every difference.
+    """
+    remote_rows, local = iter(remote_rows), iter(local)
+    row, subscription = next(remote_rows, None), next(local, None)
+    while row is not None or subscription is not None:
+        remote_key = row and subscription_order_key(row["subscription_id"])
+        local_key = subscription and subscription_order_key(subscription.pk)
+
+        if subscription is None or (row is not None and remote_key < local_key):
+            yield Drift(DRIFT_MISSING_LOCAL, str(row["subscription_id"]), {}, None, row)
+            row = next(remote_rows, None)
+        elif row is None or local_key < remote_key:
+            yield Drift(DRIFT_MISSING_REMOTE, subscription.pk, {}, subscription, None)
+            subscription = next(local, None)
+        else:
+            fields = compare(subscription, row)
+            if fields:
+                yield Drift(DRIFT_CHANGED, subscription.pk, fields, subscription, row)
+            row, subscription = next(remote_rows, None), next(local, None)
+
+
+def _repair(drifts, listed_at):
+    deleted, rows = [], []
+    for drift in drifts:
+        if drift.kind == DRIFT_MISSING_REMOTE:
+            deleted.append(drift.local)
+        else:
+            data = Subscription._sanitize_webhook_payload(subscription_payload_from_api(drift.remote))
+            data["id"] = str(data["id"])
+            rows.append(data)
+
+    if deleted:
+        # Paddle only lists subscriptions which have not been cancelled; like
+        # the upsert the deletion doesn't override webhooks of later events
+        with transaction.atomic():
+            queryset = Subscription.objects.filter(
+                pk__in=[subscription.pk for subscription in deleted], event_time__lt=listed_at
+            )
+            _update_subscriptions(
+                queryset,
+                [subscription.subscriber_id for subscription in deleted],
+                status=Subscription.STATUS_DELETED,
+                event_time=listed_at,
+                updated_at=timezone.now(),
+            )
+    if rows:
+        write_subscriptions(rows, listed_at)
+
+
+def repair_drift(drifts, chunk_size=500, listed_at=None):
+    """
+    Apply Paddle's view to local subscriptions in chunks of `chunk_size`
+    while passing the drifts through. Drifted subscriptions are updated,
+    subscriptions missing locally are created and subscriptions no longer
+    listed by Paddle are marked deleted.
+
+    Paddle's view is written as of `listed_at` (now by default), the time
+    before Paddle's subscriptions were listed: subscriptions updated by a
+    webhook of a later event are kept.
+    """
+    listed_at = listed_at or timezone.now()
+    chunk = []
+    for drift in drifts:
+        chunk.append(drift)
+        if len(chunk) >= chunk_size:
+            _repair(chunk, listed_at)
+            chunk = []
+        yield drift
+    if chunk:
+        _repair(chunk, listed_at)
+
+
+def reconcile_subscriptions(
+    client=None, repair=False, queryset=None, chunk_size=500, workers=4, results_per_page=MAX_RESULTS_PER_PAGE
+):
+    """
+    Stream Paddle's subscriptions and local ones and yield a `Drift` for every
+    difference, optionally repairing it.
+    """
+    listed_at = timezone.now()
+    pages = iter_subscription_pages(client, results_per_page=results_per_page, workers=workers)
+    drifts = find_drift(remote_subscriptions(pages), local_subscriptions(queryset, chunk_size=chunk_size))
+    if repair:
+        drifts = repair_drift(drifts, chunk_size=chunk_size, listed_at=listed_at)
+    return drifts
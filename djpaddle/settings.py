@@ -32,6 +32,66 @@ DJPADDLE_SUBSCRIBER_MODEL = getattr(settings, "DJPADDLE_SUBSCRIBER_MODEL", setti
 
 DJPADDLE_LINK_STALE_SUBSCRIPTIONS = getattr(settings, "DJPADDLE_LINK_STALE_SUBSCRIPTIONS", True)
 
+# store verified webhooks in the inbox and process them outside of the request
+DJPADDLE_WEBHOOK_QUEUE = getattr(settings, "DJPADDLE_WEBHOOK_QUEUE", False)
+# seconds after which a claimed but unfinished webhook event may be claimed again
+DJPADDLE_WEBHOOK_LOCK_TIMEOUT = getattr(settings, "DJPADDLE_WEBHOOK_LOCK_TIMEOUT", 300)
+# cache alias used to detect redelivered webhooks before hitting the database
+DJPADDLE_WEBHOOK_DEDUP_CACHE = getattr(settings, "DJPADDLE_WEBHOOK_DEDUP_CACHE", None)
+DJPADDLE_WEBHOOK_DEDUP_TIMEOUT = getattr(settings, "DJPADDLE_WEBHOOK_DEDUP_TIMEOUT", 60 * 60 * 24)
+# days processed webhook events are kept by djpaddle_prune_webhooks
+DJPADDLE_WEBHOOK_RETENTION_DAYS = getattr(settings, "DJPADDLE_WEBHOOK_RETENTION_DAYS", 30)
+
+# cache alias used to share plans between processes, None keeps them process local
+DJPADDLE_PLAN_CACHE = getattr(settings, "DJPADDLE_PLAN_CACHE", "default")
+# number of plans kept in memory by each process
+DJPADDLE_PLAN_CACHE_SIZE = getattr(settings, "DJPADDLE_PLAN_CACHE_SIZE", 128)
+DJPADDLE_PLAN_CACHE_TIMEOUT = getattr(settings, "DJPADDLE_PLAN_CACHE_TIMEOUT", 60 * 60)
+# seconds a process serves plans from memory before checking the shared cache for invalidations
+DJPADDLE_PLAN_CACHE_VERSION_TTL = getattr(settings, "DJPADDLE_PLAN_CACHE_VERSION_TTL", 5)
+
+# cache alias used to lock plan fetches across processes, None only locks within a process
+DJPADDLE_LOCK_CACHE = getattr(settings, "DJPADDLE_LOCK_CACHE", "default")
+# seconds to wait for another process fetching the same plan
+DJPADDLE_LOCK_TIMEOUT = getattr(settings, "DJPADDLE_LOCK_TIMEOUT", 30)
+# seconds a lock in the cache is held at most (in case its holder dies), must cover the locked work
+DJPADDLE_LOCK_TTL = getattr(settings, "DJPADDLE_LOCK_TTL", 60)
+
+# cache alias used to share resolved subscribers between processes, None keeps them process local
+DJPADDLE_SUBSCRIBER_CACHE = getattr(settings, "DJPADDLE_SUBSCRIBER_CACHE", "default")
+# number of resolved subscribers kept in memory by each process
+DJPADDLE_SUBSCRIBER_CACHE_SIZE = getattr(settings, "DJPADDLE_SUBSCRIBER_CACHE_SIZE", 1024)
+# seconds a resolved subscriber pk is cached, 0 disables the cache (misses included)
+DJPADDLE_SUBSCRIBER_CACHE_TIMEOUT = getattr(settings, "DJPADDLE_SUBSCRIBER_CACHE_TIMEOUT", 60 * 5)
+# seconds a payload without subscriber is cached
+DJPADDLE_SUBSCRIBER_CACHE_MISS_TIMEOUT = getattr(settings, "DJPADDLE_SUBSCRIBER_CACHE_MISS_TIMEOUT", 60)
+
+# subscription statuses that entitle a subscriber to the subscribed plan
+DJPADDLE_ENTITLED_STATUSES = getattr(settings, "DJPADDLE_ENTITLED_STATUSES", ("active", "trialing", "past_due"))
+# cache alias shared by all processes caching entitlements across requests, None only
+# memoises them per request; a per process cache (e.g. LocMemCache) would miss invalidations
+# (queryset updates of subscriptions outside of djpaddle don't invalidate entitlements,
+# call djpaddle.entitlements.invalidate() after them)
+DJPADDLE_ENTITLEMENTS_CACHE = getattr(settings, "DJPADDLE_ENTITLEMENTS_CACHE", None)
+# number of entitlements kept in memory by each process, only the process changing
+# a subscription drops them, so other processes may serve them until they expire
+DJPADDLE_ENTITLEMENTS_CACHE_SIZE = getattr(settings, "DJPADDLE_ENTITLEMENTS_CACHE_SIZE", 0)
+# seconds entitlements are cached, 0 disables the cache
+DJPADDLE_ENTITLEMENTS_CACHE_TIMEOUT = getattr(settings, "DJPADDLE_ENTITLEMENTS_CACHE_TIMEOUT", 60 * 5)
+
+# threads running the database queries of the async views, 0 uses django's sync_to_async
+DJPADDLE_ASYNC_DB_THREADS = getattr(settings, "DJPADDLE_ASYNC_DB_THREADS", 4)
+
+# threads running the receivers of a webhook concurrently, 0 runs them one after another
+DJPADDLE_RECEIVER_THREADS = getattr(settings, "DJPADDLE_RECEIVER_THREADS", 0)
+# seconds to wait for the receivers running in threads, None waits forever
+DJPADDLE_RECEIVER_TIMEOUT = getattr(settings, "DJPADDLE_RECEIVER_TIMEOUT", 30)
+# attempts of a failing receiver before the event is moved to the dead letters
+DJPADDLE_RECEIVER_MAX_ATTEMPTS = getattr(settings, "DJPADDLE_RECEIVER_MAX_ATTEMPTS", 5)
+# seconds before the first retry of a failed receiver, doubled for every further attempt
+DJPADDLE_RECEIVER_RETRY_DELAY = getattr(settings, "DJPADDLE_RECEIVER_RETRY_DELAY", 60)
+DJPADDLE_RECEIVER_RETRY_MAX_DELAY = getattr(settings, "DJPADDLE_RECEIVER_RETRY_MAX_DELAY", 60 * 60 * 6)
+
 
 DJPADDLE_SUBSCRIBER_BY_PAYLOAD = getattr(
     settings, "DJPADDLE_SUBSCRIBER_BY_PAYLOAD", "djpaddle.mappers.subscriber_by_payload"
@@ -0,0 +1,127 @@
+"""
+Import of subscriptions from the Paddle subscription users API.
+"""
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Subscription, paddle_client
+
+# the Paddle API returns at most 200 subscriptions per page
+MAX_RESULTS_PER_PAGE = 200
+
+# fields only known from webhooks, which an import must not overwrite
+WEBHOOK_ONLY_FIELDS = (
+    "id",
+    "subscriber",
+    "subscriber_id",
+    "checkout_id",
+    "passthrough",
+    "source",
+    "created_at",
+)
+
+ImportResult = namedtuple("ImportResult", ["created", "updated"])
+
+
+def iter_subscription_pages(client=None, results_per_page=MAX_RESULTS_PER_PAGE, workers=4, **filters):
+    """
+    Yield the pages of the Paddle subscription users listing in order.
+
+    Up to `workers` pages are fetched concurrently, so at most `workers`
+    pages are held in memory at any time. The listing ends with the first
+    page holding less than `results_per_page` subscriptions.
+    """
+    client = client or paddle_client
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        page = 1
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < workers:
+                future = executor.submit(
+                    client.list_subscriptions, page=page, results_per_page=results_per_page, **filters
+                )
+                pending.append(future)
+                page += 1
+            if not pending:
+                return
+
+            rows = pending.popleft().result()
+            if len(rows) < results_per_page:
+                exhausted = True
+            if rows:
+                yield rows
+
+
+def subscription_payload_from_api(row):
+    """
+    Translate a row of the Paddle subscription users listing into a webhook
+    payload understood by `Subscription._sanitize_webhook_payload`.
+    """
+    next_payment = row.get("next_payment") or {}
+    last_payment = row.get("last_payment") or {}
+    quantity = int(row.get("quantity") or 1)
+    amount = next_payment.get("amount", last_payment.get("amount", 0))
+    return {
+        "subscription_id": row["subscription_id"],
+        "subscription_plan_id": row["plan_id"],
+        "user_id": row.get("user_id"),
+        "email": row["user_email"],
+        "marketing_consent": bool(row.get("marketing_consent")),
+        "cancel_url": row.get("cancel_url", ""),
+        "update_url": row.get("update_url", ""),
+        "status": row["state"],
+        # replaced by the time of the listing when written
+        "event_time": row["signup_date"],
+        "next_bill_date": next_payment.get("date") or last_payment.get("date") or row["signup_date"][:10],
+        "currency": next_payment.get("currency") or last_payment.get("currency") or "",
+        "quantity": quantity,
+        "unit_price": float(amount) / quantity,
+    }
+
+
+def write_subscriptions(rows, listed_at=None):
+    """
+    Create or update subscriptions from sanitized data with a single upsert.
+
+    The data is Paddle's view of the subscriptions at `listed_at` (now by
+    default), which is written as their 'event_time'. Like webhooks of older
+    events the data doesn't overwrite subscriptions updated by a webhook of a
+    later event. Returns the number of created and updated subscriptions.
+    """
+    listed_at = listed_at or timezone.now()
+    rows = [dict(data, event_time=listed_at) for data in rows]
+    with transaction.atomic():
+        count, created = Subscription._bulk_upsert(rows, return_created=True, insert_only=WEBHOOK_ONLY_FIELDS)
+    return len(created), count - len(created)
+
+
+def import_subscriptions(client=None, results_per_page=MAX_RESULTS_PER_PAGE, workers=4, chunk_size=500, **filters):
+    """
+    Create or update local subscriptions from the Paddle API.
+
+    Pages are fetched concurrently and written in chunks of `chunk_size`
+    subscriptions, so memory use does not grow with the number of
+    subscriptions. Subscriptions updated by webhooks of events after the
+    import started are kept. Returns an `ImportResult` with the number of
+    created and updated subscriptions.
+    """
+    listed_at = timezone.now()
+    created = updated = 0
+    chunk = {}
+    for rows in iter_subscription_pages(client, results_per_page, workers, **filters):
+        for row in rows:
+            data = Subscription._sanitize_webhook_payload(subscription_payload_from_api(row))
+            data["id"] = str(data["id"])
+            chunk[data["id"]] = data
+            if len(chunk) >= chunk_size:
+                counts = write_subscriptions(list(chunk.values()), listed_at)
+                created, updated = created + counts[0], updated + counts[1]
+                chunk = {}
+    if chunk:
+        counts = write_subscriptions(list(chunk.values()), listed_at)
+        created, updated = created + counts[0], updated + counts[1]
+    return ImportResult(created, updated)
@@ -1,8 +1,10 @@
 import base64
-import collections
+import binascii
+from urllib.parse import parse_qsl
 
-import phpserialize
 from Crypto.PublicKey import RSA
+from django.conf import settings as djsettings
+from django.core.exceptions import TooManyFieldsSent
 
 try:
     from Crypto.Hash import SHA1
@@ -18,6 +20,8 @@ except ImportError:  # pragma: no cover
 PADDLE_DATE_FORMAT = "%Y-%m-%d"
 PADDLE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+SIGNATURE_FIELDS = ("p_signature", b"p_signature")
+
 
 def convert_pubkey_to_rsa(key):
     """
@@ -29,27 +33,112 @@ def convert_pubkey_to_rsa(key):
     return RSA.importKey(public_key_der)
 
 
-def is_valid_webhook(payload):
-    data = dict(payload)
-    signature = data.pop("p_signature", None)
-    if signature is None:
-        return False
+def php_serialize_strings(items, charset="utf-8"):
+    """
+    PHP serialize a sequence of (key, value) string pairs as an array in the
+    given order. Keys and values may be `str` or already encoded `bytes`.
+
+    The output is byte identical to `phpserialize.dumps` of an OrderedDict of
+    the same strings, without its recursive type dispatch.
+    """
+    parts = [b"a:%d:{" % len(items)]
+    for key, value in items:
+        if isinstance(key, str):
+            key = key.encode(charset)
+        if isinstance(value, str):
+            value = value.encode(charset)
+        parts.append(b's:%d:"%s";s:%d:"%s";' % (len(key), key, len(value), value))
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+class WebhookVerifier:
+    """
+    Verifies the signature of Paddle webhook payloads with Paddle's public key.
+
+    Verifiers hold no state between calls, a single instance can be shared by
+    all threads.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._verifier = PKCS1_v1_5.new(key)
+        self._signature_length = (key.size_in_bits() + 7) // 8
+
+    @staticmethod
+    def serialize(payload):
+        """
+        Serialize all payload fields but the signature the way Paddle signs
+        them: sorted by key, values as strings, PHP serialized.
+        """
+        items = sorted(
+            (key, value if isinstance(value, bytes) else str(value))
+            for key, value in payload.items()
+            if key not in SIGNATURE_FIELDS
+        )
+        return php_serialize_strings(items)
+
+    def verify(self, payload):
+        """
+        Verify a payload given either as decoded fields or as the raw fields
+        returned by `parse_webhook_body`.
+        """
+        signature = payload.get("p_signature", payload.get(b"p_signature"))
+        if signature is None:
+            return False
+
+        try:
+            signature = base64.b64decode(signature)
+        except (binascii.Error, ValueError):
+            return False
+        # reject malformed signatures before serializing the payload
+        if len(signature) != self._signature_length:
+            return False
 
-    # Ensure all the data fields are strings
-    for field in data:
-        data[field] = str(data[field])
+        digest = SHA1.new(self.serialize(payload))
+        return self._verifier.verify(digest, signature)
 
-    # Sort the data and serialize it
-    sorted_data = collections.OrderedDict(sorted(data.items()))
-    serialized_data = phpserialize.dumps(sorted_data)
 
-    # verify the data
-    digest = SHA1.new()
-    digest.update(serialized_data)
-    signature = base64.b64decode(signature)
+_verifier = None
 
+
+def get_webhook_verifier():
+    """
+    Return the shared `WebhookVerifier` for settings.DJPADDLE_KEY.
+    """
+    global _verifier
     from . import settings
 
-    verifier = PKCS1_v1_5.new(settings.DJPADDLE_KEY)
+    verifier = _verifier
+    if verifier is None or verifier.key is not settings.DJPADDLE_KEY:
+        verifier = _verifier = WebhookVerifier(settings.DJPADDLE_KEY)
+    return verifier
+
+
+def is_valid_webhook(payload):
+    return get_webhook_verifier().verify(payload)
+
 
-    return verifier.verify(digest, signature)
+def parse_webhook_body(body):
+    """
+    Parse a urlencoded webhook body into a dict of raw (bytes) fields, which
+    can be verified without decoding them. Repeated fields keep their last
+    value like `QueryDict.dict()`, and like QueryDict TooManyFieldsSent is
+    raised for more than DATA_UPLOAD_MAX_NUMBER_FIELDS fields.
+    """
+    # latin-1 maps every byte to a single character and back, keeping the
+    # percent-decoded bytes as they are
+    body = body.decode("latin-1")
+    # counted like QueryDict does, parse_qsl only limits the fields since python 3.6.8
+    max_num_fields = djsettings.DATA_UPLOAD_MAX_NUMBER_FIELDS
+    if max_num_fields is not None and body.count("&") + 1 > max_num_fields:
+        raise TooManyFieldsSent("The number of GET/POST parameters exceeded settings.DATA_UPLOAD_MAX_NUMBER_FIELDS.")
+    pairs = parse_qsl(body, keep_blank_values=True, encoding="latin-1")
+    return {key.encode("latin-1"): value.encode("latin-1") for key, value in pairs}
+
+
+def decode_webhook_fields(fields, encoding="utf-8"):
+    """
+    Decode the raw fields returned by `parse_webhook_body`.
+    """
+    return {key.decode(encoding, "replace"): value.decode(encoding, "replace") for key, value in fields.items()}
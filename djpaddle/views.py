@@ -1,14 +1,19 @@
+import asyncio
+import functools
+import inspect
 from distutils.util import strtobool
 
-from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseServerError, JsonResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
 from django.views.generic.edit import BaseCreateView
 
-from . import signals
-from .models import Checkout, convert_datetime_strings_to_datetimes
-from .utils import is_valid_webhook
+from . import settings
+from .async_utils import ASYNC_VIEWS_SUPPORTED, run_in_db_thread, run_in_executor
+from .models import Checkout, WebhookEvent, WebhookEventInProgress, convert_datetime_strings_to_datetimes
+from .utils import decode_webhook_fields, is_valid_webhook, parse_webhook_body
 
 
 @method_decorator(csrf_exempt, name="dispatch")
@@ -42,46 +47,146 @@ class PaddleWebhookView(View):
         """
         handle paddle webhook requests by
         - validating the payload signature
-        - sending a django signal for each of the SUPPORTED_WEBHOOKS
+        - skipping webhooks that have already been received
+        - sending a django signal for each of the SUPPORTED_WEBHOOKS, or
+          storing it in the inbox if 'DJPADDLE_WEBHOOK_QUEUE' is enabled
         """
-        payload = request.POST.dict()
+        payload = self.verify_request(request)
+        if payload is None:
+            return HttpResponseBadRequest("webhook validation failed")
+
+        response = self.skip_alert(payload)
+        if response is not None:
+            return response
+
+        if settings.DJPADDLE_WEBHOOK_QUEUE:
+            WebhookEvent.receive(payload)
+            return HttpResponse()
+
+        # webhooks that have been received before are acknowledged right away
+        try:
+            event = WebhookEvent.receive(payload, status=WebhookEvent.STATUS_PROCESSING)
+        except WebhookEventInProgress:
+            return self.in_progress_response()
+        if event is not None and not event.process(sender=self.__class__):
+            return HttpResponseServerError("webhook processing failed")
+
+        return HttpResponse()
+
+    def verify_request(self, request):
+        """
+        Return the payload of the webhook request, or None if its signature is invalid.
+        """
+        if request.content_type == "application/x-www-form-urlencoded":
+            # verify the raw fields and only decode them for valid webhooks
+            fields = parse_webhook_body(request.body)
+            if not is_valid_webhook(fields):
+                return None
+            return decode_webhook_fields(fields, request.encoding or "utf-8")
 
+        payload = request.POST.dict()
         if not is_valid_webhook(payload):
-            return HttpResponseBadRequest("webhook validation failed")
+            return None
+        return payload
+
+    def in_progress_response(self):
+        """
+        Return the response for webhooks whose earlier delivery is still being
+        processed. It is not a success, so Paddle retries the webhook in case
+        that processing fails.
+        """
+        return HttpResponse("webhook is being processed", status=409)
 
+    def skip_alert(self, payload):
+        """
+        Return the response for webhooks that are not processed.
+        """
         alert_name = payload.get("alert_name")
         if not alert_name:
             return HttpResponseBadRequest("'alert_name' missing")
 
-        if alert_name in self.SUPPORTED_WEBHOOKS:
-            signal = getattr(signals, alert_name)
-            if signal:  # pragma: no cover
-                signal.send(sender=self.__class__, payload=payload)
+        if alert_name not in self.SUPPORTED_WEBHOOKS:
+            return HttpResponse()
+
+        return None
+
+
+class AsyncViewMixin:
+    """
+    Serve a view with async handlers as a coroutine function, which is what
+    django (before 4.1) needs to run it on the event loop. Async views need
+    django 3.1 or later.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        if not ASYNC_VIEWS_SUPPORTED:
+            raise ImproperlyConfigured("{0} needs Django 3.1 or later.".format(cls.__name__))
+        view = super().as_view(**initkwargs)
+        if asyncio.iscoroutinefunction(view):
+            return view
+
+        async def async_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+            return response
+
+        return functools.wraps(view)(async_view)
+
+
+class AsyncPaddleWebhookView(AsyncViewMixin, PaddleWebhookView):
+    """
+    PaddleWebhookView for ASGI deployments, which doesn't block a worker
+    thread while verifying and processing the webhook.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        payload = await run_in_executor(self.verify_request, request)
+        if payload is None:
+            return HttpResponseBadRequest("webhook validation failed")
+
+        response = self.skip_alert(payload)
+        if response is not None:
+            return response
+
+        if settings.DJPADDLE_WEBHOOK_QUEUE:
+            await run_in_db_thread(WebhookEvent.receive, payload)
+            return HttpResponse()
+
+        try:
+            event = await run_in_db_thread(WebhookEvent.receive, payload, status=WebhookEvent.STATUS_PROCESSING)
+        except WebhookEventInProgress:
+            return self.in_progress_response()
+        # receivers connected to PaddleWebhookView receive async webhooks as well
+        if event is not None and not await event.aprocess(sender=PaddleWebhookView):
+            return HttpResponseServerError("webhook processing failed")
 
         return HttpResponse()
 
 
-class PaddlePostCheckoutApiView(BaseCreateView):
+class PostCheckoutMixin:
     http_method_names = ["post"]
 
-    def post(self, request, *args, **kwargs):
+    def get_checkout_data(self, request):
+        """
+        Return the id, the fields and the redirect url of the posted checkout.
+        Raises ValueError for invalid checkouts.
+        """
         data = request.POST.dict()
         redirect_url = data.pop("redirect_url") if "redirect_url" in data else ""
         pk = data.pop("id")
         if not pk:
-            return HttpResponseBadRequest('Missing "id"')
+            raise ValueError('Missing "id"')
         try:
             data["completed"] = bool(strtobool(data["completed"]))
         except (KeyError, ValueError):
-            return HttpResponseBadRequest('Missing "completed"')
+            raise ValueError('Missing "completed"')
 
-        try:
-            data = convert_datetime_strings_to_datetimes(data, Checkout)
-        except ValueError as e:
-            return HttpResponseBadRequest(e)
-
-        Checkout.objects.update_or_create(pk=pk, defaults=data)
+        data = convert_datetime_strings_to_datetimes(data, Checkout)
+        return pk, data, redirect_url
 
+    def get_checkout_response(self, request, pk, redirect_url):
         next_url = request.GET.get("next")
         if next_url:
             next_url = "{0}?checkout={1}".format(next_url, pk)
@@ -94,5 +199,34 @@ class PaddlePostCheckoutApiView(BaseCreateView):
         return JsonResponse({}, status=204)
 
 
+class PaddlePostCheckoutApiView(PostCheckoutMixin, BaseCreateView):
+    def post(self, request, *args, **kwargs):
+        try:
+            pk, data, redirect_url = self.get_checkout_data(request)
+        except ValueError as e:
+            return HttpResponseBadRequest(e)
+
+        Checkout.objects.update_or_create(pk=pk, defaults=data)
+        return self.get_checkout_response(request, pk, redirect_url)
+
+
+class AsyncPaddlePostCheckoutApiView(AsyncViewMixin, PostCheckoutMixin, View):
+    """
+    PaddlePostCheckoutApiView for ASGI deployments.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            pk, data, redirect_url = self.get_checkout_data(request)
+        except ValueError as e:
+            return HttpResponseBadRequest(e)
+
+        await run_in_db_thread(Checkout.objects.update_or_create, pk=pk, defaults=data)
+        return self.get_checkout_response(request, pk, redirect_url)
+
+
 paddle_webhook_view = PaddleWebhookView.as_view()
 post_checkout_api_view = PaddlePostCheckoutApiView.as_view()
+if ASYNC_VIEWS_SUPPORTED:
+    async_paddle_webhook_view = AsyncPaddleWebhookView.as_view()
+    async_post_checkout_api_view = AsyncPaddlePostCheckoutApiView.as_view()
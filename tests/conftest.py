@@ -0,0 +1,15 @@
+import pytest
+
+from djpaddle.entitlements import entitlement_cache
+from djpaddle.mappers import subscriber_cache
+from djpaddle.models import plan_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_djpaddle_caches():
+    # test transactions are rolled back without sending any signals, so cached
+    # rows could outlive the test that created them
+    plan_cache.invalidate()
+    subscriber_cache.invalidate()
+    entitlement_cache.invalidate()
+    yield
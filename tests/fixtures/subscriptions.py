@@ -0,0 +1,31 @@
+def fake_subscription(subscription_id, plan_id=1, state="active", quantity=1):
+    return {
+        "subscription_id": subscription_id,
+        "plan_id": plan_id,
+        "user_id": subscription_id,
+        "user_email": "user{0}@example.com".format(subscription_id),
+        "marketing_consent": True,
+        "update_url": "https://checkout.paddle.com/subscription/update",
+        "cancel_url": "https://checkout.paddle.com/subscription/cancel",
+        "state": state,
+        "signup_date": "2020-01-13 19:19:18",
+        "last_payment": {"amount": 10, "currency": "EUR", "date": "2020-01-13"},
+        "next_payment": {"amount": 10 * quantity, "currency": "EUR", "date": "2020-02-13"},
+        "quantity": quantity,
+    }
+
+
+class FakePaddleClient:
+    """
+    Local stand-in for the Paddle subscription users listing.
+    """
+
+    def __init__(self, subscriptions):
+        self.subscriptions = subscriptions
+        self.pages = []
+
+    def list_subscriptions(self, page=1, results_per_page=200, plan_id=None):
+        self.pages.append(page)
+        subscriptions = [s for s in self.subscriptions if plan_id is None or s["plan_id"] == plan_id]
+        start = (page - 1) * results_per_page
+        return subscriptions[start : start + results_per_page]
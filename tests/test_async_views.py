@@ -0,0 +1,150 @@
+import asyncio
+from copy import deepcopy
+from unittest import mock
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from djpaddle import signals
+from djpaddle.models import Checkout, Plan, Subscription, WebhookEvent
+from djpaddle.receivers import receiver_name
+from djpaddle.views import AsyncPaddleWebhookView, PaddleWebhookView
+
+from .fixtures.webhooks import FAKE_ALERT_TEST_SUBSCRIPTION_CREATED
+
+
+class AsyncWebhookMixin:
+    def setUp(self):
+        Plan.objects.create(
+            pk=FAKE_ALERT_TEST_SUBSCRIPTION_CREATED["subscription_plan_id"],
+            name="monthly-subscription",
+            billing_type="month",
+            billing_period=1,
+            trial_days=0,
+        )
+
+    def _send_alert(self, client, data):
+        return client.post(
+            reverse("djpaddle_async:webhook"),
+            urlencode(data),
+            content_type="application/x-www-form-urlencoded",
+        )
+
+
+@mock.patch("djpaddle.settings.DJPADDLE_ASYNC_DB_THREADS", 0)
+@mock.patch("djpaddle.views.is_valid_webhook", return_value=True)
+class TestAsyncWebhookView(AsyncWebhookMixin, TestCase):
+    async def test_webhook_awaits_async_receivers(self, is_valid_webhook):
+        received = []
+
+        async def async_receiver(sender, payload, **kwargs):
+            received.append((sender, payload["alert_id"], asyncio.get_running_loop()))
+
+        signals.subscription_created.connect(async_receiver)
+        self.addCleanup(signals.subscription_created.disconnect, async_receiver)
+
+        alert = deepcopy(FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        resp = await self._send_alert(self.async_client, alert)
+        self.assertEqual(resp.status_code, 200)
+        # awaited on the loop of the request rather than in a thread
+        self.assertEqual(received, [(PaddleWebhookView, str(alert["alert_id"]), asyncio.get_running_loop())])
+
+        # the sync receiver creating the subscription ran as well
+        exists = await sync_to_async(Subscription.objects.filter(pk=alert["subscription_id"]).exists)()
+        self.assertTrue(exists)
+
+    async def test_invalid_webhook(self, is_valid_webhook):
+        is_valid_webhook.return_value = False
+        resp = await self._send_alert(self.async_client, FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        self.assertEqual(resp.status_code, 400)
+
+    async def test_unsupported_webhook(self, is_valid_webhook):
+        alert = deepcopy(FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        alert["alert_name"] = "not_and_valid_hook"
+        resp = await self._send_alert(self.async_client, alert)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_failing_async_receiver_fails_webhook(self, is_valid_webhook):
+        async def failing_receiver(sender, payload, **kwargs):
+            raise ValueError("receiver failed")
+
+        signals.subscription_created.connect(failing_receiver)
+        self.addCleanup(signals.subscription_created.disconnect, failing_receiver)
+
+        resp = self._send_alert(self.client, FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        self.assertEqual(resp.status_code, 500)
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, WebhookEvent.STATUS_FAILED)
+        self.assertEqual(event.error, "{0}: receiver failed".format(receiver_name(failing_receiver)))
+
+    @mock.patch("djpaddle.settings.DJPADDLE_WEBHOOK_QUEUE", True)
+    def test_webhook_is_stored_in_inbox(self, is_valid_webhook):
+        resp = self._send_alert(self.client, FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.STATUS_PENDING)
+        self.assertEqual(Subscription.objects.count(), 0)
+
+    def test_webhook_in_progress_is_not_acknowledged(self, is_valid_webhook):
+        WebhookEvent.create_from_payload(FAKE_ALERT_TEST_SUBSCRIPTION_CREATED, status=WebhookEvent.STATUS_PROCESSING)
+        resp = self._send_alert(self.client, FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(Subscription.objects.count(), 0)
+
+    def test_get_is_not_allowed(self, is_valid_webhook):
+        resp = self.client.get(reverse("djpaddle_async:webhook"))
+        self.assertEqual(resp.status_code, 405)
+
+
+@mock.patch("djpaddle.views.is_valid_webhook", return_value=True)
+class TestAsyncWebhookViewDatabaseThreads(AsyncWebhookMixin, TransactionTestCase):
+    def test_webhook_is_processed_in_database_threads(self, is_valid_webhook):
+        alert = deepcopy(FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        resp = self._send_alert(self.client, alert)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(Subscription.objects.filter(pk=alert["subscription_id"]).exists())
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.STATUS_PROCESSED)
+
+
+@mock.patch("djpaddle.settings.DJPADDLE_ASYNC_DB_THREADS", 0)
+class TestAsyncPostCheckoutApiView(TestCase):
+    def _api_request(self, data, url=None):
+        return self.client.post(
+            url or reverse("djpaddle_async:post_checkout_api"),
+            urlencode(data),
+            content_type="application/x-www-form-urlencoded",
+        )
+
+    def test_checkout_api(self):
+        data = {
+            "id": "11111111-aaaa8f3706b5378-17fba8a806",
+            "completed": "true",
+            "email": "pyematt@gmail.com",
+            "created_at": "2020-05-22 23:42:02",
+        }
+        resp = self._api_request(data)
+        self.assertEqual(resp.status_code, 204)
+        checkout = Checkout.objects.get(pk=data["id"])
+        self.assertTrue(checkout.completed)
+        self.assertEqual(checkout.email, data["email"])
+
+    def test_checkout_api_redirect(self):
+        data = {"id": "11111111-aaaa8f3706b5378-17fba8a806", "completed": "true"}
+        url = "{0}?next=/home/".format(reverse("djpaddle_async:post_checkout_api"))
+        resp = self._api_request(data, url=url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"redirect_url": "/home/?checkout={0}".format(data["id"])})
+
+    def test_checkout_api_missing_completed(self):
+        resp = self._api_request({"id": "11111111-aaaa8f3706b5378-17fba8a806"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(Checkout.objects.count(), 0)
+
+
+class TestAsyncViewsSupport(SimpleTestCase):
+    @mock.patch("djpaddle.views.ASYNC_VIEWS_SUPPORTED", False)
+    def test_async_views_need_django_31(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "AsyncPaddleWebhookView needs Django 3.1 or later."):
+            AsyncPaddleWebhookView.as_view()
@@ -0,0 +1,137 @@
+from copy import deepcopy
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase
+
+from djpaddle.cache import LRUCache, VersionedCache
+from djpaddle.models import Plan, plan_cache
+
+from .fixtures.webhooks import FAKE_GET_PLAN_RESPONSE
+
+
+class TestLRUCache(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+
+class TestVersionedCache(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+
+    def test_invalidation_is_shared_between_processes(self):
+        first = VersionedCache("test", alias="default")
+        second = VersionedCache("test", alias="default")
+        first.set("key", "value")
+        self.assertEqual(second.get("key"), "value")
+
+        second.invalidate()
+        self.assertIsNone(first.get("key"))
+        self.assertIsNone(second.get("key"))
+
+    def test_local_hits_keep_the_version_for_version_ttl(self):
+        first = VersionedCache("test", alias="default", version_ttl=5)
+        second = VersionedCache("test", alias="default")
+        with mock.patch("djpaddle.cache.time.monotonic", return_value=100):
+            first.set("key", "value")
+            with mock.patch.object(caches["default"], "get", wraps=caches["default"].get) as get:
+                self.assertEqual(first.get("key"), "value")
+            get.assert_not_called()
+
+            # first doesn't notice the invalidation before the version expires
+            second.invalidate()
+            self.assertEqual(first.get("key"), "value")
+        with mock.patch("djpaddle.cache.time.monotonic", return_value=106):
+            self.assertIsNone(first.get("key"))
+
+    def test_invalidation_drops_the_local_version(self):
+        cache = VersionedCache("test", alias="default", version_ttl=5)
+        cache.set("key", "value")
+        cache.invalidate()
+        self.assertIsNone(cache.get("key"))
+
+    def test_process_local_cache(self):
+        cache = VersionedCache("test")
+        cache.set("key", "value")
+        self.assertEqual(cache.get("key"), "value")
+        cache.invalidate()
+        self.assertIsNone(cache.get("key"))
+
+    def test_entries_expire(self):
+        cache = VersionedCache("test", timeout=10)
+        with mock.patch("djpaddle.cache.time.monotonic", return_value=100):
+            cache.set("key", "value")
+            cache.set("short", "value", timeout=1)
+        with mock.patch("djpaddle.cache.time.monotonic", return_value=105):
+            self.assertEqual(cache.get("key"), "value")
+            self.assertIsNone(cache.get("short"))
+        with mock.patch("djpaddle.cache.time.monotonic", return_value=110):
+            self.assertIsNone(cache.get("key"))
+
+    def test_delete_drops_local_and_shared_entry(self):
+        first = VersionedCache("test", alias="default")
+        second = VersionedCache("test", alias="default", maxsize=0)
+        first.set("key", "value")
+        first.set("other", "value")
+        first.delete("key")
+        self.assertIsNone(first.get("key"))
+        self.assertIsNone(second.get("key"))
+        self.assertEqual(second.get("other"), "value")
+
+    def test_tag_invalidation_only_drops_tagged_entries(self):
+        for first, second in (
+            (VersionedCache("test", alias="default"), VersionedCache("test", alias="default")),
+            (VersionedCache("local"), None),
+        ):
+            first.set("a", 1, tag="x")
+            first.set("b", 2, tag="y")
+            first.set("c", 3)
+            (second or first).invalidate_tag("x")
+            self.assertIsNone(first.get("a", tag="x"))
+            self.assertEqual(first.get("b", tag="y"), 2)
+            self.assertEqual(first.get("c"), 3)
+
+    def test_evicted_version_does_not_resurrect_entries(self):
+        cache = VersionedCache("test", alias="default")
+        cache.set("key", "value")
+        caches["default"].delete(cache.version_key)
+        cache.invalidate()
+        self.assertIsNone(cache.get("key"))
+
+
+class TestPlanCache(TestCase):
+    def setUp(self):
+        self.plan = Plan.objects.create(pk=1, name="name", billing_type="month", billing_period=1, trial_days=0)
+
+    def test_get_cached_needs_no_queries(self):
+        self.assertEqual(Plan.get_cached(1), self.plan)
+        with self.assertNumQueries(0):
+            self.assertEqual(Plan.get_cached("1"), self.plan)
+
+        plan_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(Plan.get_cached(1), self.plan)
+
+    def test_get_cached_unknown_plan(self):
+        with self.assertRaises(Plan.DoesNotExist):
+            Plan.get_cached(2)
+
+    def test_saving_a_plan_invalidates_the_cache(self):
+        Plan.get_cached(1)
+        self.plan.name = "renamed"
+        self.plan.save()
+        self.assertEqual(Plan.get_cached(1).name, "renamed")
+
+    def test_sync_invalidates_the_cache(self):
+        Plan.get_cached(1)
+        data = deepcopy(FAKE_GET_PLAN_RESPONSE[0])
+        Plan.sync_from_paddle_data(data)
+        self.assertEqual(Plan.get_cached(1).name, FAKE_GET_PLAN_RESPONSE[0]["name"])
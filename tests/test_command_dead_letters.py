@@ -0,0 +1,56 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from djpaddle import signals
+from djpaddle.models import WebhookDeadLetter, WebhookEvent
+from djpaddle.receivers import receiver_name
+
+
+@mock.patch("djpaddle.settings.DJPADDLE_RECEIVER_MAX_ATTEMPTS", 1)
+class TestDeadLettersCommand(TestCase):
+    def setUp(self):
+        self.fail = True
+        signals.payment_refunded.connect(self.receiver)
+        self.addCleanup(signals.payment_refunded.disconnect, self.receiver)
+
+    def receiver(self, sender, payload, **kwargs):
+        if self.fail:
+            raise ValueError("receiver failed")
+
+    def _create_dead_letter(self, alert_id):
+        event = WebhookEvent.create_from_payload({"alert_id": alert_id, "alert_name": "payment_refunded"})
+        event.process()
+        return WebhookDeadLetter.objects.get(event=event)
+
+    def _call(self, *args):
+        out = StringIO()
+        call_command("djpaddle_dead_letters", *args, stdout=out)
+        return out.getvalue()
+
+    def test_list(self):
+        letter = self._create_dead_letter("1")
+        output = self._call()
+        self.assertIn(
+            "{0} payment_refunded:1 {1} attempts=1 dead: receiver failed".format(
+                letter.pk, receiver_name(self.receiver)
+            ),
+            output,
+        )
+        self.assertIn("1 dead letters", output)
+        self.assertIn("0 dead letters", self._call("--alert-name", "payment_succeeded"))
+
+    def test_replay(self):
+        first = self._create_dead_letter("1")
+        self._create_dead_letter("2")
+        self.fail = False
+
+        output = self._call("--replay", str(first.pk))
+        self.assertIn("Replayed 1 of 1 dead letters", output)
+        self.assertEqual(WebhookEvent.objects.get(alert_id="1").status, WebhookEvent.STATUS_PROCESSED)
+        self.assertEqual(WebhookEvent.objects.get(alert_id="2").status, WebhookEvent.STATUS_FAILED)
+
+        self.assertIn("1 dead letters", self._call())
+        self.assertIn("2 dead letters", self._call("--all"))
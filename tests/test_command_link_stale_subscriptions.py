@@ -0,0 +1,103 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from djpaddle import settings
+from djpaddle.models import Plan, Subscription, suspend_stale_linking
+
+
+def subscriptions_by_username(subscriber, queryset):
+    return queryset.filter(passthrough=subscriber.username)
+
+
+class TestLinkStaleSubscriptions(TestCase):
+    def setUp(self):
+        self.Subscriber = settings.get_subscriber_model()
+        self.plan = Plan.objects.create(pk=1, name="name", billing_type="month", billing_period=1, trial_days=0)
+
+    def _create_subscription(self, pk, email, passthrough=""):
+        return Subscription.objects.create(
+            id=pk,
+            cancel_url="https://checkout.paddle.com/subscription/cancel",
+            checkout_id="1",
+            currency="EUR",
+            email=email,
+            event_time=timezone.now(),
+            marketing_consent=True,
+            next_bill_date=timezone.now(),
+            passthrough=passthrough,
+            plan=self.plan,
+            quantity=1,
+            source="",
+            status=Subscription.STATUS_ACTIVE,
+            unit_price=0.0,
+            update_url="https://checkout.paddle.com/subscription/update",
+        )
+
+    def _subscribers(self):
+        return dict(Subscription.objects.values_list("pk", "subscriber__username"))
+
+    def test_new_subscriber_is_linked(self):
+        self._create_subscription("1", "user@example.com")
+        self.Subscriber.objects.create(username="user", email="user@example.com")
+        self.assertEqual(self._subscribers(), {"1": "user"})
+
+    def test_suspended_linking(self):
+        self._create_subscription("1", "first@example.com")
+        self._create_subscription("2", "second@example.com")
+
+        with suspend_stale_linking(link=False):
+            self.Subscriber.objects.create(username="first", email="first@example.com")
+        self.assertEqual(self._subscribers(), {"1": None, "2": None})
+
+        with suspend_stale_linking():
+            self.Subscriber.objects.create(username="second", email="second@example.com")
+            self.assertEqual(self._subscribers(), {"1": None, "2": None})
+        self.assertEqual(self._subscribers(), {"1": "first", "2": "second"})
+
+    @mock.patch("djpaddle.settings.DJPADDLE_LINK_STALE_SUBSCRIPTIONS", False)
+    def test_suspended_linking_respects_setting(self):
+        self._create_subscription("1", "first@example.com")
+        with suspend_stale_linking():
+            self.Subscriber.objects.create(username="first", email="first@example.com")
+        self.assertEqual(self._subscribers(), {"1": None})
+
+    def test_link_stale_subscriptions_in_chunks(self):
+        for pk, email in (("1", "First@Example.com"), ("2", "nobody@example.com"), ("3", "second@example.com")):
+            self._create_subscription(pk, email)
+        self.Subscriber.objects.bulk_create(
+            [
+                self.Subscriber(username="first", email="first@example.com"),
+                self.Subscriber(username="second", email="SECOND@example.com"),
+            ]
+        )
+
+        for update_from in (True, False):
+            Subscription.objects.update(subscriber=None)
+            with mock.patch("djpaddle.models._supports_update_from", return_value=update_from):
+                self.assertEqual(Subscription.link_stale_subscriptions(chunk_size=1), 2)
+            self.assertEqual(self._subscribers(), {"1": "first", "2": None, "3": "second"})
+
+    @mock.patch(
+        "djpaddle.settings.DJPADDLE_SUBSCRIPTIONS_BY_SUBSCRIBER",
+        "tests.test_command_link_stale_subscriptions.subscriptions_by_username",
+    )
+    def test_custom_mapping(self):
+        self._create_subscription("1", "other@example.com", passthrough="user")
+        with suspend_stale_linking(link=False):
+            self.Subscriber.objects.create(username="user", email="user@example.com")
+
+        self.assertEqual(Subscription.link_stale_subscriptions(), 1)
+        self.assertEqual(self._subscribers(), {"1": "user"})
+
+    def test_command(self):
+        self._create_subscription("1", "user@example.com")
+        self.Subscriber.objects.bulk_create([self.Subscriber(username="user", email="user@example.com")])
+
+        out = StringIO()
+        call_command("djpaddle_link_stale_subscriptions", "--chunk-size", "10", stdout=out)
+        self.assertIn("Linked 1 stale subscriptions", out.getvalue())
+        self.assertEqual(self._subscribers(), {"1": "user"})
@@ -0,0 +1,52 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from djpaddle.models import WebhookEvent
+
+
+class TestProcessWebhooks(TestCase):
+    def _create_event(self, alert_id):
+        return WebhookEvent.create_from_payload({"alert_id": alert_id, "alert_name": "payment_refunded"})
+
+    def test_command(self):
+        for alert_id in range(3):
+            self._create_event(alert_id)
+
+        out = StringIO()
+        call_command("djpaddle_process_webhooks", "--once", "--batch-size", "2", stdout=out)
+
+        self.assertIn("Processed 3 webhook events", out.getvalue())
+        statuses = WebhookEvent.objects.values_list("status", flat=True)
+        self.assertEqual(set(statuses), {WebhookEvent.STATUS_PROCESSED})
+
+    def test_claims_are_exclusive(self):
+        for alert_id in range(3):
+            self._create_event(alert_id)
+
+        first = WebhookEvent.claim_pending(2, worker_id="first")
+        second = WebhookEvent.claim_pending(2, worker_id="second")
+
+        self.assertEqual([event.alert_id for event in first], ["0", "1"])
+        self.assertEqual([event.alert_id for event in second], ["2"])
+        self.assertEqual(WebhookEvent.claim_pending(2, worker_id="third"), [])
+        self.assertEqual(first[0].locked_by, "first")
+
+    def test_stale_claims_are_reclaimed(self):
+        event = self._create_event(1)
+        WebhookEvent.claim_pending(1, worker_id="crashed")
+        WebhookEvent.objects.filter(pk=event.pk).update(locked_at=timezone.now() - timedelta(days=1))
+
+        claimed = WebhookEvent.claim_pending(1, worker_id="worker")
+        self.assertEqual([e.pk for e in claimed], [event.pk])
+        self.assertEqual(claimed[0].locked_by, "worker")
+
+    def test_process_pending_limit(self):
+        for alert_id in range(3):
+            self._create_event(alert_id)
+
+        self.assertEqual(WebhookEvent.process_pending(limit=2, batch_size=1), 2)
+        self.assertEqual(WebhookEvent.objects.filter(status=WebhookEvent.STATUS_PENDING).count(), 1)
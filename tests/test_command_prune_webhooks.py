@@ -0,0 +1,32 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from djpaddle.models import WebhookEvent, WebhookReceiverResult
+
+
+class TestPruneWebhooksCommand(TestCase):
+    def _create_event(self, alert_id, status, days_ago):
+        event = WebhookEvent.create_from_payload({"alert_id": alert_id, "alert_name": "payment_refunded"})
+        processed_at = timezone.now() - timedelta(days=days_ago)
+        WebhookEvent.objects.filter(pk=event.pk).update(status=status, processed_at=processed_at)
+        WebhookReceiverResult.objects.create(event=event, receiver="receiver", status="succeeded", attempts=1)
+        return event
+
+    def test_prune(self):
+        self._create_event("1", WebhookEvent.STATUS_PROCESSED, 40)
+        self._create_event("2", WebhookEvent.STATUS_PROCESSED, 10)
+        self._create_event("3", WebhookEvent.STATUS_FAILED, 40)
+        self._create_event("4", WebhookEvent.STATUS_PROCESSED, 50)
+
+        out = StringIO()
+        call_command("djpaddle_prune_webhooks", "--chunk-size", "1", stdout=out)
+        self.assertEqual(out.getvalue(), "Deleted 2 webhook events\n")
+        self.assertEqual(sorted(WebhookEvent.objects.values_list("alert_id", flat=True)), ["2", "3"])
+        self.assertEqual(WebhookReceiverResult.objects.count(), 2)
+
+        call_command("djpaddle_prune_webhooks", "--days", "5", stdout=out)
+        self.assertEqual(list(WebhookEvent.objects.values_list("alert_id", flat=True)), ["3"])
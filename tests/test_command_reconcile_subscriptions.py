@@ -0,0 +1,109 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from djpaddle.models import Plan, Subscription
+from djpaddle.reconcile import (
+    DRIFT_CHANGED,
+    DRIFT_MISSING_LOCAL,
+    DRIFT_MISSING_REMOTE,
+    reconcile_subscriptions,
+    remote_subscriptions,
+)
+from djpaddle.sync import import_subscriptions
+
+from .fixtures.subscriptions import FakePaddleClient, fake_subscription
+
+
+class TestRemoteSubscriptions(SimpleTestCase):
+    def test_rows_are_ordered_within_pages(self):
+        pages = [[fake_subscription(2), fake_subscription(1)], [fake_subscription(10)]]
+        ids = [row["subscription_id"] for row in remote_subscriptions(pages)]
+        self.assertEqual(ids, [1, 2, 10])
+
+    def test_unordered_pages_are_rejected(self):
+        pages = [[fake_subscription(2)], [fake_subscription(1)]]
+        with self.assertRaises(ValueError):
+            list(remote_subscriptions(pages))
+
+
+class TestReconcileSubscriptions(TestCase):
+    def setUp(self):
+        Plan.objects.create(pk=1, name="plan", billing_type="month", billing_period=1, trial_days=0)
+        Plan.objects.create(pk=2, name="other plan", billing_type="month", billing_period=1, trial_days=0)
+        self.client = FakePaddleClient([fake_subscription(i) for i in (1, 2, 9, 10, 11)])
+        import_subscriptions(self.client)
+
+    def _drift(self, **kwargs):
+        return {
+            (drift.kind, drift.subscription_id): drift.fields
+            for drift in reconcile_subscriptions(self.client, results_per_page=2, chunk_size=2, **kwargs)
+        }
+
+    def _make_drift(self):
+        subscription = Subscription.objects.get(pk="9")
+        subscription.status = "past_due"
+        subscription.quantity = 3
+        subscription.next_bill_date -= timedelta(days=1)
+        subscription.save()
+        Subscription.objects.filter(pk="10").update(plan_id=2)
+        Subscription.objects.filter(pk="2").delete()
+        self.client.subscriptions.pop(0)
+
+    def test_no_drift(self):
+        self.assertEqual(self._drift(), {})
+
+    def test_drift(self):
+        self._make_drift()
+        drift = self._drift()
+
+        self.assertEqual(
+            set(drift),
+            {
+                (DRIFT_MISSING_REMOTE, "1"),
+                (DRIFT_MISSING_LOCAL, "2"),
+                (DRIFT_CHANGED, "9"),
+                (DRIFT_CHANGED, "10"),
+            },
+        )
+        self.assertEqual(set(drift[(DRIFT_CHANGED, "9")]), {"status", "quantity", "next_bill_date"})
+        self.assertEqual(drift[(DRIFT_CHANGED, "9")]["status"], ("past_due", "active"))
+        self.assertEqual(drift[(DRIFT_CHANGED, "10")], {"plan": ("2", "1")})
+
+    def test_repair(self):
+        self._make_drift()
+        self.assertEqual(len(self._drift(repair=True)), 4)
+
+        self.assertEqual(self._drift(), {})
+        self.assertEqual(Subscription.objects.get(pk="1").status, Subscription.STATUS_DELETED)
+        self.assertEqual(Subscription.objects.get(pk="9").quantity, 1)
+
+    def test_repair_keeps_subscriptions_of_later_webhooks(self):
+        self._make_drift()
+        # e.g. webhooks processed while the reconciliation runs
+        later = timezone.now() + timedelta(minutes=1)
+        Subscription.objects.filter(pk__in=["1", "9"]).update(event_time=later)
+
+        self.assertEqual(len(self._drift(repair=True)), 4)
+        self.assertEqual(Subscription.objects.get(pk="1").status, Subscription.STATUS_ACTIVE)
+        self.assertEqual(Subscription.objects.get(pk="9").quantity, 3)
+        self.assertEqual(Subscription.objects.get(pk="10").plan_id, 1)
+
+    @mock.patch("djpaddle.models.PaddleClient.list_subscriptions")
+    def test_command(self, list_subscriptions):
+        self._make_drift()
+        list_subscriptions.side_effect = self.client.list_subscriptions
+
+        out = StringIO()
+        call_command("djpaddle_reconcile_subscriptions", stdout=out)
+
+        self.assertIn("changed 9 status: past_due -> active", out.getvalue())
+        self.assertIn("Drift: 2 changed, 1 missing locally, 1 missing on paddle", out.getvalue())
+
+        out = StringIO()
+        call_command("djpaddle_reconcile_subscriptions", "--repair", stdout=out)
+        self.assertIn("Repaired: 2 changed, 1 missing locally, 1 missing on paddle", out.getvalue())
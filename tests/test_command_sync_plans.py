@@ -1,3 +1,5 @@
+from copy import deepcopy
+from io import StringIO
 from unittest import mock
 
 from django.core.management import call_command
@@ -50,3 +52,40 @@ class TestSyncPlans(TestCase):
             self.assertEqual(db_plan.billing_type, paddle_plan["billing_type"])
             self.assertEqual(db_plan.billing_period, paddle_plan["billing_period"])
             self.assertEqual(db_plan.trial_days, paddle_plan["trial_days"])
+
+    @mock.patch("djpaddle.models.PaddleClient.list_plans")
+    def test_command_dry_run(self, paddle_list_plans):
+        paddle_list_plans.side_effect = lambda: deepcopy(FAKE_PLAN_API_RESPONSE)
+
+        out = StringIO()
+        call_command("djpaddle_sync_plans_from_paddle", "--dry-run", stdout=out)
+
+        self.assertEqual(Plan.objects.count(), 0)
+        self.assertIn("[dry run] Synchronized 3 plans", out.getvalue())
+        self.assertIn("3 created", out.getvalue())
+
+    @mock.patch("djpaddle.models.PaddleClient.list_plans")
+    def test_command_plan_filter(self, paddle_list_plans):
+        paddle_list_plans.side_effect = lambda: deepcopy(FAKE_PLAN_API_RESPONSE)
+
+        call_command("djpaddle_sync_plans_from_paddle", "--plan", "10", "--plan", "12", stdout=StringIO())
+
+        self.assertEqual(sorted(Plan.objects.values_list("pk", flat=True)), [10, 12])
+
+    @mock.patch("djpaddle.models.PaddleClient.list_plans")
+    def test_command_summary(self, paddle_list_plans):
+        paddle_list_plans.side_effect = lambda: deepcopy(FAKE_PLAN_API_RESPONSE)
+        call_command("djpaddle_sync_plans_from_paddle", stdout=StringIO())
+
+        response = deepcopy(FAKE_PLAN_API_RESPONSE)
+        response[0]["name"] = "Plan 10 renamed"
+        response[1]["recurring_price"] = {"GBP": "1.00"}
+        paddle_list_plans.side_effect = lambda: deepcopy(response)
+
+        out = StringIO()
+        call_command("djpaddle_sync_plans_from_paddle", stdout=out)
+
+        self.assertIn("Updated Plan 10 renamed:10: name", out.getvalue())
+        self.assertIn("0 created, 1 updated, 2 unchanged", out.getvalue())
+        self.assertIn("prices: 0 created, 1 updated, 0 deleted", out.getvalue())
+        self.assertEqual(Plan.objects.get(pk=10).name, "Plan 10 renamed")
@@ -0,0 +1,109 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from djpaddle.models import Plan, Subscription
+from djpaddle.sync import import_subscriptions, iter_subscription_pages, subscription_payload_from_api
+
+from .fixtures.subscriptions import FakePaddleClient, fake_subscription
+
+
+class TestSyncSubscriptions(TestCase):
+    def setUp(self):
+        Plan.objects.create(pk=1, name="plan", billing_type="month", billing_period=1, trial_days=0)
+        Plan.objects.create(pk=2, name="other plan", billing_type="month", billing_period=1, trial_days=0)
+
+    def test_iter_subscription_pages(self):
+        client = FakePaddleClient([fake_subscription(i) for i in range(1, 8)])
+        pages = list(iter_subscription_pages(client, results_per_page=3, workers=2))
+        self.assertEqual([[row["subscription_id"] for row in page] for page in pages], [[1, 2, 3], [4, 5, 6], [7]])
+
+    def test_iter_subscription_pages_full_last_page(self):
+        client = FakePaddleClient([fake_subscription(i) for i in range(1, 7)])
+        pages = list(iter_subscription_pages(client, results_per_page=3, workers=1))
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(client.pages, [1, 2, 3])
+
+    def test_payload_from_api(self):
+        payload = subscription_payload_from_api(fake_subscription(1, quantity=2))
+        self.assertEqual(payload["unit_price"], 10.0)
+        self.assertEqual(payload["next_bill_date"], "2020-02-13")
+        self.assertEqual(payload["status"], "active")
+
+        row = fake_subscription(1, state="deleted")
+        del row["next_payment"]
+        self.assertEqual(subscription_payload_from_api(row)["next_bill_date"], "2020-01-13")
+
+    def test_import_creates_and_updates_in_chunks(self):
+        user = User.objects.create(username="user", email="user1@example.com")
+        Subscription.objects.create(
+            id="2",
+            subscriber=None,
+            plan_id=1,
+            cancel_url="",
+            checkout_id="checkout",
+            currency="EUR",
+            email="user2@example.com",
+            event_time=timezone.now(),
+            marketing_consent=False,
+            next_bill_date=timezone.now(),
+            passthrough="passthrough",
+            quantity=1,
+            source="",
+            status="active",
+            unit_price=10,
+            update_url="",
+        )
+
+        subscriptions = [fake_subscription(i) for i in range(1, 6)]
+        subscriptions[1]["state"] = "paused"
+        subscriptions[1]["plan_id"] = 2
+        client = FakePaddleClient(subscriptions)
+
+        result = import_subscriptions(client, results_per_page=2, workers=2, chunk_size=2)
+
+        self.assertEqual(result, (4, 1))
+        self.assertEqual(Subscription.objects.count(), 5)
+        self.assertEqual(Subscription.objects.get(pk="1").subscriber, user)
+        updated = Subscription.objects.get(pk="2")
+        self.assertEqual(updated.status, "paused")
+        self.assertEqual(updated.plan_id, 2)
+        self.assertEqual(updated.passthrough, "passthrough")
+        self.assertEqual(updated.checkout_id, "checkout")
+
+    def test_import_keeps_subscriptions_of_later_webhooks(self):
+        # e.g. a subscription_cancelled webhook processed while the import runs
+        later = timezone.now() + timedelta(minutes=1)
+        Subscription.objects.create(
+            id="1",
+            plan_id=1,
+            email="user1@example.com",
+            event_time=later,
+            marketing_consent=False,
+            next_bill_date=later,
+            quantity=1,
+            status="deleted",
+            unit_price=10,
+        )
+        client = FakePaddleClient([fake_subscription(i) for i in range(1, 3)])
+
+        self.assertEqual(import_subscriptions(client), (1, 0))
+        subscription = Subscription.objects.get(pk="1")
+        self.assertEqual(subscription.status, "deleted")
+        self.assertEqual(subscription.event_time, later)
+
+    @mock.patch("djpaddle.models.PaddleClient.list_subscriptions")
+    def test_command(self, list_subscriptions):
+        client = FakePaddleClient([fake_subscription(i, plan_id=1 + i % 2) for i in range(1, 6)])
+        list_subscriptions.side_effect = client.list_subscriptions
+
+        out = StringIO()
+        call_command("djpaddle_sync_subscriptions", "--plan", "2", "--page-size", "2", stdout=out)
+
+        self.assertIn("Synchronized 3 subscriptions", out.getvalue())
+        self.assertEqual(sorted(Subscription.objects.values_list("pk", flat=True)), ["1", "3", "5"])
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from djpaddle.dispatch import PartitionedDispatcher, lane_for, partition_key
+
+
+class FakeEvent:
+    def __init__(self, payload, log):
+        self.payload = payload
+        self.log = log
+
+    def process(self):
+        # give other lanes the chance to interleave
+        time.sleep(0.001)
+        self.log.append((self.payload["alert_id"], threading.current_thread().name))
+
+
+class TestPartitionKey(SimpleTestCase):
+    def test_subscription_id_takes_precedence(self):
+        payload = {"subscription_id": "7", "checkout_id": "1-abc", "order_id": "8", "alert_id": "1"}
+        self.assertEqual(partition_key(payload), "subscription_id:7")
+
+    def test_falls_back_to_checkout_and_order(self):
+        self.assertEqual(partition_key({"checkout_id": "1-abc", "order_id": "8"}), "checkout_id:1-abc")
+        self.assertEqual(partition_key({"checkout_id": "", "order_id": "8"}), "order_id:8")
+        self.assertEqual(partition_key({"alert_id": "3"}), "alert_id:3")
+        self.assertEqual(partition_key({}), "")
+
+    def test_lane_is_stable(self):
+        payload = {"subscription_id": "7"}
+        self.assertEqual(lane_for(payload, 8), lane_for(dict(payload, alert_id="2"), 8))
+        self.assertEqual(lane_for(payload, 1), 0)
+
+
+class TestPartitionedDispatcher(SimpleTestCase):
+    def test_events_of_a_subscription_stay_ordered(self):
+        log = []
+        events = [FakeEvent({"alert_id": alert_id, "subscription_id": alert_id % 5}, log) for alert_id in range(50)]
+        dispatcher = PartitionedDispatcher(lanes=4)
+        self.addCleanup(dispatcher.shutdown)
+        dispatcher.dispatch(events)
+
+        self.assertEqual(sorted(alert_id for alert_id, __ in log), list(range(50)))
+        for subscription_id in range(5):
+            processed = [alert_id for alert_id, __ in log if alert_id % 5 == subscription_id]
+            self.assertEqual(processed, sorted(processed))
+            threads = {thread for alert_id, thread in log if alert_id % 5 == subscription_id}
+            self.assertEqual(len(threads), 1)
+
+    def test_single_lane_runs_inline(self):
+        log = []
+        dispatcher = PartitionedDispatcher(lanes=1)
+        dispatcher.dispatch([FakeEvent({"alert_id": i, "subscription_id": i}, log) for i in range(3)])
+        self.assertEqual([alert_id for alert_id, __ in log], [0, 1, 2])
+        self.assertEqual({thread for __, thread in log}, {threading.current_thread().name})
+        self.assertIsNone(dispatcher._executor)
@@ -0,0 +1,181 @@
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase
+from django.utils import timezone
+
+from djpaddle import entitlements, settings
+from djpaddle.reconcile import DRIFT_MISSING_REMOTE, Drift, repair_drift
+from djpaddle.sync import write_subscriptions
+from djpaddle.models import Plan, Subscription, suspend_stale_linking
+
+
+class TestEntitlements(TestCase):
+    def setUp(self):
+        # entitlements are only cached across requests in a shared cache
+        patcher = mock.patch.object(entitlements.entitlement_cache, "alias", "default")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        entitlements.entitlement_cache.invalidate()
+        self.Subscriber = settings.get_subscriber_model()
+        self.subscriber = self.Subscriber.objects.create(username="fred", email="fred@example.com")
+        self.plan = Plan.objects.create(pk=1, name="basic", billing_type="month", billing_period=1, trial_days=0)
+        self.other_plan = Plan.objects.create(pk=2, name="pro", billing_type="month", billing_period=1, trial_days=0)
+
+    def _subscribe(self, pk, plan, status=Subscription.STATUS_ACTIVE, subscriber=None, email="fred@example.com"):
+        return Subscription.objects.create(
+            id=pk,
+            subscriber=subscriber,
+            cancel_url="https://checkout.paddle.com/subscription/cancel",
+            checkout_id="1",
+            currency="EUR",
+            email=email,
+            event_time=timezone.now(),
+            marketing_consent=True,
+            next_bill_date=timezone.now(),
+            plan=plan,
+            quantity=1,
+            source="",
+            status=status,
+            unit_price=0.0,
+            update_url="https://checkout.paddle.com/subscription/update",
+        )
+
+    def _reload(self):
+        return self.Subscriber.objects.get(pk=self.subscriber.pk)
+
+    def test_active_plans(self):
+        self._subscribe("1", self.plan, subscriber=self.subscriber)
+        self._subscribe("2", self.other_plan, status=Subscription.STATUS_DELETED, subscriber=self.subscriber)
+
+        snapshot = entitlements.for_subscriber(self._reload())
+        self.assertEqual(snapshot.plans, frozenset([1]))
+        self.assertTrue(snapshot)
+        self.assertIn(self.plan, snapshot)
+        self.assertIn("1", snapshot)
+        self.assertNotIn(self.other_plan, snapshot)
+
+    def test_no_subscriptions(self):
+        self.assertFalse(entitlements.for_subscriber(self._reload()))
+
+    def test_anonymous_user_needs_no_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(entitlements.for_subscriber(AnonymousUser()), entitlements.NO_ENTITLEMENTS)
+            self.assertEqual(entitlements.for_subscriber(None), entitlements.NO_ENTITLEMENTS)
+
+    def test_snapshot_is_immutable(self):
+        snapshot = entitlements.for_subscriber(self._reload())
+        with self.assertRaises(AttributeError):
+            snapshot.plans = frozenset([1])
+
+    def test_memoised_and_cached(self):
+        subscriber, other = self._reload(), self._reload()
+        entitlements.for_subscriber(subscriber)
+        with self.assertNumQueries(0):
+            entitlements.for_subscriber(subscriber)
+            # a later request with another instance of the subscriber
+            entitlements.for_subscriber(other)
+
+    def test_memoised_snapshot_is_kept_by_the_instance(self):
+        subscriber = self._reload()
+        self.assertFalse(entitlements.for_subscriber(subscriber))
+        self._subscribe("1", self.plan, subscriber=self.subscriber)
+        self.assertFalse(entitlements.for_subscriber(subscriber))
+        entitlements.invalidate(subscriber)
+        self.assertTrue(entitlements.for_subscriber(subscriber))
+
+    def test_subscription_webhook_invalidates(self):
+        subscriber = self._reload()
+        self.assertFalse(entitlements.for_subscriber(subscriber))
+
+        data = {
+            "id": "1",
+            "subscriber": subscriber,
+            "plan": self.plan,
+            "cancel_url": "https://checkout.paddle.com/subscription/cancel",
+            "checkout_id": "1",
+            "currency": "EUR",
+            "email": "fred@example.com",
+            "event_time": timezone.now(),
+            "marketing_consent": True,
+            "next_bill_date": timezone.now(),
+            "passthrough": "",
+            "quantity": 1,
+            "source": "",
+            "status": Subscription.STATUS_ACTIVE,
+            "unit_price": 0.0,
+            "update_url": "https://checkout.paddle.com/subscription/update",
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.bulk_upsert([data])
+        self.assertIn(self.plan, entitlements.for_subscriber(self._reload()))
+
+    def test_unlinking_invalidates_previous_subscriber(self):
+        self._subscribe("1", self.plan, subscriber=self.subscriber)
+        self.assertTrue(entitlements.for_subscriber(self._reload()))
+
+        data = {"id": "1", "subscriber": None, "event_time": timezone.now(), "status": Subscription.STATUS_ACTIVE}
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.bulk_upsert([data])
+        self.assertFalse(entitlements.for_subscriber(self._reload()))
+
+    def test_stale_linking_invalidates(self):
+        with suspend_stale_linking(link=False):
+            barney = self.Subscriber.objects.create(username="barney", email="Barney@example.com")
+        # the set-based update, its fallback and custom mappings
+        patches = [
+            mock.patch("djpaddle.models._supports_update_from", return_value=True),
+            mock.patch("djpaddle.models._supports_update_from", return_value=False),
+            mock.patch(
+                "djpaddle.settings.DJPADDLE_SUBSCRIPTIONS_BY_SUBSCRIBER", "tests.test_entitlements.by_subscriber"
+            ),
+        ]
+        for pk, patch in enumerate(patches, start=1):
+            with self.subTest(pk=pk), patch:
+                Subscription.objects.filter(subscriber=barney).update(subscriber=None)
+                entitlements.entitlement_cache.invalidate()
+                self._subscribe(str(pk), self.plan, email="barney@example.com")
+                self.assertFalse(entitlements.for_subscriber(self.Subscriber.objects.get(pk=barney.pk)))
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.assertEqual(Subscription.link_stale_subscriptions(), pk)
+                self.assertIn(self.plan, entitlements.for_subscriber(self.Subscriber.objects.get(pk=barney.pk)))
+
+    def test_linking_a_created_subscriber_invalidates(self):
+        self._subscribe("1", self.plan, email="barney@example.com")
+        with mock.patch.object(entitlements, "invalidate") as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                barney = self.Subscriber.objects.create(username="barney", email="barney@example.com")
+        invalidate.assert_called_once_with(barney)
+        self.assertIn(self.plan, entitlements.for_subscriber(barney))
+
+    def test_not_cached_across_requests_without_shared_cache(self):
+        entitlements.entitlement_cache.alias = None
+        entitlements.for_subscriber(self._reload())
+        subscriber = self._reload()
+        with self.assertNumQueries(1):
+            entitlements.for_subscriber(subscriber)
+
+    def test_import_invalidates(self):
+        self._subscribe("1", self.plan, status=Subscription.STATUS_PAUSED, subscriber=self.subscriber)
+        self.assertFalse(entitlements.for_subscriber(self._reload()))
+
+        # the import doesn't change the subscriber, whose entitlements are dropped anyway
+        data = {"id": "1", "subscriber_id": None, "status": Subscription.STATUS_ACTIVE}
+        with self.captureOnCommitCallbacks(execute=True):
+            write_subscriptions([data])
+        self.assertEqual(Subscription.objects.get(pk="1").subscriber, self.subscriber)
+        self.assertIn(self.plan, entitlements.for_subscriber(self._reload()))
+
+    def test_repair_invalidates(self):
+        subscription = self._subscribe("1", self.plan, subscriber=self.subscriber)
+        self.assertTrue(entitlements.for_subscriber(self._reload()))
+
+        drift = Drift(DRIFT_MISSING_REMOTE, "1", {}, subscription, None)
+        with self.captureOnCommitCallbacks(execute=True):
+            list(repair_drift([drift]))
+        self.assertFalse(entitlements.for_subscriber(self._reload()))
+
+
+def by_subscriber(subscriber, queryset):
+    return queryset.filter(email__iexact=subscriber.email)
@@ -0,0 +1,100 @@
+import re
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from djpaddle import mappers, settings
+from djpaddle.models import Plan, Subscription
+
+# a full scan of the subscription table, by SQLite or PostgreSQL
+SEQUENTIAL_SCAN = re.compile(r"\bSCAN (TABLE )?djpaddle_subscription\b|Seq Scan on djpaddle_subscription\b")
+
+
+@skipUnless(connection.vendor in ("postgresql", "sqlite"), "EXPLAIN output is vendor specific")
+class QueryPlanTestCase(TestCase):
+    def setUp(self):
+        Subscriber = settings.get_subscriber_model()
+        self.subscriber = Subscriber.objects.create(username="Fred", email="Fred@example.com")
+        self.plan = Plan.objects.create(pk=1, name="name", billing_type="month", billing_period=1, trial_days=0)
+        for pk, email in enumerate(["fred@EXAMPLE.com", "barney@example.com"], start=1):
+            Subscription.objects.create(
+                id=pk,
+                cancel_url="https://checkout.paddle.com/subscription/cancel",
+                checkout_id=str(pk),
+                currency="EUR",
+                email=email,
+                event_time=timezone.now(),
+                marketing_consent=True,
+                next_bill_date=timezone.now(),
+                plan=self.plan,
+                quantity=1,
+                source="",
+                status=Subscription.STATUS_ACTIVE,
+                unit_price=0.0,
+                update_url="https://checkout.paddle.com/subscription/update",
+            )
+        if connection.vendor == "postgresql":
+            # the tables are tiny, make the planner prefer any usable index
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, name):
+        plan = queryset.explain()
+        self.assertIn(name, plan)
+
+    def assertNoSequentialScan(self, queryset):
+        plan = queryset.explain()
+        self.assertIsNone(SEQUENTIAL_SCAN.search(plan), plan)
+
+
+class TestSubscriptionEmailIndexes(QueryPlanTestCase):
+    def test_subscriptions_by_subscriber_matches_case_insensitive(self):
+        queryset = mappers.subscriptions_by_subscriber(self.subscriber, Subscription.objects.all())
+        self.assertEqual([s.pk for s in queryset], ["1"])
+
+    def test_subscriptions_by_subscriber_uses_email_index(self):
+        queryset = mappers.subscriptions_by_subscriber(self.subscriber, Subscription.objects.all())
+        self.assertUsesIndex(queryset, "djpaddle_sub_email_lower_idx")
+
+    def test_stale_subscriptions_use_partial_index(self):
+        queryset = mappers.subscriptions_by_subscriber(self.subscriber, Subscription.objects.filter(subscriber=None))
+        self.assertUsesIndex(queryset, "djpaddle_sub_stale_email_idx")
+
+
+class TestSubscriptionQueryPlans(QueryPlanTestCase):
+    def test_active_subscriptions_of_subscriber(self):
+        queryset = Subscription.objects.filter(subscriber=self.subscriber, status=Subscription.STATUS_ACTIVE)
+        self.assertNoSequentialScan(queryset)
+
+    def test_subscriptions_due_before(self):
+        queryset = Subscription.objects.filter(
+            status=Subscription.STATUS_ACTIVE, next_bill_date__lt=timezone.now() + timedelta(days=7)
+        )
+        self.assertNoSequentialScan(queryset)
+        self.assertUsesIndex(queryset, "djpaddle_sub_status_bill_idx")
+
+    def test_subscriptions_by_plan_and_status(self):
+        queryset = Subscription.objects.filter(plan=self.plan, status=Subscription.STATUS_ACTIVE)
+        self.assertNoSequentialScan(queryset)
+
+    def test_subscriptions_by_status(self):
+        # the admin's status filter
+        queryset = Subscription.objects.filter(status=Subscription.STATUS_PAUSED)
+        self.assertNoSequentialScan(queryset)
+
+    def test_subscriptions_by_checkout(self):
+        queryset = Subscription.objects.filter(checkout_id="1")
+        self.assertNoSequentialScan(queryset)
+        self.assertUsesIndex(queryset, "djpaddle_sub_checkout_idx")
+
+    def test_subscriptions_of_subscriber_use_composite_index(self):
+        # e.g. deleting a subscriber, the foreign key has no index of its own
+        queryset = Subscription.objects.filter(subscriber=self.subscriber)
+        self.assertUsesIndex(queryset, "djpaddle_sub_subscr_status_idx")
+
+    def test_subscriptions_of_plan_use_composite_index(self):
+        queryset = Subscription.objects.filter(plan=self.plan)
+        self.assertUsesIndex(queryset, "djpaddle_sub_plan_status_idx")
@@ -0,0 +1,105 @@
+import threading
+import time
+from copy import deepcopy
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase
+
+from djpaddle import locks
+from djpaddle.locks import LockTimeout, single_flight
+from djpaddle.models import Plan
+
+from .fixtures.webhooks import FAKE_GET_PLAN_RESPONSE, PLAN_ID
+
+
+class TestSingleFlight(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+
+    def test_callers_are_serialised(self):
+        active = []
+        overlaps = []
+
+        def worker():
+            with single_flight("key"):
+                active.append(1)
+                overlaps.append(len(active))
+                time.sleep(0.005)
+                active.pop()
+
+        threads = [threading.Thread(target=worker) for __ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(overlaps, [1] * 8)
+        self.assertEqual(locks._locks, {})
+        self.assertIsNone(caches["default"].get("djpaddle:lock:key"))
+
+    def test_lock_held_by_another_process_times_out(self):
+        caches["default"].add("djpaddle:lock:key", "other-process", 10)
+        with self.assertRaises(LockTimeout):
+            with single_flight("key", timeout=0.1):
+                pass  # pragma: no cover
+        self.assertEqual(caches["default"].get("djpaddle:lock:key"), "other-process")
+        self.assertEqual(locks._locks, {})
+
+    def test_lock_is_held_after_waiting_for_the_process_lock(self):
+        # the process lock used up the whole wait budget
+        with mock.patch("djpaddle.locks.time.monotonic", side_effect=[0] + [10] * 4):
+            with single_flight("key", timeout=10):
+                self.assertIsNotNone(caches["default"].get("djpaddle:lock:key"))
+        self.assertIsNone(caches["default"].get("djpaddle:lock:key"))
+
+    def test_lock_taken_by_another_caller_is_not_released(self):
+        # the lock expired and has been taken by another caller meanwhile
+        with single_flight("key"):
+            caches["default"].set("djpaddle:lock:key", "other-process", 10)
+        self.assertEqual(caches["default"].get("djpaddle:lock:key"), "other-process")
+
+    @mock.patch("djpaddle.settings.DJPADDLE_LOCK_TTL", 10)
+    def test_lock_about_to_expire_is_left_to_expire(self):
+        with mock.patch("djpaddle.locks.time.monotonic", side_effect=[0, 0, 0, 0, 9.5]):
+            with single_flight("key", timeout=10):
+                token = caches["default"].get("djpaddle:lock:key")
+        self.assertEqual(caches["default"].get("djpaddle:lock:key"), token)
+
+    def test_redis_lock_is_compared_and_deleted_atomically(self):
+        cache = mock.Mock()
+        cache.client.encode.return_value = b"encoded-token"
+        cache.make_key.return_value = ":1:djpaddle:lock:key"
+        locks._release(cache, "djpaddle:lock:key", "token", expires=0)
+
+        cache.client.encode.assert_called_once_with("token")
+        redis = cache.client.get_client.return_value
+        redis.eval.assert_called_once_with(locks._RELEASE_SCRIPT, 1, ":1:djpaddle:lock:key", b"encoded-token")
+        cache.delete.assert_not_called()
+
+    @mock.patch("djpaddle.settings.DJPADDLE_LOCK_CACHE", None)
+    def test_process_lock_only(self):
+        caches["default"].add("djpaddle:lock:key", "other-process", 10)
+        with single_flight("key", timeout=0.1):
+            pass
+
+
+class TestPlanGetOrSync(TestCase):
+    @mock.patch("djpaddle.models.PaddleClient.list_plans")
+    def test_missing_plan_is_fetched_once(self, list_plans):
+        list_plans.side_effect = lambda **kwargs: deepcopy(FAKE_GET_PLAN_RESPONSE)
+
+        plan = Plan.get_or_sync(PLAN_ID)
+        self.assertEqual(plan.name, FAKE_GET_PLAN_RESPONSE[0]["name"])
+        self.assertEqual(Plan.get_or_sync(PLAN_ID), plan)
+        self.assertEqual(list_plans.call_count, 1)
+
+    @mock.patch("djpaddle.models.PaddleClient.list_plans")
+    def test_plan_synced_while_waiting_is_not_fetched(self, list_plans):
+        def sync_by_previous_holder(key, timeout=None):
+            Plan.objects.create(pk=PLAN_ID, name="synced", billing_type="month", billing_period=1)
+            return mock.MagicMock()
+
+        with mock.patch("djpaddle.models.single_flight", side_effect=sync_by_previous_holder):
+            self.assertEqual(Plan.get_or_sync(PLAN_ID).name, "synced")
+        self.assertFalse(list_plans.called)
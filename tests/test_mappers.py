@@ -1,3 +1,5 @@
+from unittest import mock
+
 from django.test.testcases import TestCase
 from django.utils import timezone
 
@@ -54,3 +56,90 @@ class TestPaddleMappers(TestCase):
 
         subscriptions = mappers.get_subscriptions_by_subscriber(subscriber, Subscription.objects)
         self.assertEqual(1, len(subscriptions.all()))
+
+
+class TestSubscriberCache(TestCase):
+    def setUp(self):
+        self.Subscriber = settings.get_subscriber_model()
+        self.payload = {"email": "test@example.com", "passthrough": "", "user_id": 1}
+
+    def test_resolved_subscriber_pk_is_cached(self):
+        subscriber = self.Subscriber.objects.create(username="user", email="test@example.com")
+        self.assertEqual(mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload), subscriber.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(mappers.get_subscriber_id_by_payload(self.Subscriber, dict(self.payload)), subscriber.pk)
+
+        # other inputs of the mapping are resolved separately
+        with self.assertNumQueries(1):
+            mappers.get_subscriber_id_by_payload(self.Subscriber, dict(self.payload, user_id=2))
+
+    def test_missing_subscriber_is_cached(self):
+        with self.assertRaises(self.Subscriber.DoesNotExist):
+            mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload)
+        with self.assertNumQueries(0), self.assertRaises(self.Subscriber.DoesNotExist):
+            mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload)
+
+    def test_cache_is_invalidated_by_subscriber_changes(self):
+        with self.assertRaises(self.Subscriber.DoesNotExist):
+            mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload)
+
+        subscriber = self.Subscriber.objects.create(username="user", email="test@example.com")
+        self.assertEqual(mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload), subscriber.pk)
+
+        subscriber.last_login = timezone.now()
+        subscriber.save(update_fields=["last_login"])
+        with self.assertNumQueries(0):
+            mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload)
+
+        subscriber.email = "other@example.com"
+        subscriber.save()
+        with self.assertRaises(self.Subscriber.DoesNotExist):
+            mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload)
+
+    def test_only_cached_subscribers_of_the_saved_emails_are_invalidated(self):
+        other = dict(self.payload, email="other@example.com")
+        subscriber = self.Subscriber.objects.create(username="user", email="test@example.com")
+        for payload in (self.payload, other, dict(self.payload, email="new@example.com")):
+            try:
+                mappers.get_subscriber_id_by_payload(self.Subscriber, payload)
+            except self.Subscriber.DoesNotExist:
+                pass
+
+        subscriber.email = "new@example.com"
+        subscriber.save()
+        with self.assertNumQueries(0), self.assertRaises(self.Subscriber.DoesNotExist):
+            mappers.get_subscriber_id_by_payload(self.Subscriber, other)
+        with self.assertRaises(self.Subscriber.DoesNotExist):
+            mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload)
+        payload = dict(self.payload, email="new@example.com")
+        self.assertEqual(mappers.get_subscriber_id_by_payload(self.Subscriber, payload), subscriber.pk)
+
+    def test_custom_mapping_invalidates_all_cached_subscribers(self):
+        other = dict(self.payload, email="other@example.com")
+        with mock.patch("djpaddle.settings.DJPADDLE_SUBSCRIBER_BY_PAYLOAD", "tests.test_mappers.by_email"):
+            with self.assertRaises(self.Subscriber.DoesNotExist):
+                mappers.get_subscriber_id_by_payload(self.Subscriber, other)
+            self.Subscriber.objects.create(username="user", email="test@example.com")
+            with self.assertNumQueries(1), self.assertRaises(self.Subscriber.DoesNotExist):
+                mappers.get_subscriber_id_by_payload(self.Subscriber, other)
+
+    def test_deleted_subscriber_is_not_returned(self):
+        subscriber = self.Subscriber.objects.create(username="user", email="test@example.com")
+        self.assertEqual(mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload), subscriber.pk)
+        subscriber.delete()
+        with self.assertRaises(self.Subscriber.DoesNotExist):
+            mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload)
+
+    @mock.patch("djpaddle.settings.DJPADDLE_SUBSCRIBER_CACHE_TIMEOUT", 0)
+    def test_timeout_0_disables_the_cache(self):
+        with self.assertRaises(self.Subscriber.DoesNotExist):
+            mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload)
+        # bulk_create doesn't invalidate the cache
+        self.Subscriber.objects.bulk_create([self.Subscriber(username="user", email="test@example.com")])
+        subscriber = self.Subscriber.objects.get()
+        with self.assertNumQueries(1):
+            self.assertEqual(mappers.get_subscriber_id_by_payload(self.Subscriber, self.payload), subscriber.pk)
+
+
+def by_email(Subscriber, payload):
+    return mappers.subscriber_by_payload(Subscriber, payload)
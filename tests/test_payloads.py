@@ -0,0 +1,113 @@
+from datetime import datetime
+from unittest import mock
+
+import pytz
+from django.conf import settings as djsettings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from djpaddle import payloads
+from djpaddle.models import Checkout, Subscription
+from djpaddle.payloads import PayloadMapper, get_mapper, parse_datetime
+from djpaddle.utils import PADDLE_DATE_FORMAT, PADDLE_DATETIME_FORMAT
+
+
+class TestPayloadMapper(TestCase):
+    def test_mappers_are_compiled_at_ready(self):
+        self.assertIn(Subscription, payloads._mappers)
+        self.assertIn(Checkout, payloads._mappers)
+        self.assertIs(get_mapper(Subscription), get_mapper(Subscription))
+
+    def test_field_metadata(self):
+        mapper = PayloadMapper(Subscription)
+        self.assertIsInstance(mapper.field_names, frozenset)
+        self.assertIn("status", mapper.field_names)
+        self.assertEqual(mapper.keys["new_status"], ("status", None))
+        self.assertEqual(mapper.keys["event_time"], ("event_time", parse_datetime))
+        self.assertIn("event_time", dict(mapper.datetime_fields))
+        self.assertIn("plan", mapper.required_field_names)
+        self.assertNotIn("id", mapper.required_field_names)
+
+    def test_sanitize(self):
+        mapper = get_mapper(Subscription)
+        payload = {
+            "status": "active",
+            "new_status": "past_due",
+            "old_status": "active",
+            "unknown": "ignored",
+            "event_time": "2020-01-13 19:19:18",
+            "next_bill_date": "2020-01-30",
+        }
+        with mock.patch.object(Subscription._meta, "get_fields", side_effect=AssertionError("_meta walked")):
+            data = mapper.sanitize(payload, {"id": "1"})
+
+        self.assertEqual(
+            data,
+            {
+                "id": "1",
+                "status": "past_due",
+                "event_time": datetime(2020, 1, 13, 19, 19, 18, tzinfo=pytz.UTC),
+                "next_bill_date": datetime(2020, 1, 30, tzinfo=pytz.UTC),
+            },
+        )
+
+    def test_invalid_datetime(self):
+        with self.assertRaises(ValueError):
+            get_mapper(Checkout).convert_datetimes({"created_at": "yesterday"})
+
+
+def strptime_reference(value):
+    """
+    The parsing of Paddle datetimes before the fast path was added.
+    """
+    try:
+        value = datetime.strptime(value, PADDLE_DATETIME_FORMAT)
+    except ValueError:
+        value = datetime.strptime(value, PADDLE_DATE_FORMAT)
+    if djsettings.USE_TZ:
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
+class TestParseDatetime(TestCase):
+    VALUES = [
+        "2020-01-13 19:19:18",
+        "2020-01-30",
+        "2020-02-29 00:00:00",
+        "1999-12-31 23:59:59",
+        "2020-1-5 1:02:03",
+        "2020-1-5",
+        "2021-03-28 02:30:00",
+        "2021-10-31 02:30:00",
+        "2020-13-01",
+        "2021-02-29 10:00:00",
+        "2020-01-13T19:19:18",
+        "2020-01-13 19:19:18+00:00",
+        "2020-01-13 19:19",
+        "",
+        "yesterday",
+        "２０２０-01-13",
+    ]
+
+    def assert_equivalent(self):
+        for value in self.VALUES:
+            try:
+                expected = strptime_reference(value)
+            except Exception as e:
+                with self.assertRaises(type(e), msg=value):
+                    parse_datetime(value)
+            else:
+                parsed = parse_datetime(value)
+                self.assertEqual(parsed, expected, msg=value)
+                self.assertEqual(parsed.tzinfo, expected.tzinfo, msg=value)
+
+    def test_equivalent_to_strptime(self):
+        self.assert_equivalent()
+
+    def test_equivalent_to_strptime_in_local_timezone(self):
+        with override_settings(TIME_ZONE="Europe/Berlin"):
+            self.assert_equivalent()
+
+    def test_equivalent_to_strptime_without_timezones(self):
+        with override_settings(USE_TZ=False):
+            self.assert_equivalent()
@@ -0,0 +1,64 @@
+from copy import deepcopy
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from djpaddle.models import Plan, Price
+
+PLAN_DATA = {
+    "billing_period": 1,
+    "billing_type": "month",
+    "id": 10,
+    "initial_price": {"GBP": "0.00", "USD": "0.00"},
+    "name": "Plan 10",
+    "recurring_price": {"GBP": "5.00", "USD": "6.00"},
+    "trial_days": 0,
+}
+
+
+class TestPlanSync(TestCase):
+    def _sync(self, **changes):
+        data = deepcopy(PLAN_DATA)
+        data.update(changes)
+        return Plan.sync_from_paddle_data(data)
+
+    def _prices(self, plan):
+        return {(price.currency, price.recurring): price.quantity for price in plan.prices.all()}
+
+    def test_create(self):
+        plan = self._sync()
+        self.assertEqual(plan.name, "Plan 10")
+        self.assertEqual(
+            self._prices(plan),
+            {("GBP", False): 0.0, ("USD", False): 0.0, ("GBP", True): 5.0, ("USD", True): 6.0},
+        )
+
+    def test_unchanged_plan_writes_nothing(self):
+        self._sync()
+        with CaptureQueriesContext(connection) as context:
+            self._sync()
+        statements = [query["sql"].split()[0].upper() for query in context.captured_queries]
+        self.assertEqual(statements.count("SELECT"), 2)
+        self.assertFalse({"INSERT", "UPDATE", "DELETE"} & set(statements))
+
+    def test_changed_prices(self):
+        plan = self._sync()
+        unchanged = Price.objects.get(plan=plan, currency="GBP", recurring=True)
+        changed = Price.objects.get(plan=plan, currency="USD", recurring=True)
+
+        self._sync(recurring_price={"GBP": "5.00", "USD": "7.00", "EUR": "6.50"}, initial_price={"GBP": "0.00"})
+
+        self.assertEqual(
+            self._prices(plan),
+            {("GBP", False): 0.0, ("GBP", True): 5.0, ("USD", True): 7.0, ("EUR", True): 6.5},
+        )
+        self.assertEqual(Price.objects.get(pk=unchanged.pk).updated_at, unchanged.updated_at)
+        self.assertGreater(Price.objects.get(pk=changed.pk).updated_at, changed.updated_at)
+
+    def test_changed_plan_attributes(self):
+        self._sync()
+        plan = self._sync(name="Plan 10 renamed", trial_days="7")
+        plan = Plan.objects.get(pk=plan.pk)
+        self.assertEqual(plan.name, "Plan 10 renamed")
+        self.assertEqual(plan.trial_days, 7)
@@ -0,0 +1,349 @@
+import asyncio
+import functools
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.exceptions import ImproperlyConfigured
+from django.dispatch import Signal
+from django.test import TestCase
+from django.utils import timezone
+
+from djpaddle import signals
+from djpaddle.checks import check_receiver_names
+from djpaddle.models import WebhookDeadLetter, WebhookEvent, WebhookReceiverResult
+from djpaddle.receivers import (
+    ReceiverOutcome,
+    ReceiverPool,
+    ReceiverTimeout,
+    get_receiver_pool,
+    receiver_name,
+    retry_delay,
+)
+
+
+class TestReceiverPool(TestCase):
+    def setUp(self):
+        self.signal = Signal()
+        self.received = []
+
+    def connect(self, receiver):
+        self.signal.connect(receiver, weak=False)
+
+    def succeeding(self, sender, **kwargs):
+        self.received.append(("succeeding", kwargs["payload"]))
+
+    def failing(self, sender, **kwargs):
+        raise ValueError("receiver failed")
+
+    def test_failures_are_isolated(self):
+        self.connect(self.failing)
+        self.connect(self.succeeding)
+        for pool in (ReceiverPool(max_workers=0), ReceiverPool(max_workers=2)):
+            self.received = []
+            outcomes = pool.send(self.signal, sender=None, payload="payload")
+            self.assertEqual(
+                [outcome.receiver for outcome in outcomes],
+                [
+                    receiver_name(self.failing),
+                    receiver_name(self.succeeding),
+                ],
+            )
+            self.assertIsInstance(outcomes[0].error, ValueError)
+            self.assertIsNone(outcomes[1].error)
+            self.assertEqual(self.received, [("succeeding", "payload")])
+            pool.shutdown()
+
+    def test_receivers_get_their_own_payload(self):
+        def mutating(sender, **kwargs):
+            kwargs["payload"]["status"] = "deleted"
+
+        def reading(sender, **kwargs):
+            self.received.append(dict(kwargs["payload"]))
+
+        self.connect(mutating)
+        self.connect(reading)
+        payload = {"status": "active"}
+        for pool in (ReceiverPool(max_workers=0), ReceiverPool(max_workers=2)):
+            self.received = []
+            outcomes = pool.send(self.signal, sender=None, payload=payload)
+            self.assertEqual([outcome.error for outcome in outcomes], [None, None])
+            self.assertEqual(self.received, [{"status": "active"}])
+            pool.shutdown()
+        self.assertEqual(payload, {"status": "active"})
+
+    def test_receivers_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def first(sender, **kwargs):
+            barrier.wait()
+
+        def second(sender, **kwargs):
+            barrier.wait()
+
+        self.connect(first)
+        self.connect(second)
+        pool = ReceiverPool(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        outcomes = pool.send(self.signal, sender=None)
+        self.assertEqual([outcome.error for outcome in outcomes], [None, None])
+
+    def test_slow_receiver_times_out(self):
+        release = threading.Event()
+
+        def slow(sender, **kwargs):
+            release.wait(5)
+
+        self.connect(slow)
+        self.connect(self.succeeding)
+        pool = ReceiverPool(max_workers=2, timeout=0.05)
+        self.addCleanup(pool.shutdown)
+        self.addCleanup(release.set)
+        slow_outcome, outcome = pool.send(self.signal, sender=None, payload="payload")
+        self.assertIsInstance(slow_outcome.error, ReceiverTimeout)
+        self.assertIsNone(outcome.error)
+
+    def test_timeout_is_shared_by_all_receivers(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        for uid in ("first", "second", "third"):
+            self.signal.connect(lambda sender, **kwargs: release.wait(5), dispatch_uid=uid, weak=False)
+        pool = ReceiverPool(max_workers=3, timeout=0.1)
+        self.addCleanup(pool.shutdown)
+        started = time.monotonic()
+        outcomes = pool.send(self.signal, sender=None)
+        # waiting for each receiver in turn would take up to three timeouts
+        self.assertLess(time.monotonic() - started, 0.25)
+        for outcome in outcomes:
+            self.assertIsInstance(outcome.error, ReceiverTimeout)
+
+    def test_skipped_receivers_are_not_run(self):
+        self.connect(self.succeeding)
+        outcomes = ReceiverPool(max_workers=0).send(
+            self.signal, sender=None, skip={receiver_name(self.succeeding)}, payload="payload"
+        )
+        self.assertEqual(outcomes, [])
+        self.assertEqual(self.received, [])
+
+    def test_colliding_receiver_names_are_rejected(self):
+        class Crm:
+            def on_event(self, sender, **kwargs):
+                pass
+
+        first, second = Crm(), Crm()
+        self.connect(first.on_event)
+        self.connect(second.on_event)
+        with self.assertRaises(ImproperlyConfigured):
+            ReceiverPool(max_workers=0).send(self.signal, sender=None)
+
+    def test_colliding_receiver_names_are_reported_on_startup(self):
+        class Crm:
+            def on_event(self, sender, **kwargs):
+                pass
+
+        self.assertEqual(check_receiver_names(), [])
+        first, second = Crm(), Crm()
+        signals.payment_succeeded.connect(first.on_event)
+        signals.payment_succeeded.connect(second.on_event)
+        self.addCleanup(signals.payment_succeeded.disconnect, first.on_event)
+        self.addCleanup(signals.payment_succeeded.disconnect, second.on_event)
+        self.assertEqual([error.id for error in check_receiver_names()], ["djpaddle.E001"])
+        self.assertIn("djpaddle.signals.payment_succeeded", check_receiver_names()[0].msg)
+
+    def test_dispatch_uid_names_receivers(self):
+        self.signal.connect(functools.partial(self.succeeding), dispatch_uid="first", weak=False)
+        self.signal.connect(functools.partial(self.succeeding), dispatch_uid="second", weak=False)
+        outcomes = ReceiverPool(max_workers=0).send(self.signal, sender=None, skip={"first"}, payload="payload")
+        self.assertEqual(outcomes, [ReceiverOutcome("second", None)])
+        self.assertEqual(self.received, [("succeeding", "payload")])
+
+    def test_coroutine_receivers_are_awaited(self):
+        async def async_receiver(sender, **kwargs):
+            self.received.append(("async", kwargs["payload"]))
+
+        self.connect(async_receiver)
+        outcomes = ReceiverPool(max_workers=0).send(self.signal, sender=None, payload="payload")
+        self.assertIsNone(outcomes[0].error)
+        self.assertEqual(self.received, [("async", "payload")])
+
+    def test_coroutine_receivers_are_awaited_on_the_event_loop(self):
+        loops = []
+
+        async def async_receiver(sender, **kwargs):
+            loops.append(asyncio.get_running_loop())
+
+        async def slow(sender, **kwargs):
+            await asyncio.sleep(5)
+
+        self.connect(self.succeeding)
+        self.connect(async_receiver)
+        self.connect(slow)
+
+        async def send(pool):
+            outcomes = await pool.asend(self.signal, sender=None, payload="payload")
+            return outcomes, asyncio.get_running_loop()
+
+        pool = ReceiverPool(max_workers=2, timeout=0.05)
+        self.addCleanup(pool.shutdown)
+        with mock.patch("djpaddle.settings.DJPADDLE_ASYNC_DB_THREADS", 0):
+            outcomes, loop = async_to_sync(send)(pool)
+        self.assertEqual(
+            [outcome.receiver for outcome in outcomes],
+            [receiver_name(self.succeeding), receiver_name(async_receiver), receiver_name(slow)],
+        )
+        self.assertEqual([outcome.error for outcome in outcomes[:2]], [None, None])
+        self.assertIsInstance(outcomes[2].error, ReceiverTimeout)
+        self.assertEqual(loops, [loop])
+        self.assertEqual(self.received, [("succeeding", "payload")])
+
+    def test_shared_pool_follows_settings(self):
+        with mock.patch("djpaddle.settings.DJPADDLE_RECEIVER_THREADS", 3):
+            pool = get_receiver_pool()
+            self.assertEqual(pool.max_workers, 3)
+            self.assertIs(get_receiver_pool(), pool)
+        self.assertEqual(get_receiver_pool().max_workers, 0)
+
+
+class TestWebhookReceiverResults(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.fail = True
+        signals.payment_refunded.connect(self.succeeding)
+        signals.payment_refunded.connect(self.flaky)
+        self.addCleanup(signals.payment_refunded.disconnect, self.succeeding)
+        self.addCleanup(signals.payment_refunded.disconnect, self.flaky)
+
+    def succeeding(self, sender, payload, **kwargs):
+        self.calls.append("succeeding")
+
+    def flaky(self, sender, payload, **kwargs):
+        self.calls.append("flaky")
+        if self.fail:
+            raise ValueError("flaky failed")
+
+    def test_retry_only_runs_failed_receivers(self):
+        event = WebhookEvent.create_from_payload({"alert_id": "1", "alert_name": "payment_refunded"})
+        self.assertFalse(event.process())
+        self.assertEqual(self.calls, ["succeeding", "flaky"])
+
+        results = {result.receiver: result for result in event.receiver_results.all()}
+        self.assertEqual(results[receiver_name(self.succeeding)].status, WebhookReceiverResult.STATUS_SUCCEEDED)
+        self.assertEqual(results[receiver_name(self.flaky)].status, WebhookReceiverResult.STATUS_FAILED)
+        self.assertEqual(results[receiver_name(self.flaky)].error, "flaky failed")
+
+        self.fail = False
+        self.assertTrue(event.process())
+        self.assertEqual(self.calls, ["succeeding", "flaky", "flaky"])
+        self.assertEqual(event.status, WebhookEvent.STATUS_PROCESSED)
+        self.assertFalse(event.receiver_results.filter(status=WebhookReceiverResult.STATUS_FAILED).exists())
+
+    def test_results_are_written_in_bulk(self):
+        for index in range(3):
+            signals.payment_refunded.connect(
+                functools.partial(self.succeeding), dispatch_uid="succeeding-{0}".format(index), weak=False
+            )
+            self.addCleanup(signals.payment_refunded.disconnect, dispatch_uid="succeeding-{0}".format(index))
+        event = WebhookEvent.create_from_payload({"alert_id": "1", "alert_name": "payment_refunded"})
+        # fetching the results, creating them and marking the event failed
+        with self.assertNumQueries(3):
+            self.assertFalse(event.process())
+        self.assertEqual(event.error, "{0}: flaky failed".format(receiver_name(self.flaky)))
+
+        self.fail = False
+        # fetching the results, updating the retried one and marking the event processed
+        with self.assertNumQueries(3):
+            self.assertTrue(event.process())
+        self.assertEqual(event.receiver_results.filter(status=WebhookReceiverResult.STATUS_SUCCEEDED).count(), 5)
+
+
+class TestReceiverRetries(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.fail = True
+        signals.payment_refunded.connect(self.succeeding)
+        signals.payment_refunded.connect(self.flaky)
+        self.addCleanup(signals.payment_refunded.disconnect, self.succeeding)
+        self.addCleanup(signals.payment_refunded.disconnect, self.flaky)
+        self.event = WebhookEvent.create_from_payload({"alert_id": "1", "alert_name": "payment_refunded"})
+
+    def succeeding(self, sender, payload, **kwargs):
+        self.calls.append("succeeding")
+
+    def flaky(self, sender, payload, **kwargs):
+        self.calls.append("flaky")
+        if self.fail:
+            raise ValueError("flaky failed")
+
+    def flaky_result(self):
+        return WebhookReceiverResult.objects.get(receiver=receiver_name(self.flaky))
+
+    def make_due(self):
+        WebhookReceiverResult.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    @mock.patch("djpaddle.settings.DJPADDLE_RECEIVER_RETRY_DELAY", 10)
+    @mock.patch("djpaddle.settings.DJPADDLE_RECEIVER_RETRY_MAX_DELAY", 100)
+    def test_retry_delay(self):
+        self.assertTrue(5 <= retry_delay(1) <= 10)
+        self.assertTrue(10 <= retry_delay(2) <= 20)
+        self.assertTrue(50 <= retry_delay(10) <= 100)
+
+    def test_failed_receiver_is_retried_when_due(self):
+        self.assertFalse(self.event.process())
+        result = self.flaky_result()
+        self.assertEqual(result.attempts, 1)
+        self.assertGreater(result.next_attempt_at, timezone.now())
+
+        self.assertEqual(WebhookEvent.retry_failed(), 0)
+
+        self.make_due()
+        self.fail = False
+        self.assertEqual(WebhookEvent.retry_failed(), 1)
+        self.assertEqual(self.calls, ["succeeding", "flaky", "flaky"])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.status, WebhookEvent.STATUS_PROCESSED)
+        result = self.flaky_result()
+        self.assertEqual((result.status, result.attempts, result.next_attempt_at), ("succeeded", 2, None))
+
+    @mock.patch("djpaddle.settings.DJPADDLE_RECEIVER_MAX_ATTEMPTS", 2)
+    def test_exhausted_receiver_is_dead_lettered(self):
+        self.assertFalse(self.event.process())
+        self.make_due()
+        WebhookEvent.retry_failed()
+
+        result = self.flaky_result()
+        self.assertEqual(result.status, WebhookReceiverResult.STATUS_DEAD)
+        letter = WebhookDeadLetter.objects.get()
+        self.assertEqual((letter.event, letter.receiver, letter.attempts), (self.event, result.receiver, 2))
+        self.assertEqual(letter.error, "flaky failed")
+
+        self.make_due()
+        self.assertEqual(WebhookEvent.retry_failed(), 0)
+
+        self.assertFalse(letter.replay())
+        self.fail = False
+        self.assertTrue(letter.replay())
+        self.assertEqual(self.calls, ["succeeding", "flaky", "flaky", "flaky", "flaky"])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.status, WebhookEvent.STATUS_PROCESSED)
+
+    def test_dead_receiver_is_not_retried_with_other_receivers(self):
+        def other(sender, payload, **kwargs):
+            self.calls.append("other")
+            raise ValueError("other failed")
+
+        signals.payment_refunded.connect(other)
+        self.addCleanup(signals.payment_refunded.disconnect, other)
+
+        self.assertFalse(self.event.process())
+        WebhookReceiverResult.objects.filter(receiver=receiver_name(self.flaky)).update(
+            status=WebhookReceiverResult.STATUS_DEAD, next_attempt_at=None
+        )
+        self.make_due()
+
+        self.calls = []
+        self.assertEqual(WebhookEvent.retry_failed(), 1)
+        self.assertEqual(self.calls, ["other"])
+        self.assertEqual(self.flaky_result().attempts, 1)
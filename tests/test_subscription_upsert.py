@@ -0,0 +1,156 @@
+from copy import deepcopy
+from datetime import timedelta
+from unittest import mock
+
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.utils import timezone
+
+from djpaddle import settings
+from djpaddle.models import Plan, Subscription
+
+from .fixtures.webhooks import FAKE_ALERT_TEST_SUBSCRIPTION_CREATED
+
+
+class TestSubscriptionUpsert(TestCase):
+    def setUp(self):
+        self.plan = Plan.objects.create(pk=1, name="name", billing_type="month", billing_period=1, trial_days=0)
+        self.event_time = timezone.now().replace(microsecond=0)
+
+    def _data(self, pk="1", event_time=None, **kwargs):
+        data = {
+            "id": pk,
+            "subscriber": None,
+            "plan": self.plan,
+            "cancel_url": "https://checkout.paddle.com/subscription/cancel",
+            "checkout_id": "1",
+            "currency": "EUR",
+            "email": "test@example.com",
+            "event_time": event_time or self.event_time,
+            "marketing_consent": "1",
+            "next_bill_date": self.event_time,
+            "passthrough": "",
+            "quantity": "1",
+            "source": "",
+            "status": "active",
+            "unit_price": "0",
+            "update_url": "https://checkout.paddle.com/subscription/update",
+        }
+        data.update(kwargs)
+        return data
+
+    def _assert_upserts(self):
+        self.assertEqual(Subscription.bulk_upsert([self._data()]), 1)
+        subscription = Subscription.objects.get(pk="1")
+        self.assertEqual(subscription.quantity, 1)
+        self.assertTrue(subscription.marketing_consent)
+
+        newer = self.event_time + timedelta(minutes=1)
+        self.assertEqual(Subscription.bulk_upsert([self._data(event_time=newer, quantity="2")]), 1)
+        self.assertEqual(Subscription.objects.get(pk="1").quantity, 2)
+
+        stale = self.event_time - timedelta(minutes=1)
+        self.assertEqual(Subscription.bulk_upsert([self._data(event_time=stale, quantity="3")]), 0)
+        subscription = Subscription.objects.get(pk="1")
+        self.assertEqual(subscription.quantity, 2)
+        self.assertEqual(subscription.event_time, newer)
+
+    def test_upsert(self):
+        self._assert_upserts()
+
+    @mock.patch("djpaddle.models._supports_conditional_upsert", return_value=False)
+    def test_upsert_fallback(self, supports_conditional_upsert):
+        self._assert_upserts()
+
+    def test_upsert_uses_a_single_query(self):
+        subscriber = settings.get_subscriber_model().objects.create(username="test", email="test@example.com")
+        with self.assertNumQueries(1):
+            Subscription.bulk_upsert([self._data(subscriber=subscriber)])
+        with self.assertNumQueries(1):
+            Subscription.bulk_upsert(
+                [self._data(subscriber=subscriber, event_time=self.event_time + timedelta(minutes=1))]
+            )
+
+    def test_upsert_without_subscriber_looks_up_current_subscriber(self):
+        # the current subscriber loses its entitlements if the subscription is unlinked
+        with self.assertNumQueries(2):
+            Subscription.bulk_upsert([self._data()])
+
+    def test_partial_data_only_updates_given_fields(self):
+        Subscription.bulk_upsert([self._data()])
+        newer = self.event_time + timedelta(minutes=1)
+        partial = {"id": "1", "event_time": newer, "status": "deleted"}
+        self.assertEqual(Subscription.bulk_upsert([partial]), 1)
+
+        subscription = Subscription.objects.get(pk="1")
+        self.assertEqual(subscription.status, "deleted")
+        self.assertEqual(subscription.email, "test@example.com")
+
+    def test_partial_data_for_missing_subscription_fails(self):
+        with self.assertRaises(IntegrityError):
+            Subscription.bulk_upsert([{"id": "2", "event_time": self.event_time, "status": "deleted"}])
+
+    def test_upsert_keeps_latest_row_per_subscription(self):
+        rows = [
+            self._data(event_time=self.event_time + timedelta(minutes=2), quantity="2"),
+            self._data(quantity="1"),
+            self._data(pk="2"),
+        ]
+        self.assertEqual(Subscription.bulk_upsert(rows), 2)
+        self.assertEqual(Subscription.objects.get(pk="1").quantity, 2)
+        self.assertEqual(Subscription.objects.count(), 2)
+
+    def test_upsert_merges_rows_per_subscription(self):
+        newer = self.event_time + timedelta(minutes=1)
+        rows = [
+            {"id": "1", "event_time": newer, "status": "deleted"},
+            self._data(status="active", quantity="2"),
+        ]
+        self.assertEqual(Subscription.bulk_upsert(rows), 1)
+        subscription = Subscription.objects.get(pk="1")
+        self.assertEqual((subscription.status, subscription.quantity), ("deleted", 2))
+        self.assertEqual(subscription.event_time, newer)
+
+    def test_upsert_is_split_into_batches(self):
+        rows = [self._data(pk=str(pk)) for pk in range(1, 6)]
+        with mock.patch.object(connection.ops, "bulk_batch_size", return_value=2):
+            # looking up the current subscribers and three upserts
+            with self.assertNumQueries(4):
+                count, created = Subscription._bulk_upsert(rows, return_created=True)
+        self.assertEqual(count, 5)
+        self.assertEqual(len(created), 5)
+        self.assertEqual(Subscription.objects.count(), 5)
+
+    def test_create_or_update_by_payload_returns_created_subscription(self):
+        payload = deepcopy(FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        subscription = Subscription.create_or_update_by_payload(deepcopy(payload))
+        self.assertEqual(subscription, Subscription.objects.get(pk="1"))
+
+        payload["event_time"] = "2020-01-14 19:19:18"
+        payload["quantity"] = 2
+        self.assertIsNone(Subscription.create_or_update_by_payload(payload))
+        self.assertEqual(Subscription.objects.get(pk="1").quantity, 2)
+
+    def test_created_subscription_is_returned_by_the_upsert(self):
+        subscriber = settings.get_subscriber_model().objects.create(username="test", email="test@example.com")
+        with self.assertNumQueries(1):
+            created = Subscription._bulk_upsert([self._data(subscriber=subscriber)], return_created=True)[1]
+        self.assertEqual(created, [Subscription.objects.get(pk="1")])
+        self.assertEqual(created[0].created_at, Subscription.objects.get(pk="1").created_at)
+
+        newer = self.event_time + timedelta(minutes=1)
+        with self.assertNumQueries(1):
+            result = Subscription._bulk_upsert(
+                [self._data(subscriber=subscriber, event_time=newer)], return_created=True
+            )
+        self.assertEqual(result, (1, []))
+
+    @mock.patch("djpaddle.models._supports_returning", return_value=False)
+    def test_created_subscription_is_returned_without_returning(self, supports_returning):
+        subscriber = settings.get_subscriber_model().objects.create(username="test", email="test@example.com")
+        rows = [self._data(subscriber=subscriber), self._data(pk="2", subscriber=subscriber)]
+        Subscription.bulk_upsert(rows[1:])
+        with self.assertNumQueries(2):
+            count, created = Subscription._bulk_upsert(rows, return_created=True)
+        self.assertEqual(count, 1)
+        self.assertEqual(created, [Subscription.objects.get(pk="1")])
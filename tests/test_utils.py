@@ -1,5 +1,130 @@
-from djpaddle.utils import is_valid_webhook
+import collections
+import random
+import threading
+from urllib.parse import urlencode
+
+import phpserialize
+import pytest
+from django.core.exceptions import TooManyFieldsSent
+from django.test import override_settings
+
+from djpaddle.utils import (
+    WebhookVerifier,
+    decode_webhook_fields,
+    get_webhook_verifier,
+    is_valid_webhook,
+    parse_webhook_body,
+    php_serialize_strings,
+)
+
+from . import settings
+from .utils import generate_private_key, sign_payload
+
+PAYLOAD = {
+    "alert_id": "1",
+    "alert_name": "subscription_created",
+    "email": "test@example.com",
+    "quantity": 1,
+    "passthrough": '{"user_id": "1"}',
+}
+
+
+def _signed_payload(key=None):
+    payload = dict(PAYLOAD)
+    payload["p_signature"] = sign_payload(key or settings.DJPADDLE_KEY, payload)
+    return payload
 
 
 def test_is_valid_webhook_missing_signature():
     assert not is_valid_webhook({})
+
+
+def test_is_valid_webhook():
+    assert is_valid_webhook(_signed_payload())
+
+
+def test_is_valid_webhook_tampered_payload():
+    payload = _signed_payload()
+    payload["quantity"] = 2
+    assert not is_valid_webhook(payload)
+
+
+def test_is_valid_webhook_foreign_key():
+    assert not is_valid_webhook(_signed_payload(generate_private_key()))
+
+
+def test_is_valid_webhook_malformed_signature():
+    payload = _signed_payload()
+    payload["p_signature"] = "invalid-signature"
+    assert not is_valid_webhook(payload)
+    payload["p_signature"] = "abc"
+    assert not is_valid_webhook(payload)
+
+
+def test_verifier_is_shared():
+    assert get_webhook_verifier() is get_webhook_verifier()
+
+
+def test_verifier_is_thread_safe():
+    verifier = WebhookVerifier(settings.DJPADDLE_KEY.publickey())
+    valid, invalid = _signed_payload(), dict(_signed_payload(), quantity=2)
+    results = []
+
+    def verify():
+        for __ in range(20):
+            results.append((verifier.verify(valid), verifier.verify(invalid)))
+
+    threads = [threading.Thread(target=verify) for __ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [(True, False)] * 80
+
+
+def _random_string(rng):
+    alphabet = 'abcXYZ019 _-:;"{}\\\n\tüß€😀'
+    return "".join(rng.choice(alphabet) for __ in range(rng.randint(0, 20)))
+
+
+def test_php_serialize_strings_matches_phpserialize():
+    rng = random.Random(4)
+    for __ in range(500):
+        data = {_random_string(rng): _random_string(rng) for __ in range(rng.randint(0, 10))}
+        items = sorted(data.items())
+        expected = phpserialize.dumps(collections.OrderedDict(items))
+        assert php_serialize_strings(items) == expected
+        encoded = [(key.encode("utf-8"), value.encode("utf-8")) for key, value in items]
+        assert php_serialize_strings(encoded) == expected
+
+
+def test_serialize_matches_phpserialize():
+    payload = dict(PAYLOAD, p_signature="signature")
+    expected = {key: str(value) for key, value in PAYLOAD.items()}
+    expected = phpserialize.dumps(collections.OrderedDict(sorted(expected.items())))
+    assert WebhookVerifier.serialize(payload) == expected
+
+
+def test_parse_webhook_body():
+    fields = parse_webhook_body(b"a=1&b=x+y&b=%C3%BC&c=")
+    assert fields == {b"a": b"1", b"b": "ü".encode("utf-8"), b"c": b""}
+    assert decode_webhook_fields(fields) == {"a": "1", "b": "ü", "c": ""}
+
+
+def test_parse_webhook_body_limits_fields():
+    with override_settings(DATA_UPLOAD_MAX_NUMBER_FIELDS=2):
+        assert parse_webhook_body(b"a=1&b=2") == {b"a": b"1", b"b": b"2"}
+        with pytest.raises(TooManyFieldsSent):
+            parse_webhook_body(b"a=1&b=2&c=3")
+    with override_settings(DATA_UPLOAD_MAX_NUMBER_FIELDS=None):
+        assert len(parse_webhook_body(b"&".join(b"f%d=1" % i for i in range(2000)))) == 2000
+
+
+def test_is_valid_webhook_raw_body():
+    payload = _signed_payload()
+    fields = parse_webhook_body(urlencode(payload).encode("utf-8"))
+    assert is_valid_webhook(fields)
+
+    fields[b"quantity"] = b"2"
+    assert not is_valid_webhook(fields)
@@ -0,0 +1,213 @@
+from copy import deepcopy
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from djpaddle import signals
+from djpaddle.models import Plan, Subscription, WebhookEvent
+from djpaddle.receivers import receiver_name
+from djpaddle.views import PaddleWebhookView
+
+from .fixtures.webhooks import FAKE_ALERT_TEST_SUBSCRIPTION_CREATED
+
+
+class TestWebhookQueue(TestCase):
+    def setUp(self):
+        Plan.objects.create(
+            pk=FAKE_ALERT_TEST_SUBSCRIPTION_CREATED["subscription_plan_id"],
+            name="monthly-subscription",
+            billing_type="month",
+            billing_period=1,
+            trial_days=0,
+        )
+
+    def _send_alert(self, data):
+        return Client().post(reverse("djpaddle:webhook"), data)
+
+    @mock.patch("djpaddle.settings.DJPADDLE_WEBHOOK_QUEUE", True)
+    @mock.patch("djpaddle.views.is_valid_webhook", return_value=True)
+    def test_webhook_is_stored_in_inbox(self, is_valid_webhook):
+        alert = deepcopy(FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        resp = self._send_alert(alert)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Subscription.objects.count(), 0)
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, WebhookEvent.STATUS_PENDING)
+        self.assertEqual(event.alert_name, alert["alert_name"])
+        self.assertEqual(event.alert_id, str(alert["alert_id"]))
+        self.assertEqual(event.payload["email"], alert["email"])
+
+        received = []
+
+        def receiver(sender, payload, **kwargs):
+            received.append(sender)
+
+        signals.subscription_created.connect(receiver, sender=PaddleWebhookView)
+        self.addCleanup(signals.subscription_created.disconnect, receiver, sender=PaddleWebhookView)
+
+        self.assertEqual(WebhookEvent.process_pending(), 1)
+        self.assertEqual(received, [PaddleWebhookView])
+        event.refresh_from_db()
+        self.assertEqual(event.status, WebhookEvent.STATUS_PROCESSED)
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(Subscription.objects.count(), 1)
+        self.assertEqual(WebhookEvent.process_pending(), 0)
+
+    @mock.patch("djpaddle.settings.DJPADDLE_WEBHOOK_QUEUE", True)
+    @mock.patch("djpaddle.views.is_valid_webhook", return_value=True)
+    def test_unsupported_webhook_is_not_stored(self, is_valid_webhook):
+        alert = deepcopy(FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        alert["alert_name"] = "not_and_valid_hook"
+        resp = self._send_alert(alert)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 0)
+
+    def test_failing_receiver_marks_event_failed(self):
+        def failing_receiver(sender, payload, **kwargs):
+            raise ValueError("receiver failed")
+
+        signals.payment_refunded.connect(failing_receiver)
+        self.addCleanup(signals.payment_refunded.disconnect, failing_receiver)
+
+        event = WebhookEvent.create_from_payload({"alert_id": "1", "alert_name": "payment_refunded"})
+        self.assertFalse(event.process())
+        event.refresh_from_db()
+        self.assertEqual(event.status, WebhookEvent.STATUS_FAILED)
+        self.assertEqual(event.error, "{0}: receiver failed".format(receiver_name(failing_receiver)))
+        self.assertEqual(str(event), "payment_refunded:1")
+
+
+class TestWebhookDeduplication(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.received = []
+        signals.payment_refunded.connect(self.receiver)
+        self.addCleanup(signals.payment_refunded.disconnect, self.receiver)
+
+    def receiver(self, sender, payload, **kwargs):
+        self.received.append(payload["alert_id"])
+        if payload.get("fail"):
+            raise ValueError("receiver failed")
+
+    def _send_alert(self, data):
+        return Client().post(reverse("djpaddle:webhook"), data)
+
+    @mock.patch("djpaddle.views.is_valid_webhook", return_value=True)
+    def test_redelivered_webhook_is_skipped(self, is_valid_webhook):
+        alert = {"alert_id": "10", "alert_name": "payment_refunded"}
+        self.assertEqual(self._send_alert(alert).status_code, 200)
+        self.assertEqual(self._send_alert(alert).status_code, 200)
+        self.assertEqual(self.received, ["10"])
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.STATUS_PROCESSED)
+
+    @mock.patch("djpaddle.views.is_valid_webhook", return_value=True)
+    def test_failed_webhook_is_processed_again(self, is_valid_webhook):
+        alert = {"alert_id": "11", "alert_name": "payment_refunded", "fail": "1"}
+        self.assertEqual(self._send_alert(alert).status_code, 500)
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.STATUS_FAILED)
+
+        self.assertEqual(self._send_alert(alert).status_code, 500)
+        self.assertEqual(self.received, ["11", "11"])
+
+    @mock.patch("djpaddle.views.is_valid_webhook", return_value=True)
+    def test_webhook_in_progress_is_not_acknowledged(self, is_valid_webhook):
+        alert = {"alert_id": "14", "alert_name": "payment_refunded"}
+        WebhookEvent.create_from_payload(alert, status=WebhookEvent.STATUS_PROCESSING)
+        self.assertEqual(self._send_alert(alert).status_code, 409)
+        self.assertEqual(self.received, [])
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.STATUS_PROCESSING)
+
+    @mock.patch("djpaddle.views.is_valid_webhook", return_value=True)
+    def test_unfinished_webhook_is_processed_again(self, is_valid_webhook):
+        # e.g. left behind by a crashed request
+        alert = {"alert_id": "13", "alert_name": "payment_refunded"}
+        WebhookEvent.create_from_payload(alert, status=WebhookEvent.STATUS_PROCESSING)
+        self.assertEqual(self._send_alert(alert).status_code, 409)
+        self.assertEqual(self.received, [])
+
+        WebhookEvent.objects.update(locked_at=timezone.now() - timedelta(seconds=301))
+        self.assertEqual(self._send_alert(alert).status_code, 200)
+        self.assertEqual(self.received, ["13"])
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.STATUS_PROCESSED)
+
+    @mock.patch("djpaddle.settings.DJPADDLE_WEBHOOK_QUEUE", True)
+    def test_redelivered_webhook_is_not_queued_twice(self):
+        alert = {"alert_id": "12", "alert_name": "payment_refunded"}
+        self.assertIsNotNone(WebhookEvent.receive(alert))
+        self.assertIsNone(WebhookEvent.receive(alert))
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    @mock.patch("djpaddle.settings.DJPADDLE_WEBHOOK_DEDUP_CACHE", "default")
+    def test_cache_detects_redelivery_without_queries(self):
+        alert = {"alert_id": "13", "alert_name": "payment_refunded"}
+        event = WebhookEvent.receive(alert, status=WebhookEvent.STATUS_PROCESSING)
+        self.assertTrue(event.process())
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(WebhookEvent.receive(alert))
+
+
+class TestCoalescedSubscriptionEvents(TestCase):
+    def setUp(self):
+        Plan.objects.create(
+            pk=FAKE_ALERT_TEST_SUBSCRIPTION_CREATED["subscription_plan_id"],
+            name="monthly-subscription",
+            billing_type="month",
+            billing_period=1,
+            trial_days=0,
+        )
+
+    def _create_event(self, alert_id, subscription_id, event_time, alert_name="subscription_created", **payload):
+        if alert_name == "subscription_created":
+            data = deepcopy(FAKE_ALERT_TEST_SUBSCRIPTION_CREATED)
+        else:
+            data = {"subscription_plan_id": FAKE_ALERT_TEST_SUBSCRIPTION_CREATED["subscription_plan_id"]}
+        data.update(
+            alert_id=alert_id, alert_name=alert_name, subscription_id=subscription_id, event_time=event_time, **payload
+        )
+        return WebhookEvent.create_from_payload(data)
+
+    def test_subscription_events_are_written_once_per_subscription(self):
+        self._create_event(1, 1, "2020-01-13 19:19:18")
+        self._create_event(2, 2, "2020-01-13 19:19:18")
+        self._create_event(
+            3, 1, "2020-01-13 19:19:20", alert_name="subscription_updated", new_status="past_due", old_status="active"
+        )
+        self._create_event(4, 1, "2020-01-13 19:19:19", alert_name="subscription_payment_succeeded", quantity=3)
+
+        received = []
+
+        def receiver(sender, payload, **kwargs):
+            received.append(payload["alert_id"])
+
+        signals.subscription_updated.connect(receiver)
+        self.addCleanup(signals.subscription_updated.disconnect, receiver)
+
+        with mock.patch.object(Subscription, "bulk_upsert", wraps=Subscription.bulk_upsert) as bulk_upsert:
+            self.assertEqual(WebhookEvent.process_pending(coalesce=True), 4)
+
+        bulk_upsert.assert_called_once()
+        self.assertEqual(len(bulk_upsert.call_args[0][0]), 2)
+        self.assertEqual(received, [3])
+
+        subscription = Subscription.objects.get(pk=1)
+        self.assertEqual(subscription.status, "past_due")
+        self.assertEqual(subscription.quantity, 3)
+        self.assertEqual(Subscription.objects.filter(pk=2).count(), 1)
+        statuses = WebhookEvent.objects.values_list("status", flat=True)
+        self.assertEqual(set(statuses), {WebhookEvent.STATUS_PROCESSED})
+
+    def test_failing_coalesced_write_falls_back_to_single_events(self):
+        self._create_event(1, 1, "2020-01-13 19:19:18")
+        self._create_event(2, 1, "2020-01-13 19:19:19", alert_name="subscription_updated", new_status="past_due")
+
+        with mock.patch.object(Subscription, "bulk_upsert", side_effect=[ValueError("failed"), 1, 1]):
+            self.assertEqual(WebhookEvent.process_pending(coalesce=True), 2)
+
+        statuses = WebhookEvent.objects.values_list("status", flat=True)
+        self.assertEqual(set(statuses), {WebhookEvent.STATUS_PROCESSED})
@@ -6,16 +6,19 @@ from urllib.parse import parse_qs, urlencode
 from uuid import uuid4
 
 import pytest
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from djpaddle import signals
 from djpaddle.models import Plan, Subscription
 from djpaddle.utils import PADDLE_DATE_FORMAT, PADDLE_DATETIME_FORMAT
 
+from . import settings
 from .fixtures.webhooks import (
     FAKE_ALERT_TEST_SUBSCRIPTION_CREATED,
     FAKE_GET_PLAN_RESPONSE,
 )
+from .utils import sign_payload
 
 
 class TestWebhook(TestCase):
@@ -222,3 +225,33 @@ class TestWebhook(TestCase):
         self._send_alert_urlencoded(updated_payload)
         subscription = Subscription.objects.get(pk=subscription_id)
         self.assertEqual(subscription.status, "active")
+
+    def test_webhook_signed_raw_body(self):
+        received = []
+
+        def receiver(sender, payload, **kwargs):
+            received.append(payload)
+
+        signals.payment_refunded.connect(receiver)
+        self.addCleanup(signals.payment_refunded.disconnect, receiver)
+
+        payload = {"alert_id": "1", "alert_name": "payment_refunded", "email": "ü@example.com"}
+        payload["p_signature"] = sign_payload(settings.DJPADDLE_KEY, payload)
+        resp = self._send_alert_urlencoded(urlencode(payload))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(received, [payload])
+
+        payload["alert_id"] = "2"
+        resp = self._send_alert_urlencoded(urlencode(payload))
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(len(received), 1)
+
+    @override_settings(DATA_UPLOAD_MAX_NUMBER_FIELDS=2)
+    def test_webhook_with_too_many_fields(self):
+        resp = self._send_alert_urlencoded(urlencode({"a": "1", "b": "2", "c": "3"}))
+        self.assertEqual(resp.status_code, 400)
+
+    def test_webhook_signed_multipart(self):
+        payload = {"alert_id": "1", "alert_name": "payment_refunded"}
+        payload["p_signature"] = sign_payload(settings.DJPADDLE_KEY, payload)
+        self.assertEqual(self._send_alert(payload).status_code, 200)
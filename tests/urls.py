@@ -13,4 +13,5 @@ urlpatterns = [
     path("home/", empty_view, name="home"),
     path("admin/", admin.site.urls),
     path("djpaddle/", include(("djpaddle.urls", "djpaddle"), namespace="djpaddle")),
+    path("djpaddle-async/", include(("djpaddle.async_urls", "djpaddle"), namespace="djpaddle_async")),
 ]
@@ -1,3 +1,4 @@
+import base64
 import os
 
 from Crypto.PublicKey import RSA
@@ -18,3 +19,14 @@ def export_pubkey_as_pem(key):
     used by paddle and intended to be set as `settings.DJPADDLE_PUBLIC_KEY`
     """
     return key.publickey().exportKey("PEM").decode("utf-8")
+
+
+def sign_payload(key, payload):
+    """
+    signs a webhook payload the way paddle does and returns the base64 encoded
+    signature, which is intended to be sent as `p_signature`
+    """
+    from djpaddle.utils import SHA1, PKCS1_v1_5, WebhookVerifier
+
+    digest = SHA1.new(WebhookVerifier.serialize(payload))
+    return base64.b64encode(PKCS1_v1_5.new(key).sign(digest)).decode("utf-8")